@@ -1,49 +1,64 @@
+import time
+STARTED = time.monotonic()  # For the startup profile
+
 from button import Button
 from led import LED
 from wifi_config.network_manager import NetworkManager
-from wifi_config.web_server import run_server, stop_server, server_running, switch_to_ap_mode, switch_to_normal_mode, reset_wifi_state
-import threading
-import time
+from wifi_config.state_watcher import StateWatcher
+from wifi_config.watchdog import ConnectivityWatchdog, make_probe
+from wifi_config.connectivity import connectivity, AP, CONNECTING, CONNECTED, FAILED
+from wifi_config.link_quality import sampler
+from wifi_config import systemd
 from logger import logger
-import configparser
-import os
+from config import config
+import threading
+import signal
 import sys
 
+# Note: wifi_config.web_server (Flask, Socket.IO, assets) is only imported once
+# the portal is needed (see load_web_server), so a device that boots connected
+# never pays for it and importing this module has no side effects.
+
 
 # ------------------------------------------- #
 # ************* Load Configuration ********** #
 # ------------------------------------------- #
 
-# Load configuration from config.ini
-config = configparser.ConfigParser()
-config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
-
-# Read config if exists, otherwise use defaults
-if os.path.exists(config_path):
-    config.read(config_path)
-    AP_SELF_IP = config.get('access_point', 'ap_ip', fallback='10.10.1.1')
-    AP_SSID = config.get('access_point', 'ap_ssid', fallback='RPI_NET_SETUP')
-    WIFI_RESET_PIN = config.getint('hardware', 'button_gpio_pin', fallback=23)
-    LED_PIN = config.getint('hardware', 'led_gpio_pin', fallback=24)
-    PORT = config.getint('server', 'port', fallback=4000)
+AP_SELF_IP = config.ap_ip
+AP_SSID = config.ap_ssid
+WIFI_RESET_PIN = config.button_pin
+LED_PIN = config.led_pin
+GPIO_BACKEND = config.gpio_backend
+PORT = config.port
+SERVER_ALWAYS_ON = config.server_always_on
+SERVER_STOP_GRACE = config.server_stop_grace
+SERVER_ON_REQUEST = config.server_on_request
+
+if config.found:
     logger.info(f"[app.py][Config] Loaded from config.ini: SSID={AP_SSID}, Button={WIFI_RESET_PIN}, LED={LED_PIN}, PORT={PORT}")
 else:
-    # Fallback to defaults if config.ini doesn't exist
-    AP_SELF_IP = "10.10.1.1"
-    AP_SSID = "RPI_NET_SETUP"
-    WIFI_RESET_PIN = 23
-    LED_PIN = 24
-    PORT = 4000
     logger.warning("[app.py][Config] config.ini not found, using defaults")
 
 
+NetworkManager.snapshot_ttl = config.snapshot_ttl
+NetworkManager.ap_ip = AP_SELF_IP
+NetworkManager.station_interface = config.station_interface
+# Without concurrent mode the hotspot shares (and gives up) the station interface
+NetworkManager.ap_interface = config.ap_interface if config.concurrent_ap else config.station_interface
+
+
 # ------------------------------------------- #
 # ************* Global Variables ************ #
 # ------------------------------------------- #
 
-# * Note: From webserver and DNSServer 
-server_thread = None
-server_running = False
+button: Button = None
+status_led: LED = None
+
+startup_profile = []  # (stage, sec since STARTED)
+
+
+def mark(stage):
+    startup_profile.append((stage, time.monotonic() - STARTED))
 
 
 # ------------------------------------------- #
@@ -51,125 +66,241 @@ server_running = False
 # ------------------------------------------- #
 
 def on_short_press():
-    logger.info("[app.py][Event] Short Press detected... Do nothing!")
+    if not SERVER_ON_REQUEST or SERVER_ALWAYS_ON or connectivity.in_portal():
+        logger.info("[app.py][Event] Short Press detected... Do nothing!")
+        return
+
+    logger.info("[app.py][Event] Short Press detected! Serving the web page on request...")
+    web_server = load_web_server()
+    if web_server.start_server():
+        web_server.stop_server(delay=SERVER_ON_REQUEST)
+        logger.info(f"[app.py][Result] Web page at http://{NetworkManager.get_current_ip()}:{PORT} for {SERVER_ON_REQUEST:.0f} sec")
 
 
 def on_long_press():
-    global server_thread, server_running
+    network_jobs = load_web_server().network_jobs
+
     logger.info("")  # For a new line
     logger.info("[app.py][Event] Long Press detected!")
 
     logger.info("[app.py][Action] Setting up Access Point ...")
-    
+
     # Set LED to fast blink for AP mode
     status_led.set_state(LED.FAST_BLINK)
-    
-    NetworkManager.setup_ap()
-    reset_wifi_state()  # Reset the WiFi state
-    switch_to_ap_mode()
 
-    logger.info(f"[app.py][Result] AP mode activated. Connect to the Wi-Fi and navigate to http://{AP_SELF_IP}:{PORT}")
+    # Queued behind any connect/scan in flight so they never fight over the radio
+    try:
+        result = network_jobs.call('setup_ap', NetworkManager.setup_ap)
+    except Exception as e:  # JobRejected (queue full, cancelled) or nmcli blew up
+        logger.error(f"[app.py][Error] AP setup did not run: {e}")
+        show_state(connectivity.snapshot())
+        return
+    if not result:
+        logger.error(f"[app.py][Result] AP mode could not be activated: {result.reason}")
+        show_state(connectivity.snapshot())  # Back to what the LED said before
+        return
+
+    connectivity.set(AP)  # Portal, captive DNS and scans follow from here
+
+    logger.info(f"[app.py][Result] AP mode activated in {result.elapsed:.1f} sec. Connect to the Wi-Fi and navigate to http://{AP_SELF_IP}:{PORT}")
 
 
-# ------------------------------------------ #
-# ******** Create a Button instance ******** #
 # ------------------------------------------ #
 
-button = Button(pin=WIFI_RESET_PIN, debounce_time=0.02, long_press_time=4)
-# Note: Default Values in the class 
-# GPIO pin is 23 
-# Debounce time is 10 ms (0.01)
-# Long press threshold time period is 5 sec
+def on_mode_change(mode, previous_mode):
+    """Fed by the StateWatcher whenever the network mode changes"""
+    connectivity.observe(mode)
 
-button.on_short_press = on_short_press
-button.on_long_press = on_long_press
 
-# ------------------------------------------ #
-# -------- Process status signal LED ------- #
-# ------------------------------------------ #
-status_led = LED(pin=LED_PIN, max_brightness=0.3)  # 30% brightness
-from wifi_config.web_server import init_app
-init_app(status_led)
+def load_web_server():
+    from wifi_config import web_server
+    return web_server
 
-# ------------------------------------------ # 
 
-def main():
-    global server_thread, server_running
-    
-    # Start the web server in daemon thread (exits when main thread exits)
-    server_thread = threading.Thread(target=run_server, daemon=True)
-    server_thread.start()
-    server_running = True
-    
-    # Initialize last known state
-    last_known_ip = NetworkManager.get_current_ip()
-    
-    # Determine initial mode based on connection state
-    if NetworkManager.is_in_ap_mode():
-        last_known_mode = "ap"
+def manage_server(event):
+    """Connectivity listener: the web server only runs while the portal is needed"""
+    if SERVER_ALWAYS_ON or connectivity.in_portal():
+        load_web_server().start_server()
+        return
+    web_server = sys.modules.get("wifi_config.web_server")
+    if web_server is not None and web_server.is_serving():
+        # After a connect the phone still needs a moment to get the result
+        web_server.stop_server(delay=SERVER_STOP_GRACE if event['previous'] is not None else 0)
+
+
+def run_network_job(kind, func):
+    """For the watchdog: queued behind the portal's jobs while it's loaded, so it never races a connect"""
+    web_server = sys.modules.get("wifi_config.web_server")
+    if web_server is None:
+        return func()
+    return web_server.network_jobs.call(kind, func)
+
+
+def portal_in_use():
+    """For the watchdog: someone has the portal page open"""
+    web_server = sys.modules.get("wifi_config.web_server")
+    return web_server is not None and web_server.has_clients()
+
+
+def server_healthy():
+    web_server = sys.modules.get("wifi_config.web_server")
+    return web_server is None or web_server.server_healthy()
+
+
+def show_state(event):
+    """Connectivity listener: the LED tells what the Pi is doing"""
+    state, previous = event['state'], event['previous']
+    if status_led is None:
+        return  # Hardware not set up yet, main() catches up
+
+    if state == AP:
+        # Case 1: AP mode active (also when booting into it)
+        if previous is not None:
+            logger.info("[app.py][Action] Switched to AP mode.")
         status_led.set_state(LED.FAST_BLINK)
-    elif NetworkManager.is_connected_to_wifi():
-        last_known_mode = "connected"
-        status_led.set_state(LED.OFF)
+
+    elif state == CONNECTING:
+        status_led.set_state(LED.SLOW_BREATH)
+
+    elif state == CONNECTED:
+        # Case 2: Connected to WiFi
+        if previous is None:
+            status_led.set_state(LED.OFF)
+            return
+        logger.info("[app.py][Action] Connected to Wi-Fi. Switched to normal mode.")
+        status_led.set_state(LED.SOLID)
+        # Don't hold up the other listeners just for the LED
+        threading.Timer(2, lambda: connectivity.state == CONNECTED and status_led.set_state(LED.OFF)).start()
+
+    elif state == FAILED:
+        status_led.set_state(LED.FAST_BLINK)  # Still serving the portal, try again
+
     else:
-        last_known_mode = "disconnected"
+        # Case 3: Not in AP mode and not connected = disconnected/searching
+        if previous is not None:
+            logger.info("[app.py][Action] WiFi disconnected or not found.")
         status_led.set_state(LED.SLOW_BREATH)  # Breathing for disconnected state
-    
+
+
+def create_watchdog():
+    if not config.watchdog_enabled:
+        return None
     try:
-        while True:
-            time.sleep(1)
-            current_ip = NetworkManager.get_current_ip()
-            
-            if NetworkManager.is_in_ap_mode():
-                # Case 1: AP mode active
-                if last_known_mode != "ap":
-                    logger.info("[app.py][Action] Switched to AP mode.")
-                    switch_to_ap_mode()
-                    status_led.set_state(LED.FAST_BLINK)
-                    last_known_mode = "ap"
-                    
-            elif NetworkManager.is_connected_to_wifi():
-                # Case 2: Connected to WiFi
-                if last_known_mode != "connected":
-                    logger.info("[app.py][Action] Connected to Wi-Fi. Switching to normal mode...")
-                    switch_to_normal_mode()
-                    status_led.set_state(LED.SOLID)
-                    time.sleep(2)
-                    status_led.set_state(LED.OFF)
-                    last_known_mode = "connected"
-                    
-            else:
-                # Case 3: Not in AP mode and not connected = disconnected/searching
-                if last_known_mode != "disconnected":
-                    logger.info("[app.py][Action] WiFi disconnected or not found.")
-                    status_led.set_state(LED.SLOW_BREATH)  # Breathing for disconnected state
-                    last_known_mode = "disconnected"
-            
-            last_known_ip = current_ip
-    except KeyboardInterrupt:
-        logger.info("[app.py][Result] Shutting down gracefully...")
-        status_led.cleanup()
-        sys.exit(0)
-                
+        probe = make_probe(config.watchdog_probe, config.station_interface, config.watchdog_probe_timeout)
+    except ValueError as e:
+        logger.error(f"[app.py][Config] {e}, probing the gateway instead")
+        probe = make_probe("gateway", config.station_interface, config.watchdog_probe_timeout)
+    return ConnectivityWatchdog(
+        probe,
+        interval=config.watchdog_interval,
+        failures=config.watchdog_failures,
+        backoff_min=config.watchdog_backoff_min,
+        backoff_max=config.watchdog_backoff_max,
+        ap_after=config.watchdog_ap_after,
+        rescan_interval=config.watchdog_rescan_interval,
+        run_job=run_network_job,
+        portal_busy=portal_in_use,
+    )
+
+
+connectivity.add_listener(show_state)
+connectivity.add_listener(manage_server)
+state_watcher = StateWatcher(on_change=on_mode_change)
+watchdog = create_watchdog()
+
+
+# ------------------------------------------ #
+# ***************** Startup **************** #
 # ------------------------------------------ #
 
+def setup_hardware():
+    global button, status_led
 
-logger.info("-----------------------")
-logger.info("SERIAL MON SYS VIEW | LOG")
-logger.info("-----------------------")
-logger.info("Artist: Saurabh Datta")
-logger.info("Loc: Berlin, Germany")
-logger.info("Date: Jan, 2025")
-logger.info("-----------------------")
+    # -------- Process status signal LED ------- #
+    status_led = LED(pin=LED_PIN, max_brightness=0.3, backend=GPIO_BACKEND)  # 30% brightness
 
+    # ******** Create a Button instance ******** #
+    button = Button(pin=WIFI_RESET_PIN, debounce_time=0.02, long_press_time=4, backend=GPIO_BACKEND)
+    # Note: Default Values in the class
+    # GPIO pin is 23
+    # Debounce time is 10 ms (0.01)
+    # Long press threshold time period is 5 sec
 
-# If wifi connected print IP address. if not type a message below
-logger.info(f"[app.py][Status] Current IP: {NetworkManager.get_current_ip()}")
-if NetworkManager.get_current_ip() == AP_SELF_IP:
-    logger.info(f"[app.py][Status] Connect to wifi access point: {AP_SSID} and go to: http://serialmonitor.local:{PORT} or http://serialmonitor.lan:{PORT} to provide 2.5GHz Wifi credentials")
-else:
-    logger.info("[app.py][Status] To configure wifi, Long Press the Wifi Reset Button for more than 5 sec")
-    
+    button.on_short_press = on_short_press
+    button.on_long_press = on_long_press
+
+
+def log_banner():
+    logger.info("-----------------------")
+    logger.info("SERIAL MON SYS VIEW | LOG")
+    logger.info("-----------------------")
+    logger.info("Artist: Saurabh Datta")
+    logger.info("Loc: Berlin, Germany")
+    logger.info("Date: Jan, 2025")
+    logger.info("-----------------------")
+
+    # If wifi connected print IP address. if not type a message below
+    network_state = NetworkManager.snapshot()
+    logger.info(f"[app.py][Status] Current IP: {network_state.ip}")
+    if network_state.mode == "ap":
+        logger.info(f"[app.py][Status] Connect to wifi access point: {AP_SSID} and go to: http://serialmonitor.local:{PORT} or http://serialmonitor.lan:{PORT} to provide 2.5GHz Wifi credentials")
+    else:
+        logger.info("[app.py][Status] To configure wifi, Long Press the Wifi Reset Button for more than 5 sec")
+
+
+def main():
+    mark("config")
+    # systemctl stop sends SIGTERM: unwind through the same shutdown as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    setup_hardware()
+    show_state(connectivity.snapshot())  # Whatever was reported before the LED existed
+    mark("hardware")
+
+    if SERVER_ALWAYS_ON:
+        # Binding is synchronous: once this returns the port accepts connections
+        if load_web_server().start_server():
+            mark("listening")
+        else:
+            logger.error(f"[app.py][Error] Web server is not accepting connections on port {PORT}")
+
+    # Otherwise the server comes up with the portal (first state the watcher
+    # reports, or a long press), nothing to wait for here
+    systemd.notify("READY=1", f"STATUS=Portal on port {PORT} {'always on' if SERVER_ALWAYS_ON else 'on demand'}")
+    systemd.start_watchdog(healthy=lambda: server_healthy() and state_watcher.is_alive()
+                           and (watchdog is None or watchdog.is_alive()))
+
+    log_banner()
+
+    # Mode transitions are now pushed by the watcher (nmcli monitor),
+    # polling is only used if the event stream isn't available
+    state_watcher.start()
+    if watchdog:
+        watchdog.start()
+    if config.link_quality_enabled:
+        sampler.start()
+    mark("watching")
+
+    logger.info("[app.py][Startup] " + " | ".join(f"{stage} {sec:.2f}s" for stage, sec in startup_profile))
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Ctrl+C, or SIGTERM from systemd (raised as SystemExit by the handler above)
+        logger.info("[app.py][Result] Shutting down gracefully...")
+        systemd.notify("STOPPING=1")
+        state_watcher.stop()
+        if watchdog:
+            watchdog.stop()
+        if config.link_quality_enabled:
+            sampler.stop()  # Flushes the history file
+        status_led.cleanup()
+        logger.shutdown()  # Writes out what is still buffered for the SD card
+    sys.exit(0)
+
+# ------------------------------------------ #
 
 
 if __name__ == "__main__":
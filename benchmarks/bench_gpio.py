@@ -0,0 +1,102 @@
+"""
+Cost of each GPIO backend in gpio.py: import time and resident memory of a
+fresh interpreter that loads it, and whether it can open the pins here.
+
+    python benchmarks/bench_gpio.py [-b BUTTON_PIN] [-l LED_PIN] [-r REPEAT]
+
+Import times are the best of REPEAT runs, on top of gpio.py itself. On a
+machine without GPIO the hardware backends show why they can't open the
+pins; their import cost is still measured as long as their modules are
+installed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Backend -> modules its pins import when opened
+MODULES = {
+    "gpiod": ["gpiod", "gpiod.line"],
+    "chardev": ["fcntl"],
+    "pwm": [],
+    "rpigpio": ["RPi.GPIO"],
+    "sysfs": [],
+    "blinka": ["board", "digitalio"],
+    "simulated": [],
+}
+
+CHILD = """
+import importlib, json, time
+start = time.perf_counter()
+import gpio
+gpio_ms = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+try:
+    for module in {modules!r}:
+        importlib.import_module(module)
+    error = None
+except ImportError as e:
+    error = f"not installed ({{e.name}})"
+import_ms = (time.perf_counter() - start) * 1000
+
+status = []
+if error is None:
+    for kind, pin in (("input", {button}), ("output", {led})):
+        cls = gpio.BACKENDS[{name!r}][kind == "output"]
+        if cls is None:
+            continue
+        try:
+            cls(pin)
+            status.append(f"{{kind}} ok")
+        except Exception as e:
+            status.append(f"{{kind}}: {{e}}")
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+print(json.dumps({{"gpio_ms": gpio_ms, "import_ms": import_ms, "rss_kb": rss, "status": error or "; ".join(status)}}))
+"""
+
+BASELINE = """
+import json
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+print(json.dumps({"import_ms": 0.0, "rss_kb": rss, "status": "bare interpreter"}))
+"""
+
+
+def run_child(code):
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"import_ms": float("nan"), "rss_kb": 0, "status": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(name, button, led, repeat):
+    code = CHILD.format(modules=MODULES[name], name=name, button=button, led=led)
+    runs = [run_child(code) for _ in range(repeat)]
+    best = min(runs, key=lambda run: run["import_ms"])
+    return dict(best, rss_kb=max(run["rss_kb"] for run in runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-b", "--button", type=int, default=23, help="button GPIO")
+    parser.add_argument("-l", "--led", type=int, default=24, help="LED GPIO")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per backend")
+    args = parser.parse_args()
+
+    rows = {name: measure(name, args.button, args.led, args.repeat) for name in MODULES}
+    gpio_ms = min(row.get("gpio_ms", float("nan")) for row in rows.values())
+
+    print(f"{'backend':10} {'import ms':>10} {'rss KB':>8}  status")
+    row = run_child(BASELINE)
+    print(f"{'(python)':10} {'':>10} {row['rss_kb']:8d}  {row['status']}")
+    print(f"{'(gpio.py)':10} {gpio_ms:10.2f} {'':>8}  shared by all, mostly logger.py")
+    for name, row in rows.items():
+        print(f"{name:10} {row['import_ms']:10.2f} {row['rss_kb']:8d}  {row['status']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Idle footprint once the Pi is connected: resident memory and thread count
+with the web server always on (the old behaviour) vs. started on demand.
+
+    python benchmarks/bench_idle.py [-s SETTLE]
+
+Each variant runs in a fresh interpreter that imports app.py, reports
+"connected" to the state machine and sits idle for SETTLE seconds.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, threading, time
+from config import config
+config.port = {port}
+config.server_always_on = {always_on}
+import app
+from wifi_config.connectivity import connectivity
+if app.SERVER_ALWAYS_ON:
+    app.load_web_server().start_server()
+connectivity.observe("connected")
+time.sleep({settle})
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+print(json.dumps({{"rss_kb": rss, "threads": threading.active_count(),
+                   "web_server": "wifi_config.web_server" in sys.modules}}))
+"""
+
+VARIANTS = {"always on (before)": True, "on demand (after)": False}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(always_on, settle):
+    code = CHILD.format(port=free_port(), always_on=always_on, settle=settle)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-s", "--settle", type=float, default=1.0, help="seconds to idle before measuring")
+    args = parser.parse_args()
+
+    print(f"{'connected, web server':24} {'rss KB':>8} {'threads':>8}  flask loaded")
+    for name, always_on in VARIANTS.items():
+        row = measure(always_on, args.settle)
+        print(f"{name:24} {row['rss_kb']:8d} {row['threads']:8d}  {'yes' if row['web_server'] else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
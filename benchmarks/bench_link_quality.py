@@ -0,0 +1,68 @@
+"""
+Cost of the link-quality sampler: one sample (procfs, sysfs and the
+bitrate ioctl) and history() over a full day of samples, in memory and
+mmap'ed.
+
+    python benchmarks/bench_link_quality.py [-i INTERFACE] [-n SAMPLES]
+
+Without a wireless interface the /proc/net/wireless lookup comes back
+empty and a sample is skipped, so pick one that exists (e.g. -i wlan0).
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from wifi_config import link_quality  # noqa: E402
+
+
+def fill(ring, count, interval=10):
+    start = time.time() - count * interval
+    for i in range(count):
+        ring.append(start + i * interval, link_quality.SAMPLE, 0, -60 + i % 7, -95, 45, 72000,
+                    i, 0, i * 30, 0, i * 50, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-i", "--interface", default="wlan0", help="interface to sample")
+    parser.add_argument("-n", "--samples", type=int, default=8640, help="ring size (8640 = 24 h at 10 sec)")
+    args = parser.parse_args()
+
+    sampler = link_quality.LinkSampler(args.interface, capacity=args.samples)
+    sampler.ring = link_quality.RingBuffer(link_quality.RECORD, args.samples)
+    sampler._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    rounds = 1000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        taken = sampler.sample()
+    per_sample = (time.perf_counter() - start) / rounds
+    print(f"sample()             {per_sample * 1e6:8.1f} us  ({'recorded' if taken else 'no wireless stats on ' + args.interface})")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, path in (("memory", None), ("mmap", os.path.join(directory, "ring.bin"))):
+            ring = link_quality.RingBuffer(link_quality.RECORD, args.samples, path)
+            start = time.perf_counter()
+            fill(ring, args.samples)
+            per_append = (time.perf_counter() - start) / args.samples
+
+            sampler.ring = ring
+            start = time.perf_counter()
+            history = sampler.history(seconds=24 * 3600, points=144)
+            elapsed = time.perf_counter() - start
+            print(f"append() {name:7}     {per_append * 1e6:8.1f} us")
+            print(f"history() {name:7}    {elapsed * 1e3:8.1f} ms  ({len(history['points'])} points from {len(ring)} samples)")
+            ring.close()
+
+    size = link_quality.HEADER_SIZE + link_quality.RECORD.size * args.samples
+    print(f"history file         {size / 1024:8.1f} KB  (fixed, {link_quality.RECORD.size} bytes per sample)")
+
+
+if __name__ == "__main__":
+    main()
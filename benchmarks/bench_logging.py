@@ -0,0 +1,79 @@
+"""
+How long does a logger.info() call block its caller when the SD card is slow?
+
+Compares a plain synchronous handler with logger.py's queue + writer thread,
+both writing through a handler that takes `--write-ms` per record.
+
+    python benchmarks/bench_logging.py [-n RECORDS] [--write-ms MS]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from logger import BoundedQueueHandler, _ListenerWithDropReport  # noqa: E402
+
+
+class SlowHandler(logging.Handler):
+    """Stands in for a console + SD card write that takes `delay` seconds"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.written = 0
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.delay)
+        self.written += 1
+
+
+def measure(name, handler, records):
+    log = logging.getLogger(f"bench.{name}")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+
+    latencies = []
+    for i in range(records):
+        start = time.perf_counter()
+        log.info(f"[bench][Status] record {i}")
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "mean_us": sum(latencies) / len(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+        "max_us": latencies[-1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--records", type=int, default=200)
+    parser.add_argument("--write-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    delay = args.write_ms / 1000
+
+    results = {"synchronous": measure("sync", SlowHandler(delay), args.records)}
+
+    slow = SlowHandler(delay)
+    queue_handler = BoundedQueueHandler(maxsize=1000)
+    listener = _ListenerWithDropReport(queue_handler, slow)
+    listener.start()
+    results["queued"] = measure("queued", queue_handler, args.records)
+    flush_start = time.perf_counter()
+    listener.stop()
+    flush = time.perf_counter() - flush_start
+
+    print(f"{args.records} records, {args.write_ms} ms per write\n")
+    print(f"{'mode':<12} {'mean us':>10} {'p99 us':>10} {'max us':>10}")
+    for name, result in results.items():
+        print(f"{name:<12} {result['mean_us']:>10.1f} {result['p99_us']:>10.1f} {result['max_us']:>10.1f}")
+    print(f"\nqueued: writer thread drained {slow.written} records, shutdown flush took {flush:.2f} sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Micro-benchmark: in-process address lookup (wifi_config/netif.py) vs the
+old `ip | grep` / `hostname -I | awk` shell pipelines.
+
+    python benchmarks/bench_netif.py [ifname] [-n ITERATIONS]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from wifi_config import netif  # noqa: E402
+
+
+def subprocess_ipv4(ifname):
+    cmd = rf"ip -4 addr show {ifname} | grep -oP '(?<=inet\s)\d+(\.\d+){{3}}'"
+    ip = subprocess.run(cmd, shell=True, capture_output=True, text=True).stdout.strip()
+    if not ip:
+        ip = subprocess.run("hostname -I | awk '{print $1}'", shell=True, capture_output=True, text=True).stdout.strip()
+    return ip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("ifname", nargs="?", default="wlan0")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"netif.get_ipv4({args.ifname!r})  -> {netif.get_ipv4(args.ifname)!r}")
+    print(f"subprocess pipeline       -> {subprocess_ipv4(args.ifname)!r}")
+    print()
+
+    results = {
+        "netif (in-process)": timeit.timeit(lambda: netif.get_ipv4(args.ifname) or netif.first_ipv4(), number=args.iterations),
+        "subprocess (shell)": timeit.timeit(lambda: subprocess_ipv4(args.ifname), number=args.iterations),
+    }
+    for name, total in results.items():
+        print(f"{name:<20} {total / args.iterations * 1e6:10.1f} us/call  ({args.iterations} calls)")
+
+    speedup = results["subprocess (shell)"] / results["netif (in-process)"]
+    print(f"\nin-process lookup is {speedup:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
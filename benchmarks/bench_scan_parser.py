@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: the streaming terse scan parser (NetworkManager.parse_scan)
+vs the old SSID,SECURITY rsplit parser, on a generated dense-venue scan.
+
+    python benchmarks/bench_scan_parser.py [-b BSSIDS] [-n ITERATIONS]
+"""
+import argparse
+import io
+import os
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, os.path.join(BENCH_DIR, 'fakebin'))
+
+from run import dense_venue  # noqa: E402
+from _fake_nm import _escape  # noqa: E402
+from wifi_config.network_manager import SCAN_FIELDS, parse_scan  # noqa: E402
+
+
+def old_parse(stdout):
+    """scan_wifi before the rewrite, minus the subprocess"""
+    networks = []
+    seen_ssids = set()
+    for line in stdout.strip().split('\n'):
+        parts = line.rsplit(':', 1)
+        if len(parts) == 2:
+            ssid = parts[0].strip().replace('\\:', ':')
+            security = parts[1].strip() or "Open"
+            if ssid and ssid not in seen_ssids:
+                seen_ssids.add(ssid)
+                networks.append({"ssid": ssid, "security": security})
+    networks.sort(key=lambda x: x["ssid"].lower())
+    return networks
+
+
+def terse(networks, fields):
+    return "\n".join(":".join(_escape(n.get(field, "")) for field in fields) for n in networks) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-b", "--bssids", type=int, default=3000)
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    venue = dense_venue(bssids=args.bssids)
+    old_output = terse(venue, ("SSID", "SECURITY"))
+    new_output = terse(venue, SCAN_FIELDS)
+
+    old_networks = old_parse(old_output)
+    new_networks = parse_scan(io.StringIO(new_output))
+    print(f"{args.bssids} BSSIDs -> old parser: {len(old_networks)} networks, new parser: {len(new_networks)} networks")
+    best = new_networks[0]
+    print(f"strongest: {best['ssid']!r} {best['signal']}% on {', '.join(best['bands'])} ({best['bssids']} BSSIDs)\n")
+
+    results = {
+        "old (SSID,SECURITY)": timeit.timeit(lambda: old_parse(old_output), number=args.iterations),
+        "new (7 fields, stream)": timeit.timeit(lambda: parse_scan(io.StringIO(new_output)), number=args.iterations),
+    }
+    for name, total in results.items():
+        per_call = total / args.iterations
+        print(f"{name:<24} {per_call * 1e3:8.2f} ms/scan  {per_call / args.bssids * 1e6:6.2f} us/line")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Import-time profile of the service's entry points (python -X importtime),
+to catch heavy imports creeping back into the cold-start path.
+
+    python benchmarks/bench_startup.py [-t TOP]
+
+The live startup timeline (hardware, listening with always_on, watching)
+is logged by app.py itself as its "[app.py][Startup]" line. The web server
+is only imported once the portal is needed.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["app", "wifi_config.web_server"]
+
+
+def import_times(module):
+    """[(self_us, cumulative_us, name)] for everything importing `module` pulls in"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-t", "--top", type=int, default=8, help="heaviest imports to list per module")
+    args = parser.parse_args()
+
+    for module in MODULES:
+        rows = import_times(module)
+        total = next((cumulative for _, cumulative, name in rows if name == module), 0)
+        print(f"import {module}: {total / 1000:.1f} ms, {len(rows)} modules")
+        for self_us, cumulative_us, name in sorted(rows, key=lambda row: -row[1])[1:args.top + 1]:
+            print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Shared implementation of the fake `nmcli`, `ip` and `hostname` executables.
+
+Everything is driven by environment variables set by benchmarks/run.py:
+
+    FAKE_NM_SCENARIO  JSON file: networks, latencies, failure modes, recordings
+    FAKE_NM_STATE     JSON file with the mutable device state (mode, connection, ip, profiles);
+                      a profile is a name, or {"name", "uuid", "ssid", "ifname", "key_mgmt"}
+                      when they differ from name, uuid-<name>, name, wlan0 and open.
+                      Once the hotspot is bound to another interface (`con modify hotspot
+                      connection.interface-name uap0`) it runs there, as "ap_ip", next
+                      to the station on wlan0
+    FAKE_NM_LOG       every invocation is appended here, one line each
+
+Scenario keys (all optional):
+
+    networks    [{"SSID", "SECURITY", "SIGNAL", "CHAN", "FREQ", "BSSID", "RATE"}, ...]
+    latency     {"scan": sec, "con_up": sec, "con_down": sec, "hotspot_up": sec, "default": sec}
+    failures    {"con_up": "wrong_password" | "ssid_not_found" | "timeout",
+                 "hotspot_up": "fail" | "no_ip"}
+    recorded    {"<argv joined by spaces>": {"stdout", "stderr", "returncode", "latency"}}
+    station_ip  IP handed out on a successful station connect
+    ap_ip       IP bound while the hotspot is up
+
+Like the real one, `nmcli con show` rejects setting fields (802-11-wireless.ssid)
+when listing; they are only shown per profile (`con show uuid A uuid B`).
+"""
+import json
+import os
+import sys
+import time
+
+HOTSPOT = "hotspot"
+STATION = "wlan0"
+
+STATE_NAMES = {
+    "connected": "100 (connected)",
+    "ap": "100 (connected)",
+    "disconnected": "30 (disconnected)",
+}
+
+
+def _load(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _save_state(state):
+    path = os.environ["FAKE_NM_STATE"]
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace(":", "\\:")
+
+
+def _option(args, name):
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return None
+
+
+def _profile(entry):
+    if isinstance(entry, str):
+        entry = {"name": entry}
+    name = entry["name"]
+    return {"name": name, "uuid": entry.get("uuid", f"uuid-{name}"), "ssid": entry.get("ssid", name),
+            "ifname": entry.get("ifname", STATION), "key_mgmt": entry.get("key_mgmt", "")}
+
+
+def _positional(args):
+    """Drop global options (and their values) so `--wait 10 con up X` reads as `con up X`"""
+    words = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ("-f", "--fields", "--wait", "-w", "--rescan", "--escape", "-e"):
+            skip = True
+        elif not arg.startswith("-"):
+            words.append(arg)
+    return words
+
+
+class Fake:
+    def __init__(self):
+        self.scenario = _load(os.environ.get("FAKE_NM_SCENARIO", ""), {})
+        self.state = _load(os.environ.get("FAKE_NM_STATE", ""), {})
+        self.state.setdefault("mode", "disconnected")
+        self.state.setdefault("connection", None)
+        self.state.setdefault("ip", "")
+        self.state.setdefault("profiles", [HOTSPOT])
+        self.state.setdefault("hotspot_ifname", STATION)
+        self.state.setdefault("ap_ip", None)  # Hotspot on its own interface: its IP once up
+
+    @property
+    def concurrent(self):
+        return self.state["hotspot_ifname"] != STATION
+
+    def sleep(self, key):
+        latency = self.scenario.get("latency", {})
+        time.sleep(latency.get(key, latency.get("default", 0)))
+
+    def failure(self, key):
+        return self.scenario.get("failures", {}).get(key)
+
+    # ------------------------------------------- #
+    # ****************** nmcli ****************** #
+    # ------------------------------------------- #
+
+    def nmcli(self, args):
+        wait = _option(args, "--wait")
+        fields = (_option(args, "-f") or "").split(",")
+        words = _positional(args)
+
+        if words[:2] == ["dev", "show"] or words[:2] == ["device", "show"]:
+            return self.dev_show(fields, words[2] if len(words) > 2 else None)
+        if words[:3] == ["dev", "wifi", "list"]:
+            if _option(args, "--rescan") == "yes":
+                self.sleep("scan")
+            return self.wifi_list(fields)
+        if words[:2] == ["con", "show"]:
+            if len(words) > 2:
+                return self.con_details(fields, words[2:])
+            return self.con_show(fields, "--active" in args)
+        if words[:2] == ["con", "add"]:
+            name = _option(args, "con-name")
+            profile = _profile({"name": name, "ssid": _option(args, "ssid") or name,
+                                "uuid": f"uuid-{name}-{len(self.state['profiles'])}",
+                                "ifname": _option(args, "ifname") or "",
+                                "key_mgmt": _option(args, "wifi-sec.key-mgmt") or ""})
+            self.state["profiles"].append(profile)
+            _save_state(self.state)
+            return 0, f"Connection '{name}' ({profile['uuid']}) successfully added.\n", ""
+        if words[:2] == ["con", "modify"]:
+            profile = self.find_profile(words[2:4])
+            if profile is None:
+                return 10, "", f"Error: unknown connection '{words[2]}'.\n"
+            ifname = _option(args, "connection.interface-name")
+            if profile["name"] == HOTSPOT and ifname:
+                self.state["hotspot_ifname"] = ifname
+            if _option(args, "wifi-sec.key-mgmt") is not None:
+                profile["key_mgmt"] = _option(args, "wifi-sec.key-mgmt")
+            if "remove" in words and "802-11-wireless-security" in words:
+                profile["key_mgmt"] = ""
+            self.state["profiles"] = [profile if _profile(p)["uuid"] == profile["uuid"] else p
+                                      for p in self.state["profiles"]]
+            _save_state(self.state)
+            return 0, "", ""
+        if words[:2] == ["con", "delete"]:
+            targets = words[2:]
+            while targets:
+                profile = self.find_profile(targets[:2])
+                targets = targets[2:] if targets[0] in ("uuid", "id") else targets[1:]
+                if profile is not None:
+                    self.state["profiles"] = [p for p in self.state["profiles"] if _profile(p)["uuid"] != profile["uuid"]]
+            _save_state(self.state)
+            return 0, "", ""
+        if words[:2] == ["con", "up"]:
+            profile = self.find_profile(words[2:4])
+            ifname = _option(args, "ifname")
+            if words[2] == HOTSPOT and ifname and ifname != self.state["hotspot_ifname"]:
+                return 10, "", (f"Error: Connection activation failed: Connection '{HOTSPOT}' "
+                                f"is not available on device {ifname} at this time.\n")
+            return self.con_up(profile["name"] if profile else words[2], int(wait or 90), profile)
+        if words[:2] == ["con", "down"]:
+            return self.con_down(words[2])
+        if words[:1] == ["monitor"]:
+            # Nothing ever changes on its own in a replay, just stay quiet
+            while True:
+                time.sleep(3600)
+        return 2, "", f"Error: fake nmcli does not know '{' '.join(args)}'\n"
+
+    def dev_show(self, fields, ifname=None):
+        devices = {STATION: (self.state["mode"], self.state["connection"], self.state["ip"])}
+        if self.concurrent:
+            ap_ip = self.state["ap_ip"]
+            devices[self.state["hotspot_ifname"]] = ("ap", HOTSPOT, ap_ip) if ap_ip is not None else ("disconnected", None, "")
+        if ifname is not None:
+            if ifname not in devices:
+                return 10, "", f"Error: Device '{ifname}' not found.\n"
+            devices = {ifname: devices[ifname]}
+
+        blocks = []
+        for device, (mode, connection, ip) in devices.items():
+            values = {
+                "GENERAL.DEVICE": device,
+                "GENERAL.STATE": STATE_NAMES.get(mode, STATE_NAMES["disconnected"]),
+                "GENERAL.CONNECTION": connection or "--",
+            }
+            lines = []
+            for field in fields:
+                if field in values:
+                    lines.append(f"{field}:{values[field]}")
+                elif field == "IP4.ADDRESS" and ip:
+                    lines.append(f"IP4.ADDRESS[1]:{ip}/24")
+            blocks.append("\n".join(lines))
+        return 0, "\n\n".join(blocks) + "\n", ""
+
+    def wifi_list(self, fields):
+        lines = [
+            ":".join(_escape(network.get(field, "")) for field in fields)
+            for network in self.scenario.get("networks", [])
+        ]
+        return 0, "\n".join(lines) + "\n", ""
+
+    def find_profile(self, words):
+        """["uuid", X] / ["id", X] / [X] -> profile dict or None"""
+        if not words:
+            return None
+        key, value = ("uuid", words[1]) if words[0] == "uuid" and len(words) > 1 else \
+            ("name", words[1] if words[0] == "id" and len(words) > 1 else words[0])
+        for entry in self.state["profiles"]:
+            profile = _profile(entry)
+            if profile[key] == value:
+                return profile
+        return None
+
+    def con_show(self, fields, active):
+        invalid = [field for field in fields if "." in field]
+        if invalid:
+            return 2, "", f"Error: invalid field '{invalid[0]}'; allowed fields: NAME,UUID,TYPE,DEVICE\n"
+        profiles = [_profile(entry) for entry in self.state["profiles"]]
+        if active:
+            names = {self.state["connection"], HOTSPOT if self.state["ap_ip"] is not None else None}
+            profiles = [p for p in profiles if p["name"] in names]
+        rows = []
+        for profile in profiles:
+            values = {"NAME": profile["name"], "TYPE": "802-11-wireless", "UUID": profile["uuid"],
+                      "DEVICE": self.state["hotspot_ifname"] if profile["name"] == HOTSPOT else STATION,
+                      "802-11-wireless.ssid": profile["ssid"]}
+            rows.append(":".join(_escape(values.get(field, "")) for field in fields))
+        return 0, "\n".join(rows) + "\n", ""
+
+    def con_details(self, fields, targets):
+        """`con show uuid A id B ...`: the requested settings of each profile, missing ones fail the call"""
+        lines = []
+        returncode, stderr = 0, ""
+        while targets:
+            profile = self.find_profile(targets[:2])
+            name = targets[1] if targets[0] in ("uuid", "id") and len(targets) > 1 else targets[0]
+            targets = targets[2:] if targets[0] in ("uuid", "id") else targets[1:]
+            if profile is None:
+                returncode, stderr = 10, f"Error: {name} - no such connection profile.\n"
+                continue
+            ifname = self.state["hotspot_ifname"] if profile["name"] == HOTSPOT else profile["ifname"]
+            values = {"connection.id": profile["name"], "connection.uuid": profile["uuid"],
+                      "connection.type": "802-11-wireless", "connection.interface-name": ifname,
+                      "802-11-wireless.ssid": profile["ssid"]}
+            if profile["key_mgmt"]:
+                values["802-11-wireless-security.key-mgmt"] = profile["key_mgmt"]
+            lines += [f"{field}:{_escape(values[field])}" for field in fields if field in values]
+        return returncode, "\n".join(lines) + "\n", stderr
+
+    def con_up(self, name, wait, profile=None):
+        if name == HOTSPOT:
+            self.sleep("hotspot_up")
+            failure = self.failure("hotspot_up")
+            if failure == "fail":
+                return 4, "", "Error: Connection activation failed: (1) Unknown reason.\n"
+            ip = "" if failure == "no_ip" else self.scenario.get("ap_ip", "10.10.1.1")
+            if self.concurrent:
+                self.state["ap_ip"] = ip  # The station is left alone
+            else:
+                self.state.update(mode="ap", connection=HOTSPOT, ip=ip)
+            _save_state(self.state)
+            return 0, "Connection successfully activated\n", ""
+
+        if profile is None:
+            return 10, "", f"Error: unknown connection '{name}'.\n"
+
+        failure = self.failure("con_up")
+        ssids = {network.get("SSID") for network in self.scenario.get("networks", [])}
+        ssid = profile["ssid"]
+        if failure == "timeout":
+            time.sleep(wait)
+            return 3, "", f"Error: Timeout expired ({wait} seconds)\n"
+
+        self.sleep("con_up")
+        if failure == "ssid_not_found" or ssid not in ssids:
+            return 10, "", f"Error: Connection activation failed: No network with SSID '{ssid}' found.\n"
+        if failure == "wrong_password":
+            return 4, "", ("Error: Connection activation failed: (7) Secrets were required, but not provided.\n"
+                           "Hint: use 'journalctl -xe NM_CONNECTION=...' to get more details.\n")
+
+        self.state.update(mode="connected", connection=profile["name"], ip=self.scenario.get("station_ip", "192.168.1.23"))
+        _save_state(self.state)
+        return 0, "Connection successfully activated\n", ""
+
+    def con_down(self, name):
+        if name == HOTSPOT and self.concurrent:
+            if self.state["ap_ip"] is None:
+                return 10, "", f"Error: '{name}' is not an active connection.\n"
+            self.sleep("con_down")
+            self.state["ap_ip"] = None
+            _save_state(self.state)
+            return 0, f"Connection '{name}' successfully deactivated\n", ""
+        if self.state["connection"] != name:
+            return 10, "", f"Error: '{name}' is not an active connection.\n"
+        self.sleep("con_down")
+        self.state.update(mode="disconnected", connection=None, ip="")
+        _save_state(self.state)
+        return 0, f"Connection '{name}' successfully deactivated\n", ""
+
+    # ------------------------------------------- #
+    # ************ ip / hostname / iw *********** #
+    # ------------------------------------------- #
+
+    def iw(self, args):
+        # `iw dev wlan0 interface add uap0 type __ap`: nothing to model,
+        # the interface exists as soon as the hotspot is bound to it
+        if args[:1] == ["dev"] and args[2:4] == ["interface", "add"]:
+            return 0, "", ""
+        return 1, "", f"fake iw does not know '{' '.join(args)}'\n"
+
+    def ip(self, args):
+        if self.state["ip"]:
+            return 0, f"3: wlan0: <BROADCAST,MULTICAST,UP,LOWER_UP>\n    inet {self.state['ip']}/24 scope global wlan0\n", ""
+        return 0, "", ""
+
+    def hostname(self, args):
+        return 0, (self.state["ip"] + " \n") if self.state["ip"] else "\n", ""
+
+
+def main(tool):
+    args = sys.argv[1:]
+    log = os.environ.get("FAKE_NM_LOG")
+    if log:
+        with open(log, "a") as f:
+            f.write(f"{tool} {' '.join(args)}\n")
+
+    fake = Fake()
+    recording = fake.scenario.get("recorded", {}).get(f"{tool} {' '.join(args)}")
+    if recording:
+        time.sleep(recording.get("latency", 0))
+        code, out, err = recording.get("returncode", 0), recording.get("stdout", ""), recording.get("stderr", "")
+    else:
+        code, out, err = getattr(fake, tool)(args)
+
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    sys.exit(code)
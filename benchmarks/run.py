@@ -0,0 +1,299 @@
+"""
+Reproducible performance benchmarks against a fake NetworkManager toolchain.
+
+Stub `nmcli`, `ip` and `hostname` executables (benchmarks/fakebin) are put
+first on PATH and replay scripted outputs with configurable latencies and
+failure modes, so scans, connects, AP bring-up, the state monitor and the
+Socket.IO handlers can be measured on any machine.
+
+Every benchmark runs in its own interpreter and reports wall time,
+subprocess count, CPU time (ours + children) and peak RSS.
+
+    python benchmarks/run.py                   # run all, compare with baseline.json
+    python benchmarks/run.py scan_dense        # run some
+    python benchmarks/run.py --save-baseline   # record a new baseline
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+FAKEBIN = os.path.join(BENCH_DIR, "fakebin")
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Allowed drift before a result counts as a regression: relative, absolute
+TOLERANCE = {
+    "wall_s": (0.5, 0.05),
+    "cpu_s": (0.5, 0.05),
+    "subprocesses": (0.0, 0),
+    "peak_rss_kb": (0.2, 2048),
+}
+
+
+# ------------------------------------------- #
+# **************** Scenarios **************** #
+# ------------------------------------------- #
+
+def small_venue():
+    return [
+        {"SSID": "Home", "SECURITY": "WPA2", "SIGNAL": 82, "CHAN": 6, "FREQ": "2437 MHz",
+         "BSSID": "AA:BB:CC:00:00:01", "RATE": "130 Mbit/s"},
+        {"SSID": "Home", "SECURITY": "WPA2", "SIGNAL": 40, "CHAN": 36, "FREQ": "5180 MHz",
+         "BSSID": "AA:BB:CC:00:00:02", "RATE": "540 Mbit/s"},
+        {"SSID": "Cafe: Guest", "SECURITY": "", "SIGNAL": 55, "CHAN": 1, "FREQ": "2412 MHz",
+         "BSSID": "AA:BB:CC:00:00:03", "RATE": "54 Mbit/s"},
+    ] + [
+        {"SSID": f"Neighbour-{i}", "SECURITY": "WPA1 WPA2", "SIGNAL": 20 + i, "CHAN": 11,
+         "FREQ": "2462 MHz", "BSSID": f"AA:BB:CC:00:01:{i:02X}", "RATE": "65 Mbit/s"}
+        for i in range(12)
+    ]
+
+
+def dense_venue(bssids=3000, ssids=800, seed=1):
+    """A conference hall: thousands of BSSIDs, many SSIDs on several APs each"""
+    rng = random.Random(seed)
+    channels = [(1, 2412), (6, 2437), (11, 2462), (36, 5180), (44, 5220), (149, 5745)]
+    networks = []
+    for i in range(bssids):
+        chan, freq = rng.choice(channels)
+        networks.append({
+            "SSID": "Home" if i == 0 else f"Venue-{rng.randrange(ssids)}:{rng.choice(['a', 'b'])}",
+            "SECURITY": rng.choice(["WPA2", "WPA2 WPA3", "", "WPA1 WPA2"]),
+            "SIGNAL": rng.randrange(5, 100),
+            "CHAN": chan,
+            "FREQ": f"{freq} MHz",
+            "BSSID": ":".join(f"{rng.randrange(256):02X}" for _ in range(6)),
+            "RATE": rng.choice(["54 Mbit/s", "130 Mbit/s", "270 Mbit/s"]),
+        })
+    return networks
+
+
+LATENCY = {"scan": 0.5, "con_up": 0.3, "con_down": 0.1, "hotspot_up": 0.3, "default": 0}
+
+CONNECTED = {"mode": "connected", "connection": "Home", "ip": "192.168.1.23", "profiles": ["hotspot", "Home"]}
+AP_MODE = {"mode": "ap", "connection": "hotspot", "ip": "10.10.1.1", "profiles": ["hotspot"]}
+DISCONNECTED = {"mode": "disconnected", "connection": None, "ip": "", "profiles": ["hotspot"]}
+
+
+# ------------------------------------------- #
+# *************** Benchmarks **************** #
+# ------------------------------------------- #
+# Each entry: name -> (scenario, initial state, function run in the child)
+
+def bench_scan():
+    from wifi_config.network_manager import NetworkManager
+    NetworkManager.scan_wifi()
+
+
+def bench_connect():
+    from wifi_config.network_manager import NetworkManager
+    NetworkManager.connect_to_wifi("Home", "password123")
+
+
+def bench_setup_ap():
+    from wifi_config.network_manager import NetworkManager
+    NetworkManager.setup_ap()
+
+
+def bench_monitor():
+    """The state watcher in polling mode (worst case) for 5 seconds"""
+    from wifi_config.state_watcher import StateWatcher, PollingBackend
+    watcher = StateWatcher(on_change=lambda mode, previous: None, backend=PollingBackend(1))
+    watcher.start()
+    time.sleep(5)
+    watcher.stop()
+
+
+def _web_server():
+    from wifi_config import web_server
+    return web_server
+
+
+def bench_socketio_scan():
+    web_server = _web_server()
+    client = web_server.socketio.test_client(web_server.app)
+    client.emit('scan_wifi', {'seq': 0})
+    # The handler answers from the cache at once, wait for the fresh scan's push
+    while not any(p['name'] == 'scan_delta' and not p['args'][0]['refreshing'] for p in client.get_received()):
+        time.sleep(0.01)
+    client.disconnect()
+
+
+def bench_socketio_connect():
+    web_server = _web_server()
+    client = web_server.socketio.test_client(web_server.app)
+    client.emit('connect_wifi', {'ssid': 'Home', 'password': 'password123'})
+    # The handler only queues the job, wait for the worker to report back
+    while not any(p['name'] == 'connection_result' for p in client.get_received()):
+        time.sleep(0.01)
+    client.disconnect()
+
+
+def bench_import_app():
+    import app  # noqa: F401
+
+
+def bench_import_web_server():
+    from wifi_config import web_server  # noqa: F401
+
+
+BENCHMARKS = {
+    "scan_small": ({"networks": small_venue(), "latency": LATENCY}, CONNECTED, bench_scan),
+    "scan_dense": ({"networks": dense_venue(), "latency": LATENCY}, CONNECTED, bench_scan),
+    "connect_ok": ({"networks": small_venue(), "latency": LATENCY}, AP_MODE, bench_connect),
+    "connect_wrong_password": ({"networks": small_venue(), "latency": LATENCY,
+                                "failures": {"con_up": "wrong_password"}}, AP_MODE, bench_connect),
+    "connect_ssid_not_found": ({"networks": [], "latency": LATENCY}, AP_MODE, bench_connect),
+    "setup_ap": ({"latency": LATENCY}, CONNECTED, bench_setup_ap),
+    "setup_ap_already_up": ({"latency": LATENCY}, AP_MODE, bench_setup_ap),
+    "setup_ap_failing": ({"latency": LATENCY, "failures": {"hotspot_up": "fail"}}, DISCONNECTED, bench_setup_ap),
+    "monitor_loop_5s": ({"latency": LATENCY}, CONNECTED, bench_monitor),
+    "socketio_scan": ({"networks": small_venue(), "latency": LATENCY}, AP_MODE, bench_socketio_scan),
+    "socketio_connect": ({"networks": small_venue(), "latency": LATENCY}, AP_MODE, bench_socketio_connect),
+    "import_app": ({}, DISCONNECTED, bench_import_app),
+    "import_web_server": ({}, DISCONNECTED, bench_import_web_server),
+}
+
+
+# ------------------------------------------- #
+# ***************** Runner ****************** #
+# ------------------------------------------- #
+
+def _cpu(usage):
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_child(name):
+    """Runs inside the per-benchmark interpreter, prints one JSON line"""
+    sys.path.insert(0, ROOT_DIR)
+    function = BENCHMARKS[name][2]
+
+    try:
+        import logger  # noqa: F401  (import cost is not what we measure)
+    except ImportError:
+        pass
+
+    # Keep the list of profiles we create out of the source tree
+    from wifi_config.network_manager import NetworkManager
+    NetworkManager.managed_profiles_path = os.path.join(os.path.dirname(os.environ["FAKE_NM_LOG"]), "managed_profiles.json")
+
+    log = os.environ["FAKE_NM_LOG"]
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    try:
+        function()
+    except ImportError as e:
+        print(json.dumps({"skipped": f"missing dependency: {e.name}"}))
+        return
+    wall = time.perf_counter() - start
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    with open(log) as f:
+        calls = [line for line in f if line.strip()]
+
+    print(json.dumps({
+        "wall_s": round(wall, 3),
+        "subprocesses": len(calls),
+        "cpu_s": round(_cpu(self_after) - _cpu(self_before) + _cpu(children), 3),
+        "peak_rss_kb": self_after.ru_maxrss,
+    }))
+
+
+def run(name):
+    scenario, state, _ = BENCHMARKS[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {key: os.path.join(tmp, f"{key}.json") for key in ("scenario", "state")}
+        with open(paths["scenario"], "w") as f:
+            json.dump(scenario, f)
+        with open(paths["state"], "w") as f:
+            json.dump(state, f)
+        log = os.path.join(tmp, "calls.log")
+        open(log, "w").close()
+
+        env = dict(os.environ,
+                   PATH=FAKEBIN + os.pathsep + os.environ.get("PATH", ""),
+                   FAKE_NM_SCENARIO=paths["scenario"],
+                   FAKE_NM_STATE=paths["state"],
+                   FAKE_NM_LOG=log)
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name],
+                                env=env, capture_output=True, text=True)
+
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {"error": (result.stderr.strip().splitlines() or ["no output"])[-1]}
+    return json.loads(lines[-1])
+
+
+def regressions(result, baseline):
+    found = []
+    for key, (relative, absolute) in TOLERANCE.items():
+        if key in result and key in baseline:
+            limit = baseline[key] * (1 + relative) + absolute
+            if result[key] > limit:
+                found.append(f"{key} {result[key]} > {baseline[key]} (limit {limit:.3f})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks against a fake nmcli/ip/hostname toolchain")
+    parser.add_argument("names", nargs="*", help=f"subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--save-baseline", action="store_true", help="write results to baseline.json")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+    if not args.json:
+        print(f"{'benchmark':<24} {'wall s':>8} {'procs':>6} {'cpu s':>7} {'rss KB':>8}")
+    for name in names:
+        result = results[name] = run(name)
+        if args.json:
+            continue
+        if "wall_s" not in result:
+            print(f"{name:<24} {result.get('skipped') or 'ERROR: ' + result.get('error', '')}")
+            failed = failed or "error" in result
+            continue
+        problems = [] if args.save_baseline else regressions(result, baseline.get(name, {}))
+        failed = failed or bool(problems)
+        print(f"{name:<24} {result['wall_s']:>8.3f} {result['subprocesses']:>6} "
+              f"{result['cpu_s']:>7.3f} {result['peak_rss_kb']:>8}"
+              + (f"   REGRESSION: {'; '.join(problems)}" if problems else ""))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        baseline.update({name: result for name, result in results.items() if "wall_s" in result})
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {os.path.relpath(BASELINE)}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import configparser
+import os
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
+
+# attribute -> (section, key, type, default). Every setting lives here once.
+SETTINGS = {
+    # [hardware]
+    "button_pin": ("hardware", "button_gpio_pin", int, 23),
+    "led_pin": ("hardware", "led_gpio_pin", int, 24),
+    "gpio_backend": ("hardware", "gpio_backend", str, "auto"),
+    # [access_point]
+    "ap_ssid": ("access_point", "ap_ssid", str, "RPI_NET_SETUP"),
+    "ap_ip": ("access_point", "ap_ip", str, "10.10.1.1"),
+    "concurrent_ap": ("access_point", "concurrent", bool, False),
+    "ap_interface": ("access_point", "interface", str, "uap0"),
+    "ap_linger": ("access_point", "linger", float, 5.0),
+    # [server]
+    "port": ("server", "port", int, 4000),
+    "server_always_on": ("server", "always_on", bool, False),
+    "server_stop_grace": ("server", "stop_grace", float, 30.0),
+    "server_on_request": ("server", "on_request_timeout", float, 600.0),
+    # [network]
+    "station_interface": ("network", "interface", str, "wlan0"),
+    "snapshot_ttl": ("network", "snapshot_ttl", float, 1.0),
+    "scan_refresh_interval": ("network", "scan_refresh_interval", int, 30),
+    "scan_min_age": ("network", "scan_min_age", int, 5),
+    "max_pending_jobs": ("network", "max_pending_jobs", int, 4),
+    "job_min_interval": ("network", "job_min_interval", float, 2.0),
+    # [watchdog]
+    "watchdog_enabled": ("watchdog", "enabled", bool, True),
+    "watchdog_probe": ("watchdog", "probe", str, "gateway"),
+    "watchdog_probe_timeout": ("watchdog", "probe_timeout", float, 2.0),
+    "watchdog_interval": ("watchdog", "interval", float, 30.0),
+    "watchdog_failures": ("watchdog", "failures", int, 3),
+    "watchdog_backoff_min": ("watchdog", "backoff_min", float, 5.0),
+    "watchdog_backoff_max": ("watchdog", "backoff_max", float, 300.0),
+    "watchdog_ap_after": ("watchdog", "ap_fallback_after", float, 600.0),
+    "watchdog_rescan_interval": ("watchdog", "rescan_interval", float, 60.0),
+    # [link_quality]
+    "link_quality_enabled": ("link_quality", "enabled", bool, True),
+    "link_quality_interval": ("link_quality", "interval", float, 10.0),
+    "link_quality_history": ("link_quality", "history", int, 8640),
+    "link_quality_file": ("link_quality", "file", str, "link_quality.bin"),
+    # [captive_portal]
+    "dns_enabled": ("captive_portal", "dns_enabled", bool, False),
+    "dns_port": ("captive_portal", "dns_port", int, 53),
+    # [logging]
+    "log_max_size_kb": ("logging", "max_size_kb", int, 1024),
+    "log_flush_interval": ("logging", "flush_interval", float, 5.0),
+    "log_flush_kb": ("logging", "flush_kb", int, 64),
+    "log_compress": ("logging", "compress", bool, True),
+    "log_max_total_mb": ("logging", "max_total_mb", int, 20),
+    "log_max_age_days": ("logging", "max_age_days", int, 30),
+    "log_max_files": ("logging", "max_files", int, 50),
+    "log_rotate_on_start": ("logging", "rotate_on_start", bool, False),
+    "log_sample_debug": ("logging", "sample_debug", int, 1),
+    "log_sample_info": ("logging", "sample_info", int, 1),
+}
+
+
+class Config:
+    """
+    config.ini parsed once, every value converted to its type up front.
+    Missing keys (or a missing file) fall back to the defaults in SETTINGS;
+    `found` says whether config.ini was there at all.
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        parser = configparser.ConfigParser()
+        self.path = path
+        self.found = bool(parser.read(path))
+
+        getters = {int: parser.getint, float: parser.getfloat, bool: parser.getboolean, str: parser.get}
+        for attribute, (section, key, kind, default) in SETTINGS.items():
+            try:
+                value = getters[kind](section, key, fallback=default)
+            except ValueError:
+                value = default  # A typo in config.ini shouldn't stop the service
+            setattr(self, attribute, value)
+
+    def __repr__(self):
+        values = ", ".join(f"{attribute}={getattr(self, attribute)!r}" for attribute in SETTINGS)
+        return f"Config({values})"
+
+
+# Shared instance, imported by everything that needs a setting
+config = Config()
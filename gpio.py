@@ -0,0 +1,531 @@
+"""
+Small GPIO hardware-abstraction layer for Button and LED.
+
+A backend opens single pins. Inputs are pulled up and expose `value`
+(True = released) and watch(callback), which calls callback() from any
+thread on every edge. Outputs expose set(level 0-1) and close(); `analog`
+outputs hold any brightness by themselves (the PWM runs in hardware or in
+C), the others can only do on/off and need Python to toggle the pin for
+anything in between.
+
+    gpiod      libgpiod v2 Python bindings, if installed
+    chardev    Linux GPIO character device through raw ioctls (no dependency)
+    pwm        hardware PWM through /sys/class/pwm (outputs on PWM pins only)
+    rpigpio    RPi.GPIO edge interrupts and PWM
+    sysfs      /sys/class/gpio, deprecated and without pull-up control
+    blinka     Adafruit Blinka digitalio, polled; pulls in PlatformDetect,
+               pyftdi, pyusb... so it only comes last
+    simulated  in memory, for development machines and tests
+
+open_input()/open_output() try them in that order ("auto") or open the one
+named. Nothing heavy is imported until a backend is actually tried.
+"""
+import glob
+import os
+import select
+import struct
+import threading
+import time
+from logger import logger
+
+CONSUMER = "rpi-wifi-configurator"
+
+# gpiochip labels of the 40-pin header (Pi 1-4, Pi 5)
+HEADER_CHIP_LABELS = ("pinctrl-bcm2835", "pinctrl-bcm2711", "pinctrl-rp1")
+
+
+# ------------------------------------------- #
+# ********* GPIO character device *********** #
+# ------------------------------------------- #
+# uAPI v1 (linux/gpio.h), supported by every kernel since 4.8; pull-up bias
+# needs 5.5, older kernels get the line without it.
+
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (0xB4 << 8) | nr
+
+
+_CHIPINFO = struct.Struct("32s32sI")
+_HANDLE_REQUEST = struct.Struct("64II64B32sIi")
+_EVENT_REQUEST = struct.Struct("III32si")
+_HANDLE_DATA = struct.Struct("64B")
+_EVENT_DATA_SIZE = 16  # struct gpioevent_data { __u64 timestamp; __u32 id; } padded
+
+GPIO_GET_CHIPINFO_IOCTL = _ioc(2, 0x01, _CHIPINFO.size)
+GPIO_GET_LINEHANDLE_IOCTL = _ioc(3, 0x03, _HANDLE_REQUEST.size)
+GPIO_GET_LINEEVENT_IOCTL = _ioc(3, 0x04, _EVENT_REQUEST.size)
+GPIOHANDLE_GET_LINE_VALUES_IOCTL = _ioc(3, 0x08, _HANDLE_DATA.size)
+GPIOHANDLE_SET_LINE_VALUES_IOCTL = _ioc(3, 0x09, _HANDLE_DATA.size)
+
+GPIOHANDLE_REQUEST_INPUT = 1 << 0
+GPIOHANDLE_REQUEST_OUTPUT = 1 << 1
+GPIOHANDLE_REQUEST_BIAS_PULL_UP = 1 << 5
+GPIOEVENT_REQUEST_BOTH_EDGES = (1 << 0) | (1 << 1)
+
+
+def find_chip():
+    """/dev/gpiochipN of the header pins (gpiochip4 on older Pi 5 kernels, else gpiochip0)"""
+    import fcntl
+    chips = sorted(glob.glob("/dev/gpiochip*"), key=lambda path: int(path[len("/dev/gpiochip"):] or 0))
+    if not chips:
+        raise RuntimeError("No GPIO character device")
+    for path in chips:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            info = bytearray(_CHIPINFO.size)
+            fcntl.ioctl(fd, GPIO_GET_CHIPINFO_IOCTL, info, True)
+            label = _CHIPINFO.unpack(info)[1].rstrip(b"\0").decode()
+        except OSError:
+            continue
+        finally:
+            os.close(fd)
+        if label in HEADER_CHIP_LABELS:
+            return path
+    return chips[0]
+
+
+class ChardevInput:
+    """Line event fd; the watch thread sleeps in read() until the kernel reports an edge"""
+
+    def __init__(self, pin, chip=None):
+        import fcntl
+        self.fcntl = fcntl
+        self.pin = pin
+        chip_fd = os.open(chip or find_chip(), os.O_RDONLY)
+        try:
+            try:
+                self.fd = self._request(chip_fd, GPIOHANDLE_REQUEST_INPUT | GPIOHANDLE_REQUEST_BIAS_PULL_UP)
+            except OSError:
+                # Kernel older than 5.5: no bias flags, rely on the default/external pull-up
+                self.fd = self._request(chip_fd, GPIOHANDLE_REQUEST_INPUT)
+        finally:
+            os.close(chip_fd)
+
+    def _request(self, chip_fd, flags):
+        request = bytearray(_EVENT_REQUEST.pack(self.pin, flags, GPIOEVENT_REQUEST_BOTH_EDGES, CONSUMER.encode(), 0))
+        self.fcntl.ioctl(chip_fd, GPIO_GET_LINEEVENT_IOCTL, request, True)
+        return _EVENT_REQUEST.unpack(request)[-1]
+
+    @property
+    def value(self):
+        data = bytearray(_HANDLE_DATA.size)
+        self.fcntl.ioctl(self.fd, GPIOHANDLE_GET_LINE_VALUES_IOCTL, data, True)
+        return bool(data[0])
+
+    def watch(self, callback):
+        def read_events():
+            while True:
+                try:
+                    os.read(self.fd, _EVENT_DATA_SIZE)
+                except OSError:
+                    return  # Closed
+                callback()
+        threading.Thread(target=read_events, daemon=True).start()
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ChardevOutput:
+    analog = False
+
+    def __init__(self, pin, chip=None):
+        import fcntl
+        self.fcntl = fcntl
+        self.pin = pin
+        chip_fd = os.open(chip or find_chip(), os.O_RDONLY)
+        try:
+            request = bytearray(_HANDLE_REQUEST.pack(
+                *([pin] + [0] * 63), GPIOHANDLE_REQUEST_OUTPUT, *([0] * 64), CONSUMER.encode(), 1, 0))
+            fcntl.ioctl(chip_fd, GPIO_GET_LINEHANDLE_IOCTL, request, True)
+            self.fd = _HANDLE_REQUEST.unpack(request)[-1]
+        finally:
+            os.close(chip_fd)
+        self._data = bytearray(_HANDLE_DATA.size)
+
+    def set(self, level):
+        self._data[0] = 1 if level > 0 else 0
+        self.fcntl.ioctl(self.fd, GPIOHANDLE_SET_LINE_VALUES_IOCTL, self._data)
+
+    def close(self):
+        self.set(0)
+        os.close(self.fd)
+
+
+class GpiodInput:
+    """The same character device through libgpiod v2 (pip install gpiod)"""
+
+    def __init__(self, pin, chip=None):
+        import gpiod
+        from gpiod.line import Bias, Direction, Edge, Value
+        self.active = Value.ACTIVE
+        self.pin = pin
+        settings = gpiod.LineSettings(direction=Direction.INPUT, bias=Bias.PULL_UP, edge_detection=Edge.BOTH)
+        self.request = gpiod.request_lines(chip or find_chip(), consumer=CONSUMER, config={pin: settings})
+
+    @property
+    def value(self):
+        return self.request.get_value(self.pin) == self.active
+
+    def watch(self, callback):
+        def read_events():
+            while True:
+                try:
+                    self.request.wait_edge_events()  # Blocks without a timeout
+                    events = self.request.read_edge_events()
+                except (OSError, ValueError):
+                    return  # Released
+                for _ in events:
+                    callback()
+        threading.Thread(target=read_events, daemon=True).start()
+
+    def close(self):
+        self.request.release()
+
+
+class GpiodOutput:
+    analog = False
+
+    def __init__(self, pin, chip=None):
+        import gpiod
+        from gpiod.line import Direction, Value
+        self.values = (Value.INACTIVE, Value.ACTIVE)
+        self.pin = pin
+        settings = gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.INACTIVE)
+        self.request = gpiod.request_lines(chip or find_chip(), consumer=CONSUMER, config={pin: settings})
+
+    def set(self, level):
+        self.request.set_value(self.pin, self.values[level > 0])
+
+    def close(self):
+        self.set(0)
+        self.request.release()
+
+
+# ------------------------------------------- #
+# *************** Hardware PWM ************** #
+# ------------------------------------------- #
+
+# BCM pin -> channel on pwmchip0 (needs dtoverlay=pwm or pwm-2chan)
+HARDWARE_PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}
+
+
+class SysfsPWMOutput:
+    """Hardware PWM through /sys/class/pwm"""
+    analog = True
+
+    def __init__(self, pin, chip="/sys/class/pwm/pwmchip0", frequency=1000):
+        if pin not in HARDWARE_PWM_CHANNELS or not os.path.isdir(chip):
+            raise RuntimeError(f"No hardware PWM for GPIO {pin}")
+        channel = HARDWARE_PWM_CHANNELS[pin]
+        self.path = os.path.join(chip, f"pwm{channel}")
+        if not os.path.isdir(self.path):
+            _write(os.path.join(chip, "export"), channel)
+            time.sleep(0.1)  # udev needs a moment to set up the channel
+
+        self.period = int(1e9 / frequency)
+        _write(os.path.join(self.path, "period"), self.period)
+        self._duty = os.open(os.path.join(self.path, "duty_cycle"), os.O_WRONLY)
+        self.set(0)
+        _write(os.path.join(self.path, "enable"), 1)
+
+    def set(self, level):
+        os.pwrite(self._duty, str(int(self.period * level)).encode(), 0)
+
+    def close(self):
+        self.set(0)
+        _write(os.path.join(self.path, "enable"), 0)
+        os.close(self._duty)
+
+
+def _write(path, value):
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+# ------------------------------------------- #
+# ***************** RPi.GPIO **************** #
+# ------------------------------------------- #
+
+class RPiGPIOInput:
+    """Interrupt driven: RPi.GPIO edge detection, no thread runs until the pin changes"""
+
+    def __init__(self, pin):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        self.pin = pin
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    @property
+    def value(self):
+        return bool(self.GPIO.input(self.pin))
+
+    def watch(self, callback):
+        self.GPIO.add_event_detect(self.pin, self.GPIO.BOTH, callback=lambda channel: callback())
+
+    def close(self):
+        self.GPIO.cleanup(self.pin)
+
+
+class RPiGPIOPWMOutput:
+    """RPi.GPIO PWM, the toggling happens in its C thread instead of Python"""
+    analog = True
+
+    def __init__(self, pin, frequency=200):
+        import RPi.GPIO as GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.OUT)
+        self.pwm = GPIO.PWM(pin, frequency)
+        self.pwm.start(0)
+
+    def set(self, level):
+        self.pwm.ChangeDutyCycle(level * 100)
+
+    def close(self):
+        self.pwm.stop()
+
+
+# ------------------------------------------- #
+# ****************** sysfs ****************** #
+# ------------------------------------------- #
+# Deprecated, but still around on older images. There's no pull-up control:
+# the button needs the pin's default pull-up (GPIO 0-8) or `gpio=23=ip,pu`
+# in /boot/config.txt.
+
+def sysfs_number(pin):
+    """Global GPIO number: newer kernels no longer start the header chip at 0"""
+    for chip in glob.glob("/sys/class/gpio/gpiochip*"):
+        try:
+            with open(os.path.join(chip, "label")) as f:
+                label = f.read().strip()
+            with open(os.path.join(chip, "base")) as f:
+                base = int(f.read())
+        except (OSError, ValueError):
+            continue
+        if label in HEADER_CHIP_LABELS:
+            return base + pin
+    return pin
+
+
+class SysfsPin:
+    def __init__(self, pin, direction):
+        if not os.path.isdir("/sys/class/gpio"):
+            raise RuntimeError("No /sys/class/gpio")
+        self.pin = pin
+        self.number = sysfs_number(pin)
+        self.path = f"/sys/class/gpio/gpio{self.number}"
+        if not os.path.isdir(self.path):
+            _write("/sys/class/gpio/export", self.number)
+            time.sleep(0.1)  # udev needs a moment to set up permissions
+        _write(os.path.join(self.path, "direction"), direction)
+
+    def close(self):
+        _write("/sys/class/gpio/unexport", self.number)
+
+
+class SysfsInput(SysfsPin):
+    """Edge interrupts through poll(POLLPRI) on the value file"""
+
+    def __init__(self, pin):
+        super().__init__(pin, "in")
+        _write(os.path.join(self.path, "edge"), "both")
+        self.fd = os.open(os.path.join(self.path, "value"), os.O_RDONLY)
+
+    @property
+    def value(self):
+        return os.pread(self.fd, 1, 0) == b"1"
+
+    def watch(self, callback):
+        def wait_for_edges():
+            poller = select.poll()
+            poller.register(self.fd, select.POLLPRI | select.POLLERR)
+            os.pread(self.fd, 1, 0)  # Arm it, the first poll would return at once otherwise
+            while True:
+                try:
+                    poller.poll()
+                    os.pread(self.fd, 1, 0)
+                except OSError:
+                    return  # Closed
+                callback()
+        threading.Thread(target=wait_for_edges, daemon=True).start()
+
+    def close(self):
+        os.close(self.fd)
+        super().close()
+
+
+class SysfsOutput(SysfsPin):
+    analog = False
+
+    def __init__(self, pin):
+        super().__init__(pin, "out")
+        self.fd = os.open(os.path.join(self.path, "value"), os.O_WRONLY)
+
+    def set(self, level):
+        os.pwrite(self.fd, b"1" if level > 0 else b"0", 0)
+
+    def close(self):
+        self.set(0)
+        os.close(self.fd)
+        super().close()
+
+
+# ------------------------------------------- #
+# ****************** Blinka ***************** #
+# ------------------------------------------- #
+
+class BlinkaInput:
+    """Blinka digitalio, sampled every 1 ms in its own thread"""
+
+    def __init__(self, pin, interval=0.001):
+        import board
+        import digitalio
+        self.button = digitalio.DigitalInOut(getattr(board, f'D{pin}'))
+        self.button.direction = digitalio.Direction.INPUT
+        self.button.pull = digitalio.Pull.UP
+        self.interval = interval
+
+    @property
+    def value(self):
+        return self.button.value
+
+    def watch(self, callback):
+        def poll():
+            last = self.button.value
+            while True:
+                current = self.button.value
+                if current != last:
+                    last = current
+                    callback()
+                time.sleep(self.interval)
+        threading.Thread(target=poll, daemon=True).start()
+
+    def close(self):
+        self.button.deinit()
+
+
+class BlinkaOutput:
+    """Blinka digitalio, on/off only"""
+    analog = False
+
+    def __init__(self, pin):
+        import board
+        import digitalio
+        self.led = digitalio.DigitalInOut(getattr(board, f'D{pin}'))
+        self.led.direction = digitalio.Direction.OUTPUT
+
+    def set(self, level):
+        self.led.value = level > 0
+
+    def close(self):
+        self.led.value = False
+
+
+# ------------------------------------------- #
+# **************** Simulated **************** #
+# ------------------------------------------- #
+
+class SimulatedInput:
+    """In-memory stand-in, drive it with press()/release() to test timing without hardware"""
+
+    def __init__(self, pin=None, value=True):
+        self.pin = pin
+        self._value = value
+        self._callback = None
+
+    @property
+    def value(self):
+        return self._value
+
+    def watch(self, callback):
+        self._callback = callback
+
+    def set_value(self, value):
+        self._value = value
+        if self._callback:
+            self._callback()
+
+    def press(self):
+        self.set_value(False)
+
+    def release(self):
+        self.set_value(True)
+
+    def close(self):
+        self._callback = None
+
+
+class SimulatedOutput:
+    """Remembers the last level (and how often it was set) instead of driving a pin"""
+    analog = True
+
+    def __init__(self, pin=None):
+        self.pin = pin
+        self.level = 0
+        self.writes = 0
+
+    def set(self, level):
+        self.level = level
+        self.writes += 1
+
+    def close(self):
+        self.level = 0
+
+
+# ------------------------------------------- #
+# **************** Selection **************** #
+# ------------------------------------------- #
+
+# name -> (input class, output class), in the order "auto" tries them
+BACKENDS = {
+    "gpiod": (GpiodInput, GpiodOutput),
+    "chardev": (ChardevInput, ChardevOutput),
+    "pwm": (None, SysfsPWMOutput),
+    "rpigpio": (RPiGPIOInput, RPiGPIOPWMOutput),
+    "sysfs": (SysfsInput, SysfsOutput),
+    "blinka": (BlinkaInput, BlinkaOutput),
+    "simulated": (SimulatedInput, SimulatedOutput),
+}
+
+# Smooth LED patterns want an analog output, so PWM goes first there
+OUTPUT_ORDER = ("pwm", "rpigpio", "gpiod", "chardev", "sysfs", "blinka", "simulated")
+INPUT_ORDER = ("gpiod", "chardev", "rpigpio", "sysfs", "blinka", "simulated")
+
+
+def open_input(pin, backend=None):
+    """Pulled-up input for `pin`. backend: a name, None/"auto", or an already opened pin"""
+    return _open(pin, backend, 0, INPUT_ORDER)
+
+
+def open_output(pin, backend=None):
+    """Output for `pin`. backend: a name, None/"auto", or an already opened pin"""
+    return _open(pin, backend, 1, OUTPUT_ORDER)
+
+
+def _open(pin, backend, kind, order):
+    what = ("input", "output")[kind]
+    if backend is not None and not isinstance(backend, str):
+        return backend
+
+    if backend not in (None, "auto"):
+        if backend not in BACKENDS or BACKENDS[backend][kind] is None:
+            raise ValueError(f"Unknown GPIO {what} backend {backend!r}, expected one of: "
+                             + ", ".join(name for name in order))
+        opened = BACKENDS[backend][kind](pin)
+        logger.info(f"[gpio.py][Status] GPIO {pin} {what} via {backend}")
+        return opened
+
+    for name in order:
+        try:
+            opened = BACKENDS[name][kind](pin)
+        except Exception as e:  # Missing module, no such device, wrong board...
+            logger.debug(f"[gpio.py][Status] GPIO {pin} {what}: {name} not usable: {e}")
+            continue
+        if name == "simulated":
+            logger.warning(f"[gpio.py][Status] No GPIO hardware found, GPIO {pin} {what} is simulated")
+        else:
+            logger.info(f"[gpio.py][Status] GPIO {pin} {what} via {name}")
+        return opened
@@ -110,7 +110,7 @@ NC='\033[0m' # No Color
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 INSTALL_DIR="$SCRIPT_DIR"
 DRY_RUN=false
-TOTAL_STEPS=8  # Updated to include PolicyKit configuration
+TOTAL_STEPS=9  # Updated to include PolicyKit and captive portal configuration
 
 # Configuration variables
 BUTTON_GPIO_PIN=""
@@ -521,6 +521,10 @@ ap_password = $AP_PASSWORD
 
 [server]
 port = 4000
+
+[captive_portal]
+# The hotspot's own dnsmasq answers DNS, see $DNSMASQ_SHARED_DIR/captive.conf
+dns_enabled = false
 EOF
     
     if [ "$backup_config" = true ]; then
@@ -676,6 +680,83 @@ create_nm_hotspot() {
     fi
 }
 
+# ============================================
+# Captive portal (DNS + port 80 redirect)
+# ============================================
+
+DNSMASQ_SHARED_DIR="/etc/NetworkManager/dnsmasq-shared.d"
+DISPATCHER_SCRIPT="/etc/NetworkManager/dispatcher.d/90-rpi-wifi-captive-portal"
+AP_IP="10.10.1.1"
+PORTAL_PORT="4000"
+
+configure_captive_portal() {
+    print_info "Making the portal pop up on phones that join the hotspot..."
+
+    if [ "$DRY_RUN" = true ]; then
+        print_success "Would create $DNSMASQ_SHARED_DIR/captive.conf (address=/#/$AP_IP)"
+        print_success "Would create $DISPATCHER_SCRIPT (port 80 -> $PORTAL_PORT while the hotspot is up)"
+        return 0
+    fi
+
+    # The hotspot (ipv4.method shared) runs NetworkManager's own dnsmasq on
+    # port 53: have it answer every name with the AP address
+    sudo mkdir -p "$DNSMASQ_SHARED_DIR"
+    echo "address=/#/$AP_IP" | sudo tee "$DNSMASQ_SHARED_DIR/captive.conf" > /dev/null
+    sudo chmod 644 "$DNSMASQ_SHARED_DIR/captive.conf"
+    print_success "Hotspot DNS answers every name with $AP_IP"
+
+    # Connectivity checks (generate_204, hotspot-detect.html) go to port 80,
+    # the portal listens on $PORTAL_PORT
+    if ! command -v nft &> /dev/null; then
+        print_info "Installing nftables..."
+        if ! sudo apt-get install -y nftables > /dev/null 2>&1; then
+            print_warning "Could not install nftables, skipping the port 80 redirect"
+            print_info "The portal is still reachable at http://$AP_IP:$PORTAL_PORT"
+            return 0
+        fi
+    fi
+
+    cat > /tmp/rpi-wifi-captive-portal <<'EOFTEMP'
+#!/bin/sh
+# Installed by rpi-wifi-configurator: while the hotspot is up, port 80 on
+# its interface is redirected to the portal
+[ "$CONNECTION_ID" = "hotspot" ] || exit 0
+
+case "$2" in
+    up)
+        nft -f - <<EOF
+table ip rpi_wifi_captive
+delete table ip rpi_wifi_captive
+table ip rpi_wifi_captive {
+    chain prerouting {
+        type nat hook prerouting priority dstnat; policy accept;
+        iifname "$1" tcp dport 80 redirect to :PORTPLACEHOLDER
+    }
+}
+EOF
+        ;;
+    down)
+        nft delete table ip rpi_wifi_captive 2> /dev/null
+        ;;
+esac
+exit 0
+EOFTEMP
+
+    # Fill in the portal port
+    sed -i "s/PORTPLACEHOLDER/$PORTAL_PORT/g" /tmp/rpi-wifi-captive-portal
+
+    if sudo mv /tmp/rpi-wifi-captive-portal "$DISPATCHER_SCRIPT"; then
+        sudo chown root:root "$DISPATCHER_SCRIPT"
+        sudo chmod 755 "$DISPATCHER_SCRIPT"
+        print_success "Port 80 on the hotspot goes to the portal (port $PORTAL_PORT)"
+    else
+        print_warning "Failed to install $DISPATCHER_SCRIPT"
+        rm -f /tmp/rpi-wifi-captive-portal
+        print_info "The portal is still reachable at http://$AP_IP:$PORTAL_PORT"
+    fi
+    print_info "Takes effect the next time the hotspot comes up"
+}
+
 # ============================================
 # NetworkManager PolicyKit configuration
 # ============================================
@@ -899,18 +980,23 @@ main() {
     create_nm_hotspot
     echo ""
     
-    # Step 6: NetworkManager PolicyKit permissions
-    print_step "6" "$TOTAL_STEPS" "Configuring NetworkManager permissions"
+    # Step 6: Captive portal
+    print_step "6" "$TOTAL_STEPS" "Configuring captive portal"
+    configure_captive_portal
+    echo ""
+    
+    # Step 7: NetworkManager PolicyKit permissions
+    print_step "7" "$TOTAL_STEPS" "Configuring NetworkManager permissions"
     configure_network_permissions
     echo ""
     
-    # Step 7: Service setup
-    print_step "7" "$TOTAL_STEPS" "Setting up systemd service"
+    # Step 8: Service setup
+    print_step "8" "$TOTAL_STEPS" "Setting up systemd service"
     setup_systemd_service
     echo ""
     
-    # Step 8: Installation complete
-    print_step "8" "$TOTAL_STEPS" "Installation complete!"
+    # Step 9: Installation complete
+    print_step "9" "$TOTAL_STEPS" "Installation complete!"
     echo ""
     print_success "WiFi configurator installed successfully!"
     echo ""
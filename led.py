@@ -1,87 +1,128 @@
-import board
-import digitalio
 import threading
 import time
 import math
+from gpio import open_output
+from logger import logger
+from wifi_config import metrics
+
+
+# ------------------------------------------- #
+# ***************** Patterns **************** #
+# ------------------------------------------- #
+# A pattern is plain data: a tuple of (brightness 0-1, duration sec) steps,
+# played in a loop. A duration of None holds that step until set_state()
+# is called again, so static patterns cost no CPU at all.
+
+def breath_table(period=1.0, steps=50):
+    """Sine ramp from off to full brightness, precomputed once"""
+    return tuple(
+        ((math.sin(math.pi * (i / steps) - math.pi / 2) + 1) / 2, period / steps)
+        for i in range(steps)
+    )
+
+
+def pulse_pattern(count, on=0.15, off=0.2, pause=1.0):
+    """`count` short pulses then a pause, e.g. signal strength in bars"""
+    steps = []
+    for _ in range(count):
+        steps += [(1.0, on), (0.0, off)]
+    steps.append((0.0, pause))
+    return tuple(steps)
+
+
+PATTERNS = {
+    "SOLID": ((1.0, None),),
+    "OFF": ((0.0, None),),
+    "FAST": ((1.0, 0.5), (0.0, 0.5)),
+    "BREATH": breath_table(),
+    "DOUBLE": pulse_pattern(2, on=0.1, off=0.15, pause=0.6),
+}
+
+
+def register_pattern(name, steps):
+    """Declare a new pattern; LED.set_state(name) will play it"""
+    PATTERNS[name] = tuple(steps)
+    return name
+
+
+# ------------------------------------------- #
+# ******************* LED ******************* #
+# ------------------------------------------- #
 
 class LED:
     SOLID = "SOLID"
     FAST_BLINK = "FAST"
     SLOW_BREATH = "BREATH"
+    DOUBLE_BLINK = "DOUBLE"
     OFF = "OFF"
 
-    def __init__(self, pin, max_brightness=0.3):  # 30% brightness by default
-        self.pin = getattr(board, f'D{pin}')
-        self.led = digitalio.DigitalInOut(self.pin)
-        self.led.direction = digitalio.Direction.OUTPUT
+    def __init__(self, pin, max_brightness=0.3, backend=None):  # 30% brightness by default
+        """backend: a gpio.py backend name, an opened output, or None to pick one"""
+        self.pin = pin
+        self.output = open_output(pin, backend)
         self._state = self.OFF
         self._running = True
+        self._changed = False
+        self._cond = threading.Condition()
         self.max_brightness = max_brightness
-        
+        self._dimming_noted = False
+
         self.thread = threading.Thread(target=self._control_led, daemon=True)
         self.thread.start()
 
-    def _pwm_cycle(self, brightness):
-        """Execute one PWM cycle with given brightness (0-1)"""
-        scaled_brightness = brightness * self.max_brightness
-        on_time = scaled_brightness * 0.01  # Max 10ms
-        off_time = 0.01 - on_time
-        
-        self.led.value = True
-        time.sleep(on_time)
-        self.led.value = False
-        time.sleep(off_time)
-
-    def _fast_blink(self):
-        """Single blink cycle with controlled brightness"""
-        if self.led.value:  # If LED is on, turn it off
-            self.led.value = False
-            return 0.5  # Off for 500ms
-        else:  # If LED is off, turn it on with PWM
-            self._pwm_cycle(1.0)  # One PWM cycle at max allowed brightness
-            return 0.5  # On for 500ms
-
-    def _slow_breath(self):
-        """Creates a smooth breathing effect using sine wave"""
-        steps = 100
-        for i in range(steps):
-            if self._state != self.SLOW_BREATH:
-                break
-                
-            # Generate sine wave from -π/2 to π/2
-            x = math.pi * (i / steps) - math.pi/2
-            brightness = (math.sin(x) + 1) / 2  # Convert to 0-1 range
-            
-            self._pwm_cycle(brightness)
-        
-        return 0.01
-
-    def _solid(self):
-        self._pwm_cycle(1.0)  # Full brightness but limited by max_brightness
-        return 0.01
-
-    def _off(self):
-        self.led.value = False
-        return 0.1
+    def _wait(self, duration):
+        """Sleep for duration (None = until the state changes). True if interrupted"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._changed or not self._running, timeout=duration)
+
+    def _pwm_cycles(self, level, duration):
+        """Software PWM for outputs that can only do on/off. True if interrupted"""
+        on_time = level * 0.01  # 10ms cycle
+        end = None if duration is None else time.monotonic() + duration
+        while not self._changed and self._running:
+            self.output.set(1)
+            time.sleep(on_time)
+            self.output.set(0)
+            time.sleep(0.01 - on_time)
+            if end is not None and time.monotonic() >= end:
+                return False
+        return True
 
     def _control_led(self):
         while self._running:
-            if self._state == self.FAST_BLINK:
-                sleep_time = self._fast_blink()
-            elif self._state == self.SLOW_BREATH:
-                sleep_time = self._slow_breath()
-            elif self._state == self.SOLID:
-                sleep_time = self._solid()
-            else:  # OFF
-                sleep_time = self._off()
-            
-            time.sleep(sleep_time)
+            with self._cond:
+                self._changed = False
+                steps = PATTERNS.get(self._state, PATTERNS[self.OFF])
+
+            for brightness, duration in steps:
+                metrics.THREAD_WAKEUPS.inc(thread="led")
+                level = brightness * self.max_brightness
+                if not self.output.analog and duration is None and 0 < level < 1:
+                    # A held step would mean software PWM forever: on/off outputs go fully on
+                    if not self._dimming_noted:
+                        self._dimming_noted = True
+                        logger.info(f"[led.py][Status] GPIO {self.pin} output can't dim, static states are shown at full brightness")
+                    level = 1
+                if self.output.analog or level <= 0 or level >= 1:
+                    self.output.set(level)
+                    interrupted = self._wait(duration)
+                else:
+                    interrupted = self._pwm_cycles(level, duration)
+                if interrupted:
+                    break
 
     def set_state(self, state):
-        self._state = state
+        with self._cond:
+            if state == self._state:
+                return
+            self._state = state
+            self._changed = True
+            self._cond.notify()
 
     def cleanup(self):
-        self._running = False
+        with self._cond:
+            self._running = False
+            self._cond.notify()
         if self.thread.is_alive():
             self.thread.join()
-        self.led.value = False
\ No newline at end of file
+        self.output.close()
@@ -1,41 +1,262 @@
+import atexit
+import gzip
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import shutil
+import threading
+import time
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 import os
 from datetime import datetime
-# import shutil
 
 class CustomTimedRotatingFileHandler(TimedRotatingFileHandler):
-    def __init__(self, filename, when='h', interval=1, backupCount=0, encoding=None, delay=False, utc=False, atTime=None):
+    """
+    Daily (and optionally size based) rotation into logs/, tuned for SD cards:
+
+    - records are buffered and written in batches, once `flush_bytes` are
+      pending or `flush_interval` seconds have passed (errors flush at once)
+    - rotated files are gzipped in the background
+    - logs/ is kept under `max_total_bytes`, `max_age_days` and `max_files`
+      (0 disables a limit)
+    - `rotate_on_start` keeps the old one-file-per-start behaviour, otherwise
+      a restart just appends to the current file
+    """
+
+    def __init__(self, filename, when='h', interval=1, backupCount=0, encoding=None, delay=False, utc=False, atTime=None,
+                 max_bytes=0, flush_interval=0, flush_bytes=0, compress=False,
+                 max_total_bytes=0, max_age_days=0, max_files=0, rotate_on_start=True):
         self.root_dir = os.path.dirname(os.path.abspath(__file__))
         self.logs_dir = os.path.join(self.root_dir, "logs")
         os.makedirs(self.logs_dir, exist_ok=True)
         self.main_log_file = os.path.join(self.root_dir, filename)
+
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.compress = compress
+        self.max_total_bytes = max_total_bytes
+        self.max_age_days = max_age_days
+        self.max_files = max_files
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._archive_lock = threading.Lock()
+        self._stop_flush = threading.Event()
+
+        # Move the previous run's log away *before* opening our own stream
+        if rotate_on_start:
+            self.initial_backup()
         super().__init__(self.main_log_file, when, interval, backupCount, encoding, delay, utc, atTime)
-        self.initial_backup()
+        self._size = os.path.getsize(self.main_log_file) if os.path.exists(self.main_log_file) else 0
+
+        self._archive_in_background(None)  # Apply retention to what's already there
+        if self.flush_interval:
+            threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _open(self):
+        if self.flush_bytes:
+            return open(self.baseFilename, self.mode, buffering=self.flush_bytes,
+                        encoding=self.encoding, errors=self.errors)
+        return super()._open()
 
     def initial_backup(self):
             if os.path.exists(self.main_log_file):
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_file = os.path.join(self.logs_dir, f"log_{timestamp}.log")
+                backup_file = self._backup_path()
                 os.rename(self.main_log_file, backup_file)  # Rename and move instead of copy
+                self._archive_in_background(backup_file)
+
+    def _backup_path(self):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_file = os.path.join(self.logs_dir, f"log_{timestamp}.log")
+        suffix = 1
+        while os.path.exists(backup_file) or os.path.exists(backup_file + ".gz"):
+            backup_file = os.path.join(self.logs_dir, f"log_{timestamp}_{suffix}.log")
+            suffix += 1
+        return backup_file
+
+    def shouldRollover(self, record, size=0):
+        if self.max_bytes and self._size and self._size + size > self.max_bytes:
+            return True
+        return super().shouldRollover(record)
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if self.shouldRollover(record, len(msg)):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self._size += len(msg)
+            self._pending += len(msg)
+            if record.levelno >= logging.ERROR:
+                self._flush_now()
+            else:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        # StreamHandler calls this after every record: only hit the card in batches
+        if self._pending >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush_now()
+
+    def _flush_now(self):
+        self.acquire()
+        try:
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        finally:
+            self.release()
+
+    def _flush_periodically(self):
+        while not self._stop_flush.wait(self.flush_interval):
+            if self._pending:
+                self._flush_now()
 
     def doRollover(self):
         if self.stream:
             self.stream.close()
             self.stream = None
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(self.logs_dir, f"log_{timestamp}.log")
+        backup_file = self._backup_path()
         
         if os.path.exists(self.main_log_file):
             os.rename(self.main_log_file, backup_file)
+            self._archive_in_background(backup_file)
         
+        self._size = 0
+        self._pending = 0
+        self.rolloverAt = self.computeRollover(int(time.time()))
         if not self.delay:
             self.stream = self._open()
 
+    def close(self):
+        self._stop_flush.set()
+        super().close()
+
+    # ------------------------------------------- #
+    # ********* Compression & retention ********* #
+    # ------------------------------------------- #
+
+    def _archive_in_background(self, path):
+        if path is None and not (self.max_total_bytes or self.max_age_days or self.max_files):
+            return
+        threading.Thread(target=self._archive, args=(path,), daemon=True).start()
+
+    def _archive(self, path):
+        with self._archive_lock:
+            try:
+                if path and self.compress and os.path.exists(path):
+                    with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(path)
+                self._apply_retention()
+            except OSError:
+                pass  # Never let housekeeping take logging down
+
+    def _apply_retention(self):
+        files = []
+        for name in os.listdir(self.logs_dir):
+            if name.startswith("log_") and (name.endswith(".log") or name.endswith(".log.gz")):
+                full_path = os.path.join(self.logs_dir, name)
+                stat = os.stat(full_path)
+                files.append((stat.st_mtime, stat.st_size, full_path))
+        files.sort(key=lambda f: (f[0], f[2]))  # Oldest first
+
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        while files:
+            mtime, size, oldest = files[0]
+            too_old = self.max_age_days and now - mtime > self.max_age_days * 86400
+            too_many = self.max_files and len(files) > self.max_files
+            too_big = self.max_total_bytes and total > self.max_total_bytes
+            if not (too_old or too_many or too_big):
+                break
+            os.remove(oldest)
+            total -= size
+            files.pop(0)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler on a bounded queue, so a slow console/SD card never stalls
+    the thread that logs. When the queue is full the overflow policy decides:
+    "drop_new" discards the incoming record, "drop_oldest" makes room by
+    discarding the oldest queued one, "block" waits (the old behaviour).
+    """
+    POLICIES = ("drop_new", "drop_oldest", "block")
+
+    def __init__(self, maxsize=1000, overflow="drop_new"):
+        if overflow not in self.POLICIES:
+            raise ValueError(f"overflow must be one of {self.POLICIES}")
+        super().__init__(queue.Queue(maxsize))
+        self.overflow = overflow
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def take_dropped(self):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only 1 in N records per level, e.g. {logging.DEBUG: 10}. Other levels pass"""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._seen = {}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if not rate or rate <= 1:
+            return True
+        count = self._seen.get(record.levelno, 0)
+        self._seen[record.levelno] = count + 1
+        return count % rate == 0
+
+
+class _ListenerWithDropReport(QueueListener):
+    """Writer thread: reports records lost to the overflow policy once they happen"""
+
+    def __init__(self, queue_handler, *handlers):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+
+    def handle(self, record):
+        dropped = self.queue_handler.take_dropped()
+        if dropped:
+            super().handle(logging.makeLogRecord({
+                "name": record.name, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"[logger.py][Status] Log queue full, dropped {dropped} record(s)",
+            }))
+        super().handle(record)
+
 
 class Logger:
-    def __init__(self, name, log_file='komorebi.log', level=logging.DEBUG):
+    def __init__(self, name, log_file='komorebi.log', level=logging.DEBUG,
+                 queue_size=1000, overflow="drop_new", sample_rates=None, storage=None):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
         
@@ -45,17 +266,33 @@ class Logger:
         ch = logging.StreamHandler()
         ch.setLevel(level)
         ch.setFormatter(formatter)
-        self.logger.addHandler(ch)
         
         # File handler (rotates every 24 hours)
-        fh = CustomTimedRotatingFileHandler(log_file, when="D", interval=1, backupCount=0)
+        # `storage` holds the SD card options of CustomTimedRotatingFileHandler
+        fh = CustomTimedRotatingFileHandler(log_file, when="D", interval=1, backupCount=0, **(storage or {}))
         fh.setLevel(level)
         fh.setFormatter(formatter)
-        self.logger.addHandler(fh)
+        self.file_handler = fh
+
+        # Callers only enqueue; one writer thread does the console + SD card I/O
+        self.queue_handler = BoundedQueueHandler(queue_size, overflow)
+        self.queue_handler.addFilter(SamplingFilter(sample_rates))
+        self.logger.addHandler(self.queue_handler)
+        self.listener = _ListenerWithDropReport(self.queue_handler, ch, fh)
+        self.listener.start()
+        self._listening = True
+        atexit.register(self.shutdown)
 
         # Disable propagation to avoid duplicate logs
         self.logger.propagate = False
 
+    def shutdown(self):
+        """Flush everything still queued and stop the writer thread"""
+        if self._listening:
+            self._listening = False
+            self.listener.stop()
+            self.file_handler._flush_now()  # Don't leave the last batch in the buffer
+
     def debug(self, message):
         self.logger.debug(message)
 
@@ -71,10 +308,31 @@ class Logger:
     def critical(self, message):
         self.logger.critical(message)
 
+def load_storage_config():
+    """[logging] section of config.ini -> CustomTimedRotatingFileHandler options"""
+    from config import config
+    return {
+        "max_bytes": config.log_max_size_kb * 1024,
+        "flush_interval": config.log_flush_interval,
+        "flush_bytes": config.log_flush_kb * 1024,
+        "compress": config.log_compress,
+        "max_total_bytes": config.log_max_total_mb * 1024 * 1024,
+        "max_age_days": config.log_max_age_days,
+        "max_files": config.log_max_files,
+        "rotate_on_start": config.log_rotate_on_start,
+    }
+
+
+def load_sample_rates():
+    """[logging] sample_* of config.ini -> SamplingFilter rates"""
+    from config import config
+    return {logging.DEBUG: config.log_sample_debug, logging.INFO: config.log_sample_info}
+
+
 # Create a global logger instance
-logger = Logger('rpi-wifi-configurator')
+logger = Logger('rpi-wifi-configurator', sample_rates=load_sample_rates(), storage=load_storage_config())
 
 # Capture Flask and Werkzeug logs
 werkzeug_logger = logging.getLogger('werkzeug')
 werkzeug_logger.setLevel(logging.ERROR)  # Only log errors from Werkzeug
-werkzeug_logger.addHandler(logger.logger.handlers[1])  # Add file handler
\ No newline at end of file
+werkzeug_logger.addHandler(logger.queue_handler)  # Same queue, written by the same thread
@@ -145,6 +145,15 @@ main() {
     else
         print_info "Hotspot connection not found"
     fi
+
+    CAPTIVE_DNS_CONF="/etc/NetworkManager/dnsmasq-shared.d/captive.conf"
+    CAPTIVE_DISPATCHER="/etc/NetworkManager/dispatcher.d/90-rpi-wifi-captive-portal"
+    if [ -f "$CAPTIVE_DNS_CONF" ] || [ -f "$CAPTIVE_DISPATCHER" ]; then
+        print_info "Removing captive portal DNS and port 80 redirect..."
+        sudo rm -f "$CAPTIVE_DNS_CONF" "$CAPTIVE_DISPATCHER"
+        sudo nft delete table ip rpi_wifi_captive 2>/dev/null || true
+        print_success "Captive portal configuration removed"
+    fi
     echo ""
     
     # Step 4: Clean installation directory
@@ -163,6 +172,18 @@ main() {
         print_success "Configuration removed"
     fi
     
+    if [ -f "$SCRIPT_DIR/managed_profiles.json" ]; then
+        print_info "Removing the list of managed WiFi profiles..."
+        rm -f "$SCRIPT_DIR/managed_profiles.json" "$SCRIPT_DIR/managed_profiles.json.tmp"
+        print_success "Managed profile list removed"
+    fi
+    
+    if [ -f "$SCRIPT_DIR/link_quality.bin" ]; then
+        print_info "Removing the link quality history..."
+        rm -f "$SCRIPT_DIR/link_quality.bin"
+        print_success "Link quality history removed"
+    fi
+    
     print_info "Keeping source files (install.sh, app.py, etc.)"
     print_info "To completely remove, manually delete: $SCRIPT_DIR"
     echo ""
@@ -175,9 +196,10 @@ main() {
     print_info "What was removed:"
     echo "     - Systemd service"
     echo "     - PolicyKit rule"
-    echo "     - NetworkManager hotspot connection"
+    echo "     - NetworkManager hotspot connection and captive portal setup"
     echo "     - Python virtual environment"
     echo "     - Configuration files"
+    echo "     - Runtime state (managed profile list, link quality history)"
     echo ""
     print_info "What remains:"
     echo "     - Source code in: $SCRIPT_DIR"
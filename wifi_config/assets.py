@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from time import monotonic
+from flask import Response, abort, request
+from logger import logger
+
+try:
+    import rjsmin  # Optional: pip install rjsmin
+except ImportError:
+    rjsmin = None
+
+
+# ------------------------------------------- #
+# **************** Minifiers **************** #
+# ------------------------------------------- #
+
+def minify_css(text):
+    """Conservative: drop comments and whitespace that can never matter"""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    # There's no safe way to minify JS with a few regexes, so this only
+    # happens when rjsmin is installed. gzip does most of the work anyway.
+    if rjsmin is None:
+        return text
+    return rjsmin.jsmin(text, keep_bang_comments=True)
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+# ------------------------------------------- #
+# ***************** Assets ****************** #
+# ------------------------------------------- #
+
+class Asset:
+    __slots__ = ("path", "content_type", "digest", "identity", "gzipped")
+
+    def __init__(self, path, content_type, digest, identity, gzipped):
+        self.path = path
+        self.content_type = content_type  # Complete, charset included
+        self.digest = digest
+        self.identity = identity
+        self.gzipped = gzipped
+
+    @property
+    def hashed_name(self):
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}.{self.digest}{ext}"
+
+
+class AssetPipeline:
+    """
+    Loads the (small) static folder into memory once at startup: CSS/JS
+    minified, anything compressible gzipped at level 9, and every file
+    content-hashed.
+
+    Templates link to url(path) -> /assets/<name>.<hash>.<ext>, served with
+    a year-long `immutable` Cache-Control, so a phone fetches each file once.
+    The plain /static/ URLs still work and revalidate with ETags. gzip is
+    only sent to clients that accept it.
+    """
+    COMPRESSIBLE = (".js", ".css", ".html", ".svg", ".json", ".txt")
+    IMMUTABLE = "public, max-age=31536000, immutable"
+    REVALIDATE = "no-cache"
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.assets = {}  # relative path -> Asset
+        self.hashed = {}  # hashed name -> Asset
+
+    def build(self):
+        start = monotonic()
+        raw_total = sent_total = 0
+        for root, _, files in os.walk(self.static_dir):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.static_dir).replace(os.sep, "/")
+                asset = self._load(path, full_path)
+                self.assets[path] = asset
+                self.hashed[asset.hashed_name] = asset
+                raw_total += os.path.getsize(full_path)
+                sent_total += len(asset.gzipped or asset.identity)
+
+        logger.info(f"[assets.py][Status] {len(self.assets)} static assets ready in {monotonic() - start:.2f} sec "
+                    f"({raw_total // 1024} KB on disk, {sent_total // 1024} KB over the wire)")
+        return self
+
+    def _load(self, path, full_path):
+        with open(full_path, "rb") as f:
+            data = f.read()
+
+        ext = os.path.splitext(path)[1].lower()
+        if ext in MINIFIERS:
+            data = MINIFIERS[ext](data.decode("utf-8")).encode("utf-8")
+
+        gzipped = None
+        if ext in self.COMPRESSIBLE:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data) * 0.9:
+                gzipped = compressed
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or ext == ".js":
+            content_type += "; charset=utf-8"
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        return Asset(path, content_type, digest, data, gzipped)
+
+    def url(self, path):
+        """For templates: content-hashed URL, or the plain one for unknown files"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return f"/static/{path}"
+        return f"/assets/{asset.hashed_name}"
+
+    def serve(self, path):
+        asset = self.assets.get(path)
+        if asset is None:
+            abort(404)
+        return self._respond(asset, self.REVALIDATE)
+
+    def serve_hashed(self, name):
+        asset = self.hashed.get(name)
+        if asset is None:
+            abort(404)
+        return self._respond(asset, self.IMMUTABLE)
+
+    def _respond(self, asset, cache_control):
+        if asset.gzipped is not None and request.accept_encodings["gzip"]:
+            response = Response(asset.gzipped, content_type=asset.content_type)
+            response.headers["Content-Encoding"] = "gzip"
+            response.set_etag(f"{asset.digest}-gz")
+        else:
+            response = Response(asset.identity, content_type=asset.content_type)
+            response.set_etag(asset.digest)
+        if asset.gzipped is not None:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = cache_control
+        return response.make_conditional(request)
@@ -0,0 +1,109 @@
+import threading
+from time import time
+from logger import logger
+
+
+DISCONNECTED = "disconnected"
+AP = "ap"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+FAILED = "failed"
+
+# Which states may follow which. None is "not observed yet" (startup)
+TRANSITIONS = {
+    None: {DISCONNECTED, AP, CONNECTING, CONNECTED, FAILED},
+    DISCONNECTED: {AP, CONNECTING, CONNECTED},
+    AP: {CONNECTING, CONNECTED, DISCONNECTED},
+    CONNECTING: {CONNECTED, FAILED, AP, DISCONNECTED},
+    CONNECTED: {AP, CONNECTING, DISCONNECTED},
+    FAILED: {AP, CONNECTING, CONNECTED, DISCONNECTED},
+}
+
+# States in which the setup portal (index.html, captive DNS, scans) is served
+PORTAL_STATES = (AP, CONNECTING, FAILED)
+
+
+class ConnectivityState:
+    """
+    The one place that knows whether we're serving the setup portal,
+    connecting, connected and so on. Changed from the button thread, the
+    state watcher and the network job worker, so every transition happens
+    under a lock and is checked against TRANSITIONS.
+
+    - set(state, **info) is an explicit transition (e.g. the connect job),
+      info (ssid, ip, error) travels with the event
+    - observe(mode) feeds what NetworkManager reports ("ap", "connected",
+      "disconnected"). It's ignored while a connect is running, which owns
+      the state until it ends, and neither "disconnected" nor the hotspot
+      coming back ("ap") wipes out a failure
+    - listeners registered with add_listener(cb) get cb(event) for every
+      change, in the order the changes happened
+    """
+
+    def __init__(self):
+        self._state = None
+        self._info = {}
+        self._since = time()
+        self._version = 0
+        self._lock = threading.Lock()
+        self._dispatch = threading.RLock()  # Keeps listener calls in transition order
+        self._listeners = []
+
+    @property
+    def state(self):
+        return self._state
+
+    def in_portal(self):
+        return self._state in PORTAL_STATES
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def snapshot(self):
+        """The current state as the event dict listeners get"""
+        with self._lock:
+            return self._event(None)
+
+    def set(self, state, **info):
+        """Transition to `state`. False if it isn't allowed from the current one"""
+        with self._dispatch:
+            with self._lock:
+                current = self._state
+                if state == current and info == self._info:
+                    return True
+                if state != current and state not in TRANSITIONS[current]:
+                    logger.warning(f"[connectivity.py][Error] Ignoring transition {current} -> {state}")
+                    return False
+                self._state = state
+                self._info = info
+                self._since = time()
+                self._version += 1
+                event = self._event(current)
+
+            logger.info(f"[connectivity.py][Status] {current} -> {state}")
+            self._notify(event)
+            return True
+
+    def observe(self, mode):
+        with self._dispatch:
+            current = self._state
+            if current == CONNECTING or mode == current:
+                return False
+            if current == FAILED and mode in (DISCONNECTED, AP):
+                return False
+            return self.set(mode)
+
+    def _event(self, previous):
+        return dict(self._info, state=self._state, previous=previous,
+                    version=self._version, since=self._since)
+
+    def _notify(self, event):
+        for callback in tuple(self._listeners):  # One may be added meanwhile
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"[connectivity.py][Error] State listener failed: {e}")
+
+
+# Shared instance: app.py drives the LED from it, web_server.py the portal
+connectivity = ConnectivityState()
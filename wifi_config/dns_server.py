@@ -0,0 +1,113 @@
+import socket
+import threading
+from logger import logger
+
+
+class CaptiveDNS:
+    """
+    Minimal DNS responder for AP mode: every A query resolves to the AP's own
+    IP, so whatever a phone tries to open lands on the portal. AAAA and other
+    types get an empty answer, which makes clients fall back to IPv4 quickly.
+
+    Answers are built with dnslib once per distinct question and then replayed
+    from a cache with only the 2-byte transaction ID patched in.
+
+    Note: the NetworkManager hotspot (ipv4.method shared) runs its own dnsmasq
+    on port 53 of the AP address, which install.sh sets up to do the same job
+    (dnsmasq-shared.d/captive.conf), so this is off by default. Enabled, it
+    needs another port or dnsmasq kept off 53; if the port is taken start()
+    logs it and returns False.
+    """
+
+    def __init__(self, ip, port=53, host="0.0.0.0", ttl=10, cache_size=256):
+        self.ip = ip
+        self.port = port
+        self.host = host
+        self.ttl = ttl
+        self.cache_size = cache_size
+
+        self._cache = {}  # query minus ID -> response minus ID
+        self._sock = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return True
+        try:
+            import dnslib  # noqa: F401  (imported here, only AP mode needs it)
+        except ImportError:
+            logger.error("[dns_server.py][Error] dnslib is not installed, captive DNS disabled")
+            return False
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((self.host, self.port))
+        except OSError as e:
+            sock.close()
+            logger.warning(f"[dns_server.py][Status] Captive DNS not started, cannot bind {self.host}:{self.port}: {e}")
+            return False
+
+        self._sock = sock
+        self._cache.clear()
+        self._thread = threading.Thread(target=self._serve, args=(sock,), daemon=True)
+        self._thread.start()
+        logger.info(f"[dns_server.py][Status] Captive DNS answering {self.ip} on {self.host}:{self.port}")
+        return True
+
+    def stop(self):
+        if self._sock is None:
+            return
+        sock, self._sock = self._sock, None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)  # Wakes up the blocking recvfrom
+        except OSError:
+            pass
+        sock.close()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self._thread = None
+        logger.info("[dns_server.py][Status] Captive DNS stopped")
+
+    def _serve(self, sock):
+        while True:
+            try:
+                data, addr = sock.recvfrom(512)
+            except OSError:
+                return  # Socket closed by stop()
+            response = self.answer(data)
+            if response:
+                try:
+                    sock.sendto(response, addr)
+                except OSError:
+                    pass
+
+    def answer(self, data):
+        """Wire-format query in, wire-format response out (None to ignore it)"""
+        if len(data) < 12:
+            return None
+        key = data[2:]
+        cached = self._cache.get(key)
+        if cached is None:
+            cached = self._build(data)
+            if cached is None:
+                return None
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = cached
+        return data[:2] + cached
+
+    def _build(self, data):
+        from dnslib import DNSRecord, QTYPE, RR, A
+        try:
+            request = DNSRecord.parse(data)
+        except Exception:
+            return None
+        reply = request.reply()
+        if request.q.qtype in (QTYPE.A, QTYPE.ANY):
+            reply.add_answer(RR(request.q.qname, QTYPE.A, rdata=A(self.ip), ttl=self.ttl))
+        return reply.pack()[2:]
@@ -0,0 +1,165 @@
+import itertools
+import threading
+from collections import deque
+from time import monotonic
+from logger import logger
+
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobRejected(Exception):
+    """submit() refused the job: queue full or the caller is going too fast"""
+
+
+class Job:
+    __slots__ = ("id", "kind", "owner", "func", "state", "result", "error", "submitted", "_done")
+
+    def __init__(self, job_id, kind, func, owner=None):
+        self.id = job_id
+        self.kind = kind
+        self.owner = owner
+        self.func = func
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.submitted = monotonic()
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {"job_id": self.id, "kind": self.kind, "state": self.state}
+
+
+class JobQueue:
+    """
+    Runs everything that drives the radio (connect, scan, AP bring-up) one at
+    a time on a single worker thread, so two clients can never interleave
+    `nmcli con down` / `con up` sequences on the same interface.
+
+    - submit() returns immediately with a Job; call() blocks for the result
+    - replace=True cancels pending jobs of the same kind (latest wins);
+      a job that is already running is never interrupted
+    - at most `max_pending` jobs wait at once, and an owner (Socket.IO sid)
+      may submit a given kind at most once every `min_interval` seconds
+    - listeners registered with add_listener(cb) get cb(job) on every
+      state change
+    """
+
+    def __init__(self, max_pending=4, min_interval=2):
+        self.max_pending = max_pending
+        self.min_interval = min_interval
+
+        self.current = None
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._last_submit = {}  # (owner, kind) -> monotonic time
+        self._listeners = []
+        self._worker = None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def submit(self, kind, func, owner=None, replace=False):
+        with self._cond:
+            now = monotonic()
+            self._last_submit = {key: t for key, t in self._last_submit.items() if now - t < self.min_interval}
+            if owner is not None and (owner, kind) in self._last_submit:
+                raise JobRejected("Too many requests, please wait a moment")
+
+            replaced = []
+            if replace:
+                replaced = [job for job in self._pending if job.kind == kind]
+                for job in replaced:
+                    self._pending.remove(job)
+
+            if len(self._pending) >= self.max_pending:
+                raise JobRejected("Busy with other network operations, please try again")
+
+            job = Job(next(self._ids), kind, func, owner)
+            self._pending.append(job)
+            if owner is not None:
+                self._last_submit[(owner, kind)] = now
+
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+        for old in replaced:
+            logger.info(f"[jobs.py][Status] Job {old.id} ({old.kind}) replaced by job {job.id}")
+            self._finish(old, CANCELLED)
+        self._notify(job)
+        return job
+
+    def call(self, kind, func, timeout=None):
+        """Run func on the worker and wait for it. Re-raises what func raised"""
+        job = self.submit(kind, func)
+        if not job.wait(timeout):
+            raise TimeoutError(f"{kind} job {job.id} did not finish in {timeout} sec")
+        if job.state == FAILED:
+            raise job.error
+        if job.state == CANCELLED:
+            raise JobRejected(f"{kind} job {job.id} was cancelled")
+        return job.result
+
+    def cancel(self, job_id, owner=None):
+        """Cancel a pending job (only the owner's own, if owner is given)"""
+        with self._cond:
+            for job in self._pending:
+                if job.id == job_id and (owner is None or job.owner == owner):
+                    self._pending.remove(job)
+                    break
+            else:
+                return False
+        self._finish(job, CANCELLED)
+        return True
+
+    def position(self, job):
+        """0 = running, 1 = next, ... None if it is not queued anymore"""
+        with self._cond:
+            if self.current is job:
+                return 0
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                job = self.current = self._pending.popleft()
+                job.state = RUNNING
+            self._notify(job)
+
+            try:
+                job.result = job.func()
+                state = DONE
+            except Exception as e:
+                logger.error(f"[jobs.py][Error] Job {job.id} ({job.kind}) failed: {e}")
+                job.error = e
+                state = FAILED
+
+            with self._cond:
+                self.current = None
+            self._finish(job, state)
+
+    def _finish(self, job, state):
+        job.state = state
+        job._done.set()
+        self._notify(job)
+
+    def _notify(self, job):
+        for callback in self._listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"[jobs.py][Error] Job listener failed: {e}")
@@ -0,0 +1,312 @@
+"""
+Link-quality history: a background sampler reads signal, noise, bitrate
+and error counters straight from the kernel (/proc/net/wireless, sysfs,
+SIOCGIWRATE; no process per sample) into a fixed-size ring buffer that can
+live in an mmap'ed file, next to the connectivity state changes.
+"""
+import fcntl
+import mmap
+import os
+import socket
+import struct
+import threading
+from time import time
+from logger import logger
+from config import config
+from wifi_config import metrics
+from wifi_config.connectivity import connectivity, DISCONNECTED, AP, CONNECTING, CONNECTED, FAILED
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIOCGIWRATE = 0x8B21
+NO_VALUE = -32768  # level/noise not reported
+
+# One record: time, kind, event code, level dBm, noise dBm, link quality,
+# bitrate kbit/s, then cumulative counters (retries, missed beacons,
+# tx_packets, tx_errors, rx_packets, rx_dropped)
+RECORD = struct.Struct("<dBBhhHIIIIIII")
+SAMPLE = 0
+EVENT = 1
+COUNTERS = ("retries", "missed_beacons", "tx_packets", "tx_errors", "rx_packets", "rx_dropped")
+STATISTICS = ("tx_packets", "tx_errors", "rx_packets", "rx_dropped")
+
+EVENT_CODES = {DISCONNECTED: 1, AP: 2, CONNECTING: 3, CONNECTED: 4, FAILED: 5}
+EVENT_NAMES = {code: state for state, code in EVENT_CODES.items()}
+
+
+# ------------------------------------------- #
+# *************** Ring buffer *************** #
+# ------------------------------------------- #
+
+HEADER = struct.Struct("<4sHHIQ")  # magic, version, record size, capacity, records written
+HEADER_SIZE = 32
+MAGIC = b"WLQR"
+VERSION = 1
+
+
+class RingBuffer:
+    """
+    A fixed number of `record` structs, the oldest overwritten first. With a
+    path the array is an mmap'ed file of constant size: history survives a
+    restart and the SD card only sees the same pages written back by the
+    kernel, however long the service runs. A file with another layout is
+    started over.
+    """
+
+    def __init__(self, record, capacity, path=None):
+        self.record = record
+        self.capacity = capacity
+        self.path = path
+        self._lock = threading.Lock()
+
+        size = HEADER_SIZE + record.size * capacity
+        self._buffer = self._map(path, size) if path else bytearray(size)
+        magic, version, record_size, stored_capacity, written = HEADER.unpack_from(self._buffer)
+        if (magic, version, record_size, stored_capacity) != (MAGIC, VERSION, record.size, capacity):
+            written = 0
+            self._write_header(0)
+        self.written = written
+
+    @staticmethod
+    def _map(path, size):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)  # Different capacity: zero it rather than misread it
+                os.ftruncate(fd, size)
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _write_header(self, written):
+        HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, self.record.size, self.capacity, written)
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def append(self, *values):
+        with self._lock:
+            slot = self.written % self.capacity
+            self.record.pack_into(self._buffer, HEADER_SIZE + slot * self.record.size, *values)
+            self.written += 1
+            self._write_header(self.written)
+
+    def records(self):
+        """Every record as a tuple, oldest first"""
+        with self._lock:
+            data = self._buffer[HEADER_SIZE:HEADER_SIZE + len(self) * self.record.size]
+            if self.written > self.capacity:
+                cut = (self.written % self.capacity) * self.record.size
+                data = data[cut:] + data[:cut]
+        return self.record.iter_unpack(data)
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.flush()
+            self._buffer.close()
+
+
+# ------------------------------------------- #
+# ***************** Readers ***************** #
+# ------------------------------------------- #
+
+def read_wireless(interface):
+    """(link quality, level dBm, noise dBm, retries, missed beacons) from /proc/net/wireless, or None"""
+    try:
+        with open("/proc/net/wireless") as f:
+            for line in f:
+                name, _, values = line.partition(":")
+                if name.strip() != interface:
+                    continue
+                # status link level noise nwid crypt frag retry misc beacon
+                fields = values.split()
+                quality, level, noise = (int(float(value)) for value in fields[1:4])
+                if quality == 0 and level == 0:
+                    level = NO_VALUE  # Not associated
+                if noise <= -256 or noise == 0:
+                    noise = NO_VALUE
+                return quality, level, noise, int(fields[7]), int(fields[9])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_statistics(interface):
+    """The STATISTICS counters from /sys/class/net/<interface>/statistics"""
+    values = []
+    for name in STATISTICS:
+        try:
+            with open(f"/sys/class/net/{interface}/statistics/{name}") as f:
+                values.append(int(f.read()))
+        except (OSError, ValueError):
+            values.append(0)
+    return values
+
+
+def read_bitrate(sock, interface):
+    """Current TX bitrate in kbit/s (SIOCGIWRATE), 0 if the driver doesn't say"""
+    request = struct.pack("16s16s", interface.encode()[:15], b"")
+    try:
+        result = fcntl.ioctl(sock.fileno(), SIOCGIWRATE, request)
+    except OSError:
+        return 0
+    return max(0, struct.unpack_from("i", result, 16)[0]) // 1000
+
+
+# ------------------------------------------- #
+# ***************** Sampler ***************** #
+# ------------------------------------------- #
+
+class LinkSampler:
+    """
+    Samples the station interface every `interval` sec into a RingBuffer of
+    `capacity` records (persisted at `path`, memory only without one) and
+    records every connectivity state change alongside. history() is what
+    the portal's /api/link_quality route serves.
+    """
+
+    def __init__(self, interface, interval=10, capacity=8640, path=None):
+        self.interface = interface
+        self.interval = interval
+        self.capacity = max(1, capacity)
+        self.path = path
+
+        self.ring = None
+        self._sock = None
+        self._running = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        try:
+            self.ring = RingBuffer(RECORD, self.capacity, self.path)
+        except OSError as e:
+            logger.warning(f"[link_quality.py][Error] Can't keep history in {self.path}: {e}, keeping it in memory")
+            self.ring = RingBuffer(RECORD, self.capacity)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        connectivity.add_listener(self._on_state)
+
+        self._running = True
+        self._on_state(connectivity.snapshot())  # Where this stretch of history starts
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info(f"[link_quality.py][Status] Sampling {self.interface} every {self.interval:g} sec, "
+                    f"{len(self.ring)}/{self.capacity} samples of history")
+
+    def stop(self):
+        self._running = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.ring is not None:
+            self.ring.close()
+        if self._sock is not None:
+            self._sock.close()
+
+    def _on_state(self, event):
+        code = EVENT_CODES.get(event['state'])
+        if code and self._running:
+            self.ring.append(time(), EVENT, code, NO_VALUE, NO_VALUE, 0, 0, 0, 0, 0, 0, 0, 0)
+
+    def _run(self):
+        while self._running:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"[link_quality.py][Error] Sampling failed: {e}")
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        wireless = read_wireless(self.interface)
+        if wireless is None:
+            return None  # No such wireless interface (yet)
+        quality, level, noise, retries, missed = wireless
+        bitrate = read_bitrate(self._sock, self.interface) if level != NO_VALUE else 0
+        counters = [retries, missed] + read_statistics(self.interface)
+
+        values = (time(), SAMPLE, 0, level, noise, quality, bitrate) + tuple(value & 0xFFFFFFFF for value in counters)
+        self.ring.append(*values)
+        if level != NO_VALUE:
+            metrics.LINK_LEVEL_DBM.set(level)
+            metrics.LINK_BITRATE.set(bitrate * 1000)
+        return values
+
+    def history(self, seconds=3600, points=120):
+        """
+        The last `seconds` downsampled to at most `points` buckets: averages
+        (and the weakest level) of the readings, counters as increments per
+        bucket, plus the state changes in that window.
+        """
+        now = time()
+        since = now - seconds
+        width = seconds / points
+        buckets = {}
+        events = []
+        previous = None
+        previous_t = 0
+
+        for t, kind, code, level, noise, quality, bitrate, *counters in (self.ring.records() if self.ring else ()):
+            if kind == EVENT:
+                if t >= since:
+                    events.append({"t": round(t, 1), "state": EVENT_NAMES.get(code)})
+                continue
+
+            # Counters restart from 0 with the driver; skip deltas across a gap in sampling
+            if previous is None or t - previous_t > 3 * self.interval:
+                deltas = None
+            else:
+                deltas = [value - last if value >= last else value for value, last in zip(counters, previous)]
+            previous, previous_t = counters, t
+            if t < since:
+                continue
+
+            index = int((t - since) // width)
+            bucket = buckets.get(index)
+            if bucket is None:
+                bucket = buckets[index] = {"levels": [], "noise": [], "quality": [], "bitrate": [],
+                                           "counters": [0] * len(COUNTERS)}
+            if level != NO_VALUE:
+                bucket["levels"].append(level)
+                bucket["quality"].append(quality)
+                bucket["bitrate"].append(bitrate)
+            if noise != NO_VALUE:
+                bucket["noise"].append(noise)
+            if deltas:
+                bucket["counters"] = [total + delta for total, delta in zip(bucket["counters"], deltas)]
+
+        return {
+            "interface": self.interface,
+            "now": round(now, 1),
+            "seconds": seconds,
+            "bucket_seconds": width,
+            "points": [self._point(since + index * width, bucket) for index, bucket in sorted(buckets.items())],
+            "events": events,
+        }
+
+    @staticmethod
+    def _point(t, bucket):
+        def average(values):
+            return round(sum(values) / len(values), 1) if values else None
+
+        point = {
+            "t": round(t, 1),
+            "level": average(bucket["levels"]),
+            "level_min": min(bucket["levels"]) if bucket["levels"] else None,
+            "noise": average(bucket["noise"]),
+            "quality": average(bucket["quality"]),
+            "bitrate_kbps": average(bucket["bitrate"]),
+        }
+        point.update(zip(COUNTERS, bucket["counters"]))
+        return point
+
+
+def history_path(name):
+    """config.ini's [link_quality] file: relative to the project directory, empty = memory only"""
+    if not name:
+        return None
+    return os.path.join(PROJECT_DIR, name)
+
+
+# Shared instance: app.py starts it, web_server.py serves its history
+sampler = LinkSampler(config.station_interface, interval=config.link_quality_interval,
+                      capacity=config.link_quality_history, path=history_path(config.link_quality_file))
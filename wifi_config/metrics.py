@@ -0,0 +1,189 @@
+"""
+Tiny in-process metrics registry, rendered in the Prometheus text format
+on the web server's /metrics route. Recording is a dict update under a
+lock, cheap enough to leave on permanently.
+"""
+import os
+import resource
+import threading
+import time
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge:
+    """Either set() explicitly or backed by a function evaluated at scrape time"""
+
+    def __init__(self, name, help_text, func=None, kind="gauge"):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.func:
+            return [(self.name, (), self.func())]
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (("le", repr(float(bound))),), cumulative))
+            samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), entry[-1]))
+            samples.append((f"{self.name}_sum", key, entry[-2]))
+            samples.append((f"{self.name}_count", key, entry[-1]))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+
+
+def timed(histogram, **labels):
+    """Decorator: observe the wrapped function's duration in `histogram`"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------- #
+# ************* Process metrics ************* #
+# ------------------------------------------- #
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+# ------------------------------------------- #
+# ************* Shared metrics ************** #
+# ------------------------------------------- #
+
+SUBPROCESS_CALLS = Counter("wifi_subprocess_calls_total", "Processes spawned by NetworkManager, by command")
+SUBPROCESS_SECONDS = Histogram("wifi_subprocess_duration_seconds", "Time spent waiting on NetworkManager subprocesses")
+STAGE_SECONDS = Histogram("wifi_stage_duration_seconds", "Per-stage timing of connect_to_wifi and setup_ap")
+HANDLER_SECONDS = Histogram("wifi_socketio_handler_duration_seconds", "Socket.IO event handler durations")
+MONITOR_TICK_SECONDS = Histogram("wifi_monitor_tick_duration_seconds", "Duration of one network state check")
+THREAD_WAKEUPS = Counter("wifi_thread_wakeups_total", "Wakeups of the LED and button threads")
+RSS_BYTES = Gauge("process_resident_memory_bytes", "Resident memory size in bytes", func=_rss_bytes)
+CPU_SECONDS = Gauge("process_cpu_seconds_total", "User and system CPU time spent in seconds", func=_cpu_seconds, kind="counter")
+THREADS = Gauge("process_threads", "Number of Python threads", func=threading.active_count)
+WATCHDOG_PROBES = Counter("wifi_watchdog_probes_total", "Upstream reachability probes by the connectivity watchdog, by result")
+WATCHDOG_ACTIONS = Counter("wifi_watchdog_actions_total", "Reconnects and AP fallbacks started by the watchdog, by action and result")
+OUTAGE_SECONDS = Gauge("wifi_watchdog_outage_seconds", "How long the current outage has lasted, 0 when online")
+RECOVERY_SECONDS = Histogram("wifi_watchdog_recovery_seconds", "Time from detecting an outage to being back online, by how it recovered",
+                             buckets=(5, 10, 30, 60, 120, 300, 600, 1800, 3600, 14400))
+LINK_LEVEL_DBM = Gauge("wifi_link_level_dbm", "Signal level of the station link at the last sample")
+LINK_BITRATE = Gauge("wifi_link_bitrate_bps", "TX bitrate of the station link at the last sample")
@@ -0,0 +1,158 @@
+"""
+In-process interface address lookup. Reads addresses straight from the
+kernel (rtnetlink, with SIOCGIFADDR and /proc/net/if_inet6 as fallbacks)
+so asking for an IP never spawns a process.
+"""
+import fcntl
+import ipaddress
+import socket
+import struct
+
+# rtnetlink constants (linux/netlink.h, linux/rtnetlink.h, linux/if_addr.h)
+NETLINK_ROUTE = 0
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+SIOCGIFADDR = 0x8915
+
+_NLMSG_HEADER = struct.Struct("=LHHLL")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTATTR = struct.Struct("=HH")
+
+FAMILIES = {socket.AF_INET: "ipv4", socket.AF_INET6: "ipv6"}
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _netlink_addresses():
+    """Yield (ifindex, family, address, prefixlen) for every address on the system"""
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        request = _IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        sock.send(_NLMSG_HEADER.pack(_NLMSG_HEADER.size + len(request), RTM_GETADDR,
+                                     NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + _NLMSG_HEADER.size <= len(data):
+                msg_len, msg_type, _, _, _ = _NLMSG_HEADER.unpack_from(data, offset)
+                if msg_type == NLMSG_DONE:
+                    return
+                if msg_type == NLMSG_ERROR:
+                    raise OSError("netlink RTM_GETADDR dump failed")
+                if msg_type == RTM_NEWADDR:
+                    yield from _parse_newaddr(data, offset + _NLMSG_HEADER.size, offset + msg_len)
+                if msg_len == 0:
+                    break
+                offset += _align(msg_len)
+
+
+def _parse_newaddr(data, start, end):
+    family, prefixlen, _, _, index = _IFADDRMSG.unpack_from(data, start)
+    if family not in FAMILIES:
+        return
+
+    attrs = {}
+    offset = start + _IFADDRMSG.size
+    while offset + _RTATTR.size <= end:
+        rta_len, rta_type = _RTATTR.unpack_from(data, offset)
+        if rta_len < _RTATTR.size:
+            break
+        attrs[rta_type] = data[offset + _RTATTR.size:offset + rta_len]
+        offset += _align(rta_len)
+
+    # On point-to-point links IFA_ADDRESS is the peer, IFA_LOCAL is ours
+    raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+    if raw:
+        yield index, FAMILIES[family], socket.inet_ntop(family, raw), prefixlen
+
+
+def _ioctl_ipv4(ifname):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        ifreq = struct.pack("256s", ifname.encode()[:15])
+        try:
+            result = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, ifreq)
+        except OSError:
+            return []  # EADDRNOTAVAIL: interface has no IPv4 address
+    return [{"family": "ipv4", "address": socket.inet_ntoa(result[20:24]), "prefixlen": None}]
+
+
+def _proc_ipv6(ifname):
+    addresses = []
+    try:
+        with open("/proc/net/if_inet6") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 6 and fields[5] == ifname:
+                    address = ipaddress.IPv6Address(bytes.fromhex(fields[0]))
+                    addresses.append({"family": "ipv6", "address": str(address), "prefixlen": int(fields[2], 16)})
+    except OSError:
+        pass
+    return addresses
+
+
+# ------------------------------------------- #
+# *************** Public API **************** #
+# ------------------------------------------- #
+
+def get_addresses(ifname):
+    """
+    Return every IPv4/IPv6 address of `ifname` as a list of
+    {"family", "address", "prefixlen"} dicts, IPv4 first.
+    Raises OSError if the interface doesn't exist.
+    """
+    index = socket.if_nametoindex(ifname)
+    try:
+        addresses = [
+            {"family": family, "address": address, "prefixlen": prefixlen}
+            for if_index, family, address, prefixlen in _netlink_addresses()
+            if if_index == index
+        ]
+    except OSError:
+        # No netlink (e.g. restricted sandbox): primary IPv4 via ioctl + procfs for IPv6
+        addresses = _ioctl_ipv4(ifname) + _proc_ipv6(ifname)
+
+    addresses.sort(key=lambda a: a["family"] != "ipv4")
+    return addresses
+
+
+def get_ipv4(ifname):
+    """First IPv4 address of `ifname`, or "" if it has none (or doesn't exist)"""
+    try:
+        addresses = get_addresses(ifname)
+    except OSError:
+        return ""
+    for address in addresses:
+        if address["family"] == "ipv4":
+            return address["address"]
+    return ""
+
+
+def first_ipv4(skip=("lo",)):
+    """First IPv4 address on any interface, like `hostname -I | awk '{print $1}'`"""
+    try:
+        skip_index = {socket.if_nametoindex(ifname) for _, ifname in socket.if_nameindex() if ifname in skip}
+        for index, family, address, _ in _netlink_addresses():
+            if family == "ipv4" and index not in skip_index:
+                return address
+        return ""
+    except OSError:
+        for _, ifname in socket.if_nameindex():
+            addresses = [] if ifname in skip else _ioctl_ipv4(ifname)
+            if addresses:
+                return addresses[0]["address"]
+        return ""
+
+
+def available():
+    """True on Linux, where rtnetlink/SIOCGIFADDR are there to read addresses in-process"""
+    return hasattr(socket, "AF_NETLINK")
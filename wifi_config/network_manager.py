@@ -1,157 +1,897 @@
+import json
+import os
 import subprocess
-from time import sleep
+import threading
+from contextlib import contextmanager
+from time import sleep, monotonic
 from logger import logger
+from wifi_config import netif
+from wifi_config import metrics
+
+# Overall deadline (sec) for connect_to_wifi
+CONNECT_TIMEOUT = 45
+
+# Substrings of `nmcli con up` errors -> what we tell the user
+AUTH_FAILURE = "wrong password"
+CONNECT_FAILURE_HINTS = [
+    ("secrets were required", AUTH_FAILURE),
+    ("no network with ssid", "network not found"),
+    ("could not be found", "network not found"),
+    ("ssid not found", "network not found"),
+    ("timeout", "timed out waiting for the network"),
+    ("dhcp", "no IP address received (DHCP failed)"),
+]
+
+# setup_ap: overall deadline (sec), extra activation attempts and pause between them
+AP_TIMEOUT = 30
+AP_RETRIES = 2
+AP_RETRY_DELAY = 1
+
+# Per-profile settings read with `nmcli con show uuid ...` (nmcli can't list them)
+PROFILE_DETAILS = "connection.uuid,connection.interface-name,802-11-wireless.ssid,802-11-wireless-security.key-mgmt"
+
+# Station profiles this tool created, least recently used first, and how many to keep
+MANAGED_PROFILES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "managed_profiles.json")
+MAX_MANAGED_PROFILES = 10
+
+# Fields requested from `nmcli dev wifi list`, in this order
+SCAN_FIELDS = ("SSID", "SECURITY", "SIGNAL", "CHAN", "FREQ", "BSSID", "RATE")
+
+
+# ------------------------------------------- #
+# *************** Scan parsing ************** #
+# ------------------------------------------- #
+
+def split_terse(line):
+    """Split one `nmcli -t` line into fields, undoing the \\: and \\\\ escapes"""
+    if "\\" not in line:
+        return line.split(":")
+    # Park the escapes on characters that can't occur in nmcli output, so the
+    # split itself stays a single C-level call (BSSIDs are always escaped)
+    fields = line.replace("\\\\", "\0").replace("\\:", "\1").split(":")
+    return [field.replace("\1", ":").replace("\0", "\\") for field in fields]
+
+
+def _band(freq):
+    """e.g. 5180 MHz -> 5 GHz"""
+    try:
+        mhz = int(freq.split()[0])
+    except (ValueError, IndexError):
+        return None
+    if mhz < 3000:
+        return "2.4 GHz"
+    if mhz < 5925:
+        return "5 GHz"
+    return "6 GHz"
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def parse_scan(lines, fields=SCAN_FIELDS):
+    """
+    Turn `nmcli -t -f <fields> dev wifi list` lines (any iterable, e.g. a
+    pipe) into one entry per SSID: the strongest BSSID's details, how many
+    BSSIDs were seen and on which bands. Sorted strongest first.
+    """
+    index = {name: i for i, name in enumerate(fields)}
+    i_ssid, i_security, i_signal = index["SSID"], index["SECURITY"], index["SIGNAL"]
+    i_chan, i_freq, i_bssid, i_rate = index["CHAN"], index["FREQ"], index["BSSID"], index["RATE"]
+    count = len(fields)
+
+    networks = {}
+    for line in lines:
+        values = split_terse(line.rstrip("\n"))
+        if len(values) != count or not values[i_ssid]:
+            continue  # Hidden networks (empty SSID) and malformed lines
+
+        ssid = values[i_ssid]
+        signal = _int(values[i_signal])
+        band = _band(values[i_freq])
+        network = networks.get(ssid)
+        if network is None:
+            network = networks[ssid] = {"ssid": ssid, "signal": -1, "bssids": 0, "bands": []}
+        network["bssids"] += 1
+        if band and band not in network["bands"]:
+            network["bands"].append(band)
+        if signal > network["signal"]:
+            network.update(
+                security=values[i_security] or "Open",
+                signal=signal,
+                channel=_int(values[i_chan]),
+                frequency=values[i_freq],
+                bssid=values[i_bssid],
+                rate=values[i_rate],
+            )
+
+    for network in networks.values():
+        network["bands"].sort()
+    return sorted(networks.values(), key=lambda n: (-n["signal"], n["ssid"].lower()))
+
+
+class APResult:
+    """Outcome of NetworkManager.setup_ap(). Truthy when the AP is up"""
+    __slots__ = ("success", "elapsed", "reason", "attempts")
+
+    def __init__(self, success, elapsed, reason=None, attempts=1):
+        self.success = success
+        self.elapsed = elapsed
+        self.reason = reason
+        self.attempts = attempts
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f"APResult(success={self.success!r}, elapsed={self.elapsed:.2f}, reason={self.reason!r}, attempts={self.attempts!r})"
+
+
+class NetworkState:
+    """
+    Immutable snapshot of the Wi-Fi interface(s) as seen by one `nmcli dev show` call.
+    mode is "ap", "connected" or "disconnected"; ssid is the name of the
+    active connection profile (profiles are named after their SSID).
+    ap_active/ap_ip describe the hotspot, which in concurrent mode can be
+    up next to a connected station.
+    """
+    __slots__ = ("mode", "ssid", "ip", "device_state", "timestamp", "ap_active", "ap_ip")
+
+    def __init__(self, mode, ssid, ip, device_state, timestamp, ap_active=False, ap_ip=""):
+        object.__setattr__(self, "mode", mode)
+        object.__setattr__(self, "ssid", ssid)
+        object.__setattr__(self, "ip", ip)
+        object.__setattr__(self, "device_state", device_state)
+        object.__setattr__(self, "timestamp", timestamp)
+        object.__setattr__(self, "ap_active", ap_active)
+        object.__setattr__(self, "ap_ip", ap_ip)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("NetworkState is immutable")
+
+    def __repr__(self):
+        return (f"NetworkState(mode={self.mode!r}, ssid={self.ssid!r}, ip={self.ip!r}, "
+                f"device_state={self.device_state!r}, ap_active={self.ap_active!r})")
+
+
+class ConnectionProfile:
+    """
+    One NetworkManager connection profile as listed by `nmcli con show`.
+    Wi-Fi profiles also carry the interface they are bound to and their
+    key management ("" for an open network).
+    """
+    __slots__ = ("name", "uuid", "type", "ssid", "interface", "key_mgmt")
+
+    def __init__(self, name, uuid, type, ssid, interface="", key_mgmt=""):
+        self.name = name
+        self.uuid = uuid
+        self.type = type
+        self.ssid = ssid
+        self.interface = interface
+        self.key_mgmt = key_mgmt
+
+    def __repr__(self):
+        return f"ConnectionProfile(name={self.name!r}, uuid={self.uuid!r}, ssid={self.ssid!r})"
+
+
+class ProfileIndex:
+    """All profiles from one nmcli call, looked up by exact SSID or UUID"""
+
+    def __init__(self, profiles, timestamp):
+        self.timestamp = timestamp
+        self.by_uuid = {}
+        self.by_ssid = {}
+        for profile in profiles:
+            self.add(profile)
+
+    def add(self, profile):
+        self.by_uuid[profile.uuid] = profile
+        if profile.type == "802-11-wireless" and profile.ssid:
+            self.by_ssid.setdefault(profile.ssid, []).append(profile)
+
+    def wifi(self, ssid):
+        return self.by_ssid.get(ssid, [])
+
 
 class NetworkManager:
+    HOTSPOT_NAME = "hotspot"
+    ap_ip = "10.10.1.1"  # Overridden from config.ini ([access_point] ap_ip)
+    use_netif = netif.available()
+
+    # Interfaces, from config.ini ([network] interface, [access_point] interface).
+    # The same interface for both means the hotspot has to go down to connect.
+    station_interface = "wlan0"
+    ap_interface = "wlan0"
+    _ap_interface_ready = False
+
+    # Snapshot cache, configurable from config.ini ([network] snapshot_ttl)
+    snapshot_ttl = 1.0
+    _snapshot = None
+    _snapshot_lock = threading.Lock()
+
+    # Profile index cache; dropped whenever we add, modify or delete a profile
+    profiles_ttl = 60
+    managed_profiles_path = MANAGED_PROFILES_FILE
+    _profiles = None
+    _profiles_lock = threading.Lock()
+
+    @staticmethod
+    def _run(cmd, **kwargs):
+        """subprocess.run, counted and timed per command for /metrics"""
+        label = NetworkManager._command_label(cmd)
+        metrics.SUBPROCESS_CALLS.inc(command=label)
+        with metrics.SUBPROCESS_SECONDS.time(command=label):
+            return subprocess.run(cmd, **kwargs)
+
+    @staticmethod
+    @contextmanager
+    def _stream(cmd):
+        """Like _run, but yields the process's stdout lines as they arrive"""
+        label = NetworkManager._command_label(cmd)
+        metrics.SUBPROCESS_CALLS.inc(command=label)
+        with metrics.SUBPROCESS_SECONDS.time(command=label):
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as process:
+                yield process.stdout
+
+    @staticmethod
+    def _command_label(cmd):
+        """e.g. "nmcli con up" for ["nmcli", "--wait", "30", "con", "up", "Home"]"""
+        if isinstance(cmd, str):
+            return cmd.split(' ', 1)[0]
+        words = [cmd[0]]
+        skip = False
+        for arg in cmd[1:]:
+            if skip:
+                skip = False
+            elif arg in ("-f", "--wait"):
+                skip = True
+            elif not arg.startswith('-'):
+                words.append(arg)
+                if len(words) == 3:
+                    break
+        return " ".join(words)
+
     @staticmethod
     def scan_wifi():
-        """Scan for available WiFi networks and return list of {ssid, security} dicts"""
+        """
+        Rescan and return one dict per SSID, strongest first:
+        {ssid, security, signal, channel, frequency, bssid, rate, bands, bssids}
+        """
         logger.info("[net..._manager.py][Action] Scanning for WiFi networks...")
-        
-        # Use terse output for easier parsing: SSID:SECURITY
-        result = subprocess.run(
-            ["nmcli", "-t", "-f", "SSID,SECURITY", "dev", "wifi", "list", "--rescan", "yes"],
+
+        # Terse output, parsed line by line straight off the pipe
+        cmd = ["nmcli", "-t", "-f", ",".join(SCAN_FIELDS), "dev", "wifi", "list", "--rescan", "yes"]
+        with NetworkManager._stream(cmd) as lines:
+            networks = parse_scan(lines)
+
+        logger.info(f"[net..._manager.py][Result] Found {len(networks)} unique networks")
+        return networks
+
+    @staticmethod
+    @metrics.timed(metrics.STAGE_SECONDS, operation="setup_ap", stage="total")
+    def setup_ap(timeout=AP_TIMEOUT, retries=AP_RETRIES):
+        """
+        Bring the predefined hotspot up and return an APResult.
+
+        Skips the down step when the hotspot isn't active, returns straight
+        away if it's already up with `ap_ip` bound, and otherwise waits for
+        NetworkManager to finish activation and for `ap_ip` to show up.
+
+        Without a second interface a failed activation moves the hotspot
+        back onto the station interface (once per run) before retrying, in
+        case concurrent mode left it bound elsewhere.
+        """
+        start = monotonic()
+        deadline = start + timeout
+
+        if NetworkManager.concurrent():
+            error = NetworkManager._prepare_ap_interface()
+            if error:
+                logger.error(f"[net..._manager.py][Result] Failed to set up Access Point: {error}")
+                return APResult(False, monotonic() - start, error, attempts=0)
+
+        state = NetworkManager.snapshot(max_age=0)
+        if state.ap_active:
+            if state.ap_ip == NetworkManager.ap_ip:
+                logger.info("[net..._manager.py][Result] Access Point already up.")
+                return APResult(True, monotonic() - start, attempts=0)
+            # Active but not (yet) serving on ap_ip: restart it
+            logger.info("[net..._manager.py][Action] Hotspot active without AP IP, turning it down first...")
+            with metrics.STAGE_SECONDS.time(operation="setup_ap", stage="hotspot_down"):
+                NetworkManager._run(
+                    ["nmcli", "--wait", str(NetworkManager._remaining(deadline)), "con", "down", NetworkManager.HOTSPOT_NAME],
+                    capture_output=True,
+                    text=True
+                )
+
+        reason = None
+        attempt = 0
+        while attempt <= retries and monotonic() < deadline:
+            attempt += 1
+            logger.info(f"[net..._manager.py][Action] Turning predefined AP up (attempt {attempt}/{retries + 1}) ...")
+            with metrics.STAGE_SECONDS.time(operation="setup_ap", stage="activate"):
+                result = NetworkManager._run(
+                    ["nmcli", "--wait", str(NetworkManager._remaining(deadline)), "con", "up", NetworkManager.HOTSPOT_NAME,
+                     "ifname", NetworkManager.ap_interface],
+                    capture_output=True,
+                    text=True
+                )
+            NetworkManager.invalidate_snapshot()
+
+            if result.returncode != 0:
+                reason = result.stderr.strip() or f"nmcli exited with {result.returncode}"
+                logger.warning(f"[net..._manager.py][Result] Hotspot activation failed: {reason}")
+                if not NetworkManager.concurrent() and not NetworkManager._ap_interface_ready:
+                    error = NetworkManager._bind_hotspot()
+                    if not error:
+                        continue  # Retry straight away, that may well have been the reason
+                    logger.warning(f"[net..._manager.py][Result] {error}")
+                sleep(min(AP_RETRY_DELAY, max(0, deadline - monotonic())))
+                continue
+
+            with metrics.STAGE_SECONDS.time(operation="setup_ap", stage="ip_bound"):
+                bound = NetworkManager._wait_for_ap_ip(deadline)
+            if bound:
+                elapsed = monotonic() - start
+                logger.info(f"[net..._manager.py][Result] Access Point set up successfully in {elapsed:.1f} sec.")
+                return APResult(True, elapsed, attempts=attempt)
+            reason = f"AP IP {NetworkManager.ap_ip} not bound"
+
+        elapsed = monotonic() - start
+        reason = reason or "timed out"
+        logger.error(f"[net..._manager.py][Result] Failed to set up Access Point after {elapsed:.1f} sec: {reason}")
+        return APResult(False, elapsed, reason, attempt)
+
+    @staticmethod
+    def _wait_for_ap_ip(deadline, interval=0.25):
+        while True:
+            state = NetworkManager.snapshot(max_age=0)
+            if state.ap_active and state.ap_ip == NetworkManager.ap_ip:
+                return True
+            if monotonic() >= deadline:
+                return False
+            sleep(interval)
+
+    @staticmethod
+    def stop_ap(timeout=AP_TIMEOUT):
+        """Take the hotspot down if it's up. True when it is down"""
+        if not NetworkManager.snapshot(max_age=0).ap_active:
+            return True
+        logger.info("[net..._manager.py][Action] Turning the hotspot down...")
+        result = NetworkManager._run(
+            ["nmcli", "--wait", str(max(1, int(timeout))), "con", "down", NetworkManager.HOTSPOT_NAME],
+            capture_output=True,
+            text=True
+        )
+        NetworkManager.invalidate_snapshot()
+        if result.returncode != 0:
+            logger.warning(f"[net..._manager.py][Result] Hotspot could not be turned down: {result.stderr.strip()}")
+            return False
+        return True
+
+    @staticmethod
+    def concurrent():
+        """True when the hotspot has its own interface and can stay up while connecting"""
+        return NetworkManager.ap_interface != NetworkManager.station_interface
+
+    @staticmethod
+    def _prepare_ap_interface():
+        """
+        Concurrent mode: make sure the AP interface exists (a virtual one on
+        the station's radio is created with `iw`, a second adapter just has
+        to be plugged in) and bind the hotspot profile to it. Once per run,
+        returns an error message or None.
+        """
+        if NetworkManager._ap_interface_ready:
+            return None
+        ap, station = NetworkManager.ap_interface, NetworkManager.station_interface
+
+        if not os.path.exists(f"/sys/class/net/{ap}"):
+            logger.info(f"[net..._manager.py][Action] Creating virtual AP interface {ap} on {station}...")
+            result = NetworkManager._run(
+                ["iw", "dev", station, "interface", "add", ap, "type", "__ap"],
+                capture_output=True,
+                text=True
+            )
+            if result.returncode != 0:
+                return f"could not create {ap}: {result.stderr.strip() or 'iw failed'}"
+
+        return NetworkManager._bind_hotspot()
+
+    @staticmethod
+    def _bind_hotspot():
+        """
+        Bind the hotspot profile to ap_interface. The binding is saved with
+        the profile, so a run without a second interface has to move it
+        back. Once per run, returns an error message or None.
+        """
+        ap = NetworkManager.ap_interface
+        logger.info(f"[net..._manager.py][Action] Binding the hotspot to {ap}...")
+        result = NetworkManager._run(
+            ["nmcli", "con", "modify", NetworkManager.HOTSPOT_NAME, "connection.interface-name", ap],
             capture_output=True,
             text=True
         )
+        if result.returncode != 0:
+            return f"could not bind the hotspot to {ap}: {result.stderr.strip()}"
+
+        NetworkManager._ap_interface_ready = True
+        return None
+
+    @staticmethod
+    @metrics.timed(metrics.STAGE_SECONDS, operation="connect", stage="total")
+    def connect_to_wifi(ssid, password, on_progress=None, timeout=CONNECT_TIMEOUT):
+        """
+        Connect the station interface to `ssid` and return (success, message).
+
+        Instead of fixed sleeps every step waits on the real thing (nmcli --wait,
+        device state, DHCP lease) within one overall `timeout`. on_progress(stage, detail)
+        is called for each stage: hotspot_down, profile_ready, associating, got_ip.
+
+        In concurrent mode the hotspot stays up (no hotspot_down stage), so a
+        failure can be reported to the phone; call stop_ap() once it has been.
+        """
+        start = monotonic()
+        deadline = start + timeout
+        stage_start = [start]
+
+        def progress(stage, detail=""):
+            now = monotonic()
+            metrics.STAGE_SECONDS.observe(now - stage_start[0], operation="connect", stage=stage)
+            stage_start[0] = now
+            logger.info(f"[net..._manager.py][Progress] {stage} {detail}".rstrip() + f" (+{now - start:.1f} sec)")
+            if on_progress:
+                on_progress(stage, detail)
+
+        # First, bring down the hotspot if it shares the interface
+        if NetworkManager.concurrent():
+            logger.info(f"[net..._manager.py][Action] Keeping hotspot up on {NetworkManager.ap_interface} while connecting...")
+        else:
+            NetworkManager.stop_ap(NetworkManager._remaining(deadline))
+            progress("hotspot_down")
         
-        networks = []
-        seen_ssids = set()
+        # Exact-SSID lookup, then create the profile or update its credentials
+        uuid, error = NetworkManager._ensure_profile(ssid, password)
+        if uuid is None:
+            return False, error
         
-        for line in result.stdout.strip().split('\n'):
-            if not line:
-                continue
-            
-            # Format is SSID:SECURITY (but SSID could contain colons, so split from right)
-            parts = line.rsplit(':', 1)
-            if len(parts) == 2:
-                ssid = parts[0].strip()
-                ssid = ssid.replace('\\:', ':')  # Unescape nmcli's escaped colons, iof there's say some spl funky SSID
-                security = parts[1].strip() if parts[1].strip() else "Open"
-                
-                # Skip empty SSIDs and duplicates
-                if ssid and ssid not in seen_ssids:
-                    seen_ssids.add(ssid)
-                    networks.append({"ssid": ssid, "security": security})
+        progress("profile_ready")
         
-        # Sort by SSID name (case-insensitive)
-        networks.sort(key=lambda x: x["ssid"].lower())
+        # Now activate the connection. --wait makes nmcli return as soon as
+        # NetworkManager reports the activation as done or failed.
+        progress("associating", ssid)
+        result = NetworkManager._run(
+            ["nmcli", "--wait", str(NetworkManager._remaining(deadline)), "con", "up", "uuid", uuid,
+             "ifname", NetworkManager.station_interface],
+            capture_output=True,
+            text=True
+        )
+        NetworkManager.invalidate_snapshot()
         
-        logger.info(f"[net..._manager.py][Result] Found {len(networks)} unique networks")
-        return networks
+        if result.returncode != 0:
+            reason = NetworkManager._failure_reason(result.stderr)
+            logger.error(f"[net..._manager.py][Result] Failed to connect to {ssid}: {reason} after {monotonic() - start:.1f} sec")
+            logger.error(f"[net..._manager.py][Result] nmcli stderr: {result.stderr.strip()}")
+            return False, f"Failed to connect to {ssid}: {reason}"
+
+        # Activation done, confirm the device is connected and has a lease
+        ip = NetworkManager._wait_for_ip(deadline)
+        if not ip:
+            logger.error(f"[net..._manager.py][Result] Failed to connect to {ssid}: no IP address within {timeout} sec")
+            return False, f"Failed to connect to {ssid}: no IP address received"
+        progress("got_ip", ip)
+
+        # Drop our leftover duplicates for this SSID (and the oldest of the rest)
+        NetworkManager.prune_profiles(keep=uuid)
+
+        # Success
+        logger.info(f"[net..._manager.py][Result] Successfully connected to {ssid} in {monotonic() - start:.1f} sec")
+        return True, f"Connected successfully to {ssid}"
 
     @staticmethod
-    def setup_ap():
-        logger.info("[net..._manager.py][Result] Turning predefined AP down, even though it maybe down... [wait 5 sec ...]")
-        subprocess.run(["nmcli", "con", "down", "hotspot"], check=False)
-        sleep(5)
-        logger.info("[net..._manager.py][Result] Turning predefined AP up ... [wait 5 sec ...]")
-        try:
-            subprocess.run(["nmcli", "con", "up", "hotspot"], check=True)
-            sleep(5)
-            logger.info("[net..._manager.py][Result] Access Point set up successfully.")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"[net..._manager.py][Result] Failed to set up Access Point: {e}")
-    
-    
+    def _remaining(deadline):
+        """Whole seconds left until deadline, as nmcli --wait wants them (at least 1)"""
+        return max(1, int(deadline - monotonic()))
+
     @staticmethod
-    def connect_to_wifi(ssid, password):
-        # First, bring down the hotspot if it's active
-        logger.info("[net..._manager.py][Action] Bringing down hotspot before connecting to WiFi...")
-        subprocess.run(["nmcli", "con", "down", "hotspot"], check=False)
-        sleep(3)
-        
-        # Check if a connection profile already exists for this SSID
-        logger.info(f"[net..._manager.py][Action] Checking for existing connection to {ssid}...")
-        check_result = subprocess.run(
-            ["nmcli", "-t", "-f", "NAME", "con", "show"],
+    def _wait_for_ip(deadline, interval=0.25):
+        while True:
+            state = NetworkManager.snapshot(max_age=0)
+            if state.mode == "connected" and state.ip:
+                return state.ip
+            if monotonic() >= deadline:
+                return None
+            sleep(interval)
+
+    @staticmethod
+    def _failure_reason(stderr):
+        message = stderr.lower()
+        for hint, reason in CONNECT_FAILURE_HINTS:
+            if hint in message:
+                return reason
+        return stderr.strip() or "unknown error"
+
+    @staticmethod
+    @metrics.timed(metrics.STAGE_SECONDS, operation="reconnect", stage="total")
+    def activate_profile(profile, timeout=CONNECT_TIMEOUT):
+        """
+        Bring a saved ConnectionProfile up on the station interface and return
+        (success, message), like connect_to_wifi but without touching the
+        credentials. A hotspot sharing the interface goes down first.
+        """
+        start = monotonic()
+        deadline = start + timeout
+
+        if not NetworkManager.concurrent():
+            NetworkManager.stop_ap(NetworkManager._remaining(deadline))
+
+        logger.info(f"[net..._manager.py][Action] Activating saved connection {profile.name}...")
+        result = NetworkManager._run(
+            ["nmcli", "--wait", str(NetworkManager._remaining(deadline)), "con", "up", "uuid", profile.uuid,
+             "ifname", NetworkManager.station_interface],
             capture_output=True,
             text=True
         )
-        
-        connection_exists = ssid in check_result.stdout
-        
-        if not connection_exists:
-            # Create new connection profile
-            # Check if this is an open network (no password) or secured network
+        NetworkManager.invalidate_snapshot()
+
+        if result.returncode != 0:
+            reason = NetworkManager._failure_reason(result.stderr)
+            logger.error(f"[net..._manager.py][Result] Failed to activate {profile.name}: {reason} after {monotonic() - start:.1f} sec")
+            return False, f"Failed to connect to {profile.ssid}: {reason}"
+
+        if not NetworkManager._wait_for_ip(deadline):
+            logger.error(f"[net..._manager.py][Result] Failed to activate {profile.name}: no IP address within {timeout} sec")
+            return False, f"Failed to connect to {profile.ssid}: no IP address received"
+
+        logger.info(f"[net..._manager.py][Result] Reconnected to {profile.ssid} in {monotonic() - start:.1f} sec")
+        return True, f"Connected successfully to {profile.ssid}"
+
+
+    # ------------------------------------------- #
+    # ************ Connection profiles ********** #
+    # ------------------------------------------- #
+
+    @staticmethod
+    def profiles(max_age=None):
+        """
+        ProfileIndex of all connection profiles, cached for `profiles_ttl`
+        seconds. nmcli only lists NAME/UUID/TYPE-style fields, so the SSIDs
+        (and interface, key management) of the Wi-Fi profiles come from a
+        second call covering all of them.
+        """
+        if max_age is None:
+            max_age = NetworkManager.profiles_ttl
+
+        with NetworkManager._profiles_lock:
+            cached = NetworkManager._profiles
+            if cached is not None and monotonic() - cached.timestamp <= max_age:
+                return cached
+
+            result = NetworkManager._run(
+                ["nmcli", "-t", "-f", "NAME,UUID,TYPE", "con", "show"],
+                capture_output=True,
+                text=True
+            )
+            rows = [fields[:3] for fields in map(split_terse, result.stdout.splitlines()) if len(fields) >= 3]
+            details = NetworkManager._profile_details([uuid for _, uuid, kind in rows if kind == "802-11-wireless"])
+
+            profiles = []
+            for name, uuid, kind in rows:
+                settings = details.get(uuid, {})
+                # A profile whose SSID couldn't be read is matched by name (how this tool names them)
+                profiles.append(ConnectionProfile(name, uuid, kind, settings.get("802-11-wireless.ssid", name),
+                                                  settings.get("connection.interface-name", ""),
+                                                  settings.get("802-11-wireless-security.key-mgmt", "")))
+
+            index = NetworkManager._profiles = ProfileIndex(profiles, monotonic())
+            return index
+
+    @staticmethod
+    def _profile_details(uuids):
+        """
+        uuid -> {setting: value} for these Wi-Fi profiles (SSID, interface,
+        key management), with a single `nmcli con show uuid A uuid B ...`.
+        A profile without security has no key-mgmt entry.
+        """
+        if not uuids:
+            return {}
+        cmd = ["nmcli", "-t", "-f", PROFILE_DETAILS, "con", "show"]
+        for uuid in uuids:
+            cmd += ["uuid", uuid]
+        result = NetworkManager._run(cmd, capture_output=True, text=True)
+
+        # A profile deleted since the listing fails the call, the others are still printed
+        details = {}
+        settings = None
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition(":")
+            if "\\" in value:
+                value = value.replace("\\:", ":").replace("\\\\", "\\")
+            if key == "connection.uuid":
+                settings = details[value] = {}
+            elif settings is not None and key:
+                settings[key] = value
+        return details
+
+    @staticmethod
+    def invalidate_profiles():
+        with NetworkManager._profiles_lock:
+            NetworkManager._profiles = None
+
+    @staticmethod
+    def _load_managed():
+        try:
+            with open(NetworkManager.managed_profiles_path) as f:
+                return [uuid for uuid in json.load(f) if isinstance(uuid, str)]
+        except (OSError, ValueError, TypeError):
+            return []
+
+    @staticmethod
+    def _save_managed(uuids):
+        path = NetworkManager.managed_profiles_path
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(uuids, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"[net..._manager.py][Error] Could not save managed profile list: {e}")
+
+    @staticmethod
+    def _managed_profiles():
+        """
+        The managed list, adopting station profiles made before it existed:
+        this tool used to name them after the SSID, bind them to the station
+        interface and use either wpa-psk or no security.
+        """
+        managed = NetworkManager._load_managed()
+        legacy = [
+            profile.uuid for profile in NetworkManager.profiles().by_uuid.values()
+            if profile.type == "802-11-wireless" and profile.uuid not in managed
+            and profile.name == profile.ssid and profile.name != NetworkManager.HOTSPOT_NAME
+            and profile.interface == NetworkManager.station_interface
+            and profile.key_mgmt in ("", "wpa-psk")
+        ]
+        if legacy:
+            logger.info(f"[net..._manager.py][Status] Adopting {len(legacy)} connection profile(s) made by an earlier version")
+            managed = legacy + managed  # Older than anything on the list
+            NetworkManager._save_managed(managed)
+        return managed
+
+    @staticmethod
+    def _ensure_profile(ssid, password):
+        """
+        Make sure a profile for exactly `ssid` exists with these credentials.
+        Only profiles this tool created are changed: new credentials for a
+        network someone else set up (maybe WPA-Enterprise or SAE) go into a
+        new profile of ours. Returns (uuid, None), or (None, error message).
+        """
+        logger.info(f"[net..._manager.py][Action] Checking for existing connection to {ssid}...")
+        managed = NetworkManager._managed_profiles()
+        existing = NetworkManager.profiles().wifi(ssid)
+        ours = [p for p in existing if p.uuid in managed]
+
+        if ours or (existing and not password):
+            # Prefer one of ours, then the one named after the SSID
+            profile = sorted(ours or existing, key=lambda p: p.name != ssid)[0]
             if password:
-                # Secured network with WPA-PSK
-                logger.info(f"[net..._manager.py][Action] Creating secured connection profile for {ssid}...")
-                add_result = subprocess.run([
-                    "nmcli", "con", "add",
-                    "type", "wifi",
-                    "con-name", ssid,
-                    "ifname", "wlan0",
-                    "ssid", ssid,
+                # Credentials may have changed since last time, update in place
+                logger.info(f"[net..._manager.py][Action] Updating credentials of connection profile {profile.name}...")
+                modify_result = NetworkManager._run([
+                    "nmcli", "con", "modify", "uuid", profile.uuid,
                     "wifi-sec.key-mgmt", "wpa-psk",
                     "wifi-sec.psk", password
                 ], capture_output=True, text=True)
-            else:
-                # Open network (no security) - works for truly open AND OWE-TM
-                logger.info(f"[net..._manager.py][Action] Creating open connection profile for {ssid}...")
-                add_result = subprocess.run([
-                    "nmcli", "con", "add",
-                    "type", "wifi",
-                    "con-name", ssid,
-                    "ifname", "wlan0",
-                    "ssid", ssid
+                NetworkManager.invalidate_profiles()  # key-mgmt may have changed
+                if modify_result.returncode != 0:
+                    logger.error(f"[net..._manager.py][Error] Failed to update connection: {modify_result.stderr}")
+                    return None, f"Failed to update connection profile: {modify_result.stderr}"
+            elif profile in ours and profile.key_mgmt:
+                # No password = an open network: drop the security of an earlier attempt
+                logger.info(f"[net..._manager.py][Action] Clearing the password of connection profile {profile.name}...")
+                modify_result = NetworkManager._run([
+                    "nmcli", "con", "modify", "uuid", profile.uuid,
+                    "remove", "802-11-wireless-security"
                 ], capture_output=True, text=True)
-            
-            if add_result.returncode != 0:
-                logger.error(f"[net..._manager.py][Error] Failed to create connection: {add_result.stderr}")
-                return False, f"Failed to create connection profile: {add_result.stderr}"
-            
-            sleep(2)
+                NetworkManager.invalidate_profiles()
+                if modify_result.returncode != 0:
+                    logger.error(f"[net..._manager.py][Error] Failed to update connection: {modify_result.stderr}")
+                    return None, f"Failed to update connection profile: {modify_result.stderr}"
+            else:
+                logger.info(f"[net..._manager.py][Action] Connection profile exists, will activate it...")
+            if profile.uuid in managed:
+                managed.remove(profile.uuid)
+                managed.append(profile.uuid)  # Most recently used last
+                NetworkManager._save_managed(managed)
+            return profile.uuid, None
+
+        if existing:
+            logger.info(f"[net..._manager.py][Status] Leaving the existing profile(s) for {ssid} untouched")
+
+        # Create new connection profile
+        # Check if this is an open network (no password) or secured network
+        cmd = ["nmcli", "con", "add", "type", "wifi", "con-name", ssid,
+               "ifname", NetworkManager.station_interface, "ssid", ssid]
+        if password:
+            # Secured network with WPA-PSK
+            logger.info(f"[net..._manager.py][Action] Creating secured connection profile for {ssid}...")
+            cmd += ["wifi-sec.key-mgmt", "wpa-psk", "wifi-sec.psk", password]
         else:
-            logger.info(f"[net..._manager.py][Action] Connection profile exists, will activate it...")
-        
-        # Now activate the connection
-        logger.info(f"[net..._manager.py][Action] Activating connection to {ssid}...")
-        result = subprocess.run(
-            ["nmcli", "con", "up", ssid],
-            capture_output=True,
-            text=True
-        )
-        
-        # Wait for connection to stabilize
-        sleep(10)
-        
-        # Check if connection succeeded
-        if not NetworkManager.is_connected_to_wifi():
-            logger.error(f"[net..._manager.py][Result] Failed to connect to {ssid}")
-            logger.error(f"[net..._manager.py][Result] nmcli stdout: {result.stdout}")
-            logger.error(f"[net..._manager.py][Result] nmcli stderr: {result.stderr}")
-            return False, f"Failed to connect to {ssid}: {result.stderr}"
+            # Open network (no security) - works for truly open AND OWE-TM
+            logger.info(f"[net..._manager.py][Action] Creating open connection profile for {ssid}...")
+        add_result = NetworkManager._run(cmd, capture_output=True, text=True)
 
-        # Success
-        logger.info(f"[net..._manager.py][Result] Successfully connected to {ssid}")
-        return True, f"Connected successfully to {ssid}"
-    
+        if add_result.returncode != 0:
+            logger.error(f"[net..._manager.py][Error] Failed to create connection: {add_result.stderr}")
+            return None, f"Failed to create connection profile: {add_result.stderr}"
+
+        # "Connection 'Home' (0c3f...) successfully added."
+        uuid = add_result.stdout.rsplit("(", 1)[-1].split(")", 1)[0].strip()
+        if uuid and " " not in uuid:
+            # Known exactly what changed, no need to list everything again
+            with NetworkManager._profiles_lock:
+                if NetworkManager._profiles is not None:
+                    NetworkManager._profiles.add(ConnectionProfile(ssid, uuid, "802-11-wireless", ssid, NetworkManager.station_interface,
+                                                                    "wpa-psk" if password else ""))
+        else:
+            profiles = NetworkManager.profiles(max_age=0).wifi(ssid)
+            uuid = profiles[-1].uuid if profiles else None
+        if uuid is None:
+            return None, "Failed to create connection profile: it did not show up in NetworkManager"
+        NetworkManager._save_managed(managed + [uuid])
+        return uuid, None
+
+    @staticmethod
+    def prune_profiles(keep=None, max_profiles=None):
+        """
+        Delete profiles this tool created that are no longer needed: other
+        profiles for the same SSID as `keep`, and the least recently used ones
+        beyond `max_profiles`. Profiles created by anyone else are never touched.
+        """
+        if max_profiles is None:
+            max_profiles = MAX_MANAGED_PROFILES
+
+        tracked = NetworkManager._managed_profiles()
+        if not tracked:
+            return []  # Nothing of ours to clean up
+        index = NetworkManager.profiles()
+        managed = [uuid for uuid in tracked if uuid in index.by_uuid]
+
+        stale = []
+        if keep in index.by_uuid:
+            ssid = index.by_uuid[keep].ssid
+            stale = [p.uuid for p in index.wifi(ssid) if p.uuid != keep and p.uuid in managed]
+        remaining = [uuid for uuid in managed if uuid not in stale]
+        while len(remaining) > max_profiles:
+            oldest = next((uuid for uuid in remaining if uuid != keep), None)
+            if oldest is None:
+                break
+            remaining.remove(oldest)
+            stale.append(oldest)
+
+        if stale:
+            cmd = ["nmcli", "con", "delete"]
+            for uuid in stale:
+                cmd += ["uuid", uuid]
+            result = NetworkManager._run(cmd, capture_output=True, text=True)
+            NetworkManager.invalidate_profiles()
+            if result.returncode != 0:
+                logger.warning(f"[net..._manager.py][Error] Pruning profiles failed: {result.stderr.strip()}")
+                remaining = [uuid for uuid in managed if uuid in remaining or uuid in stale]  # Still ours
+            else:
+                logger.info(f"[net..._manager.py][Action] Pruned {len(stale)} stale connection profile(s)")
+
+        if remaining != tracked:
+            NetworkManager._save_managed(remaining)
+        return stale
+
+    @staticmethod
+    def snapshot(max_age=None):
+        """
+        Return a NetworkState for the station (and AP) interface, cached for
+        `snapshot_ttl` seconds (or `max_age` if given, 0 forces a fresh read).
+        One nmcli call covers device state, active connection and IPv4 address,
+        of all devices in concurrent mode.
+        """
+        if max_age is None:
+            max_age = NetworkManager.snapshot_ttl
+
+        with NetworkManager._snapshot_lock:
+            cached = NetworkManager._snapshot
+            if cached is not None and monotonic() - cached.timestamp <= max_age:
+                return cached
+
+            if NetworkManager.concurrent():
+                cmd = ["nmcli", "-t", "-f", "GENERAL.DEVICE,GENERAL.STATE,GENERAL.CONNECTION,IP4.ADDRESS", "dev", "show"]
+            else:
+                cmd = ["nmcli", "-t", "-f", "GENERAL.STATE,GENERAL.CONNECTION,IP4.ADDRESS",
+                       "dev", "show", NetworkManager.station_interface]
+            result = NetworkManager._run(cmd, capture_output=True, text=True)
+            state = NetworkManager._parse_snapshot(result.stdout)
+            NetworkManager._snapshot = state
+            return state
+
+    @staticmethod
+    def _parse_devices(output):
+        """
+        {device: [state, connection, ip]} from `nmcli -t dev show` output.
+        Without GENERAL.DEVICE lines everything belongs to the station interface.
+        """
+        devices = {}
+        device = devices[NetworkManager.station_interface] = ["", "", ""]
+
+        for line in output.splitlines():
+            key, _, value = line.partition(':')
+            if key == "GENERAL.DEVICE":
+                device = devices.setdefault(value, ["", "", ""])
+            elif key == "GENERAL.STATE":
+                device[0] = value  # e.g. "100 (connected)"
+            elif key == "GENERAL.CONNECTION":
+                device[1] = "" if value == "--" else value
+            elif key.startswith("IP4.ADDRESS") and not device[2]:
+                device[2] = value.split('/')[0]
+        return devices
+
+    @staticmethod
+    def _parse_snapshot(output):
+        devices = NetworkManager._parse_devices(output)
+        device_state, connection, ip = devices[NetworkManager.station_interface]
+        ap_state, ap_connection, ap_ip = devices.get(NetworkManager.ap_interface, ("", "", ""))
+        ap_active = ap_connection == NetworkManager.HOTSPOT_NAME
+
+        state_code = device_state.split(' ', 1)[0]
+        if connection == NetworkManager.HOTSPOT_NAME:
+            mode = "ap"
+        elif state_code == "100":
+            mode = "connected"
+        elif ap_active:
+            # Concurrent mode, station idle: report the hotspot
+            mode = "ap"
+            device_state, connection, ip = ap_state, ap_connection, ap_ip
+        else:
+            mode = "disconnected"
+
+        return NetworkState(mode, connection or None, ip, device_state, monotonic(),
+                            ap_active, ap_ip if ap_active else "")
+
+    @staticmethod
+    def invalidate_snapshot():
+        with NetworkManager._snapshot_lock:
+            NetworkManager._snapshot = None
 
     @staticmethod
     def get_current_ip():
-        # Get IP address specifically from wlan0 (WiFi interface)
-        # Using raw string to avoid escape sequence warning
-        cmd = r"ip -4 addr show wlan0 | grep -oP '(?<=inet\s)\d+(\.\d+){3}'"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        ip = result.stdout.strip()
+        if NetworkManager.use_netif:
+            # Read straight from the kernel, no processes spawned
+            return netif.get_ipv4(NetworkManager.station_interface) or netif.first_ipv4()
+
+        # Subprocess fallback
+        ip = NetworkManager.snapshot().ip
         
-        # If wlan0 has no IP, fall back to first available IP
+        # If the station has no IP, fall back to first available IP
         if not ip:
             cmd = "hostname -I | awk '{print $1}'"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+            result = NetworkManager._run(cmd, shell=True, capture_output=True, text=True)
             ip = result.stdout.strip()
         
         return ip
     
     @staticmethod
     def is_connected_to_wifi():
-        cmd = "nmcli -t -f TYPE,STATE dev | grep '^wifi:connected$'"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        return result.returncode == 0 and not NetworkManager.is_in_ap_mode()
+        return NetworkManager.snapshot().mode == "connected"
 
     @staticmethod
     def is_in_ap_mode():
-        cmd = "nmcli -t -f NAME con show --active | grep '^hotspot$'"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        return result.returncode == 0
+        return NetworkManager.snapshot().mode == "ap"
+
+    @staticmethod
+    def is_ap_active():
+        """Hotspot up, whether or not the station is connected as well"""
+        return NetworkManager.snapshot().ap_active
+
+    @staticmethod
+    def current_mode(max_age=None):
+        """Return "ap", "connected" or "disconnected" """
+        return NetworkManager.snapshot(max_age).mode
@@ -0,0 +1,179 @@
+import threading
+from collections import deque
+from time import monotonic
+from wifi_config.network_manager import NetworkManager
+from logger import logger
+
+
+class ScanCache:
+    """
+    Keeps the latest WiFi scan around so it can be handed out instantly.
+
+    Only one rescan runs at a time (single-flight): callers asking for a
+    refresh while one is in progress just piggyback on it. Listeners
+    registered with add_listener(cb) are called as cb(networks, error)
+    every time a rescan lands.
+    """
+
+    def __init__(self, scan=None, refresh_interval=30):
+        self.scan = scan or NetworkManager.scan_wifi
+        self.refresh_interval = refresh_interval
+
+        self.networks = None
+        self.timestamp = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._background = None
+        self._background_stop = threading.Event()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def get(self):
+        """Return (networks, age_sec). Both are None if nothing was scanned yet"""
+        with self._lock:
+            if self.timestamp is None:
+                return None, None
+            return self.networks, monotonic() - self.timestamp
+
+    def is_scanning(self):
+        with self._lock:
+            return self._inflight is not None
+
+    def refresh(self, max_age=0, wait=False):
+        """
+        Start a rescan unless one is already running or the cached results are
+        younger than max_age. Returns True if a rescan is (now) in flight.
+        """
+        with self._lock:
+            inflight = self._inflight
+            if inflight is None:
+                if self.timestamp is not None and monotonic() - self.timestamp < max_age:
+                    return False
+                inflight = self._inflight = threading.Event()
+                threading.Thread(target=self._scan, args=(inflight,), daemon=True).start()
+
+        if wait:
+            inflight.wait()
+        return True
+
+    def _scan(self, done):
+        networks, error = None, None
+        try:
+            networks = self.scan()
+        except Exception as e:
+            error = str(e)
+            logger.error(f"[scan_cache.py][Error] Scan failed: {e}")
+
+        with self._lock:
+            if networks is not None:
+                self.networks = networks
+                self.timestamp = monotonic()
+            self._inflight = None
+        done.set()
+
+        for callback in self._listeners:
+            try:
+                callback(networks, error)
+            except Exception as e:
+                logger.error(f"[scan_cache.py][Error] Scan listener failed: {e}")
+
+    # ------------------------------------------- #
+    # ********** Background refreshing ********** #
+    # ------------------------------------------- #
+
+    def start_background(self):
+        """Keep results warm (used while in AP mode). No-op if refresh_interval is 0"""
+        if not self.refresh_interval or (self._background and self._background.is_alive()):
+            return
+        self._background_stop.clear()
+        self._background = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._background.start()
+        logger.info(f"[scan_cache.py][Status] Background scan refresh every {self.refresh_interval} sec")
+
+    def stop_background(self):
+        if self._background and self._background.is_alive():
+            self._background_stop.set()
+            logger.info("[scan_cache.py][Status] Background scan refresh stopped")
+
+    def _refresh_loop(self):
+        while not self._background_stop.is_set():
+            self.refresh(max_age=self.refresh_interval / 2, wait=True)
+            self._background_stop.wait(self.refresh_interval)
+
+
+class ScanVersions:
+    """
+    Versioned view of the scan results for incremental pushes to browsers.
+
+    update(networks) diffs a fresh scan against the last version clients were
+    sent and returns a delta {base, seq, added, removed, changed}. Signal
+    changes smaller than `signal_step` are not worth the airtime and are left
+    out. since(seq) folds the recent deltas into one catch-up delta, or
+    returns None when seq is too old and the client needs a full snapshot.
+    """
+
+    def __init__(self, history=20, signal_step=5):
+        self.signal_step = signal_step
+        self.seq = 0
+        self.networks = {}  # ssid -> entry as last sent to clients
+        self._history = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def _changed(self, old, new):
+        return (old["security"] != new["security"]
+                or old.get("bands") != new.get("bands")
+                or abs(old["signal"] - new["signal"]) >= self.signal_step)
+
+    def update(self, networks):
+        fresh = {network["ssid"]: network for network in networks}
+        with self._lock:
+            added = [network for ssid, network in fresh.items() if ssid not in self.networks]
+            removed = [ssid for ssid in self.networks if ssid not in fresh]
+            changed = [network for ssid, network in fresh.items()
+                       if ssid in self.networks and self._changed(self.networks[ssid], network)]
+
+            delta = {"base": self.seq, "seq": self.seq, "added": added, "removed": removed, "changed": changed}
+            if added or removed or changed:
+                self.seq += 1
+                delta["seq"] = self.seq
+                for ssid in removed:
+                    del self.networks[ssid]
+                for network in added + changed:
+                    self.networks[network["ssid"]] = network
+                self._history.append(delta)
+            return delta
+
+    def snapshot(self):
+        with self._lock:
+            return self.seq, list(self.networks.values())
+
+    def since(self, seq):
+        with self._lock:
+            if seq == self.seq:
+                return {"base": seq, "seq": seq, "added": [], "removed": [], "changed": []}
+            deltas = [delta for delta in self._history if delta["seq"] > seq]
+            if not deltas or deltas[0]["base"] != seq:
+                return None  # Too far behind (or from the future): resync
+
+            existed = {}  # ssid -> did the client have it at `seq`
+            final = {}  # ssid -> latest entry, None if removed
+            for delta in deltas:
+                for network in delta["added"]:
+                    existed.setdefault(network["ssid"], False)
+                    final[network["ssid"]] = network
+                for network in delta["changed"]:
+                    existed.setdefault(network["ssid"], True)
+                    final[network["ssid"]] = network
+                for ssid in delta["removed"]:
+                    existed.setdefault(ssid, True)
+                    final[ssid] = None
+
+            return {
+                "base": seq,
+                "seq": self.seq,
+                "added": [network for ssid, network in final.items() if network and not existed[ssid]],
+                "removed": [ssid for ssid, network in final.items() if network is None and existed[ssid]],
+                "changed": [network for ssid, network in final.items() if network and existed[ssid]],
+            }
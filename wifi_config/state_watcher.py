@@ -0,0 +1,176 @@
+import shutil
+import subprocess
+import threading
+import time
+from wifi_config.network_manager import NetworkManager
+from wifi_config import metrics
+from logger import logger
+
+
+# ------------------------------------------- #
+# ************* Event Backends ************** #
+# ------------------------------------------- #
+# A backend only has to yield "something changed" lines from events() and
+# stop yielding once close() is called. What the line says doesn't matter,
+# the watcher re-probes the real state after every burst of events.
+
+class NmcliMonitorBackend:
+    """Streams change notifications from a long-lived `nmcli monitor` process"""
+
+    def __init__(self, cmd=None):
+        self.cmd = cmd or ["nmcli", "monitor"]
+        self.process = None
+
+    def events(self):
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1
+        )
+        for line in self.process.stdout:
+            line = line.strip()
+            if line:
+                yield line
+        self.process.wait()
+
+    def close(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+
+class PollingBackend:
+    """Fallback: emits a tick every `interval` seconds, like the old main loop"""
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        self._closed = threading.Event()
+
+    def events(self):
+        while not self._closed.wait(self.interval):
+            yield "poll"
+
+    def close(self):
+        self._closed.set()
+
+
+class ScriptedBackend:
+    """Replays a fixed list of (delay_sec, line) events. Stand-in for testing without NetworkManager"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self._closed = threading.Event()
+
+    def events(self):
+        for delay, line in self.script:
+            if self._closed.wait(delay):
+                return
+            yield line
+
+    def close(self):
+        self._closed.set()
+
+
+def default_backend(fallback_interval=1):
+    if shutil.which("nmcli"):
+        return NmcliMonitorBackend()
+    return PollingBackend(fallback_interval)
+
+
+# ------------------------------------------- #
+# ************** State Watcher ************** #
+# ------------------------------------------- #
+
+class StateWatcher:
+    """
+    Calls on_change(mode, previous_mode) whenever the network mode
+    ("ap", "connected" or "disconnected") changes. previous_mode is None
+    for the very first observation.
+
+    A reader thread drains the backend and marks the state dirty, an
+    evaluator thread waits for that, lets the burst settle and probes once.
+    If the backend dies (e.g. nmcli monitor exits) it falls back to polling.
+    """
+
+    def __init__(self, on_change, probe=None, backend=None,
+                 fallback_interval=1, settle_time=0.2, resync_interval=60):
+        self.on_change = on_change
+        # Events mean the cached snapshot is stale, always probe fresh
+        self.probe = probe or (lambda: NetworkManager.current_mode(max_age=0))
+        self.backend = backend or default_backend(fallback_interval)
+        self.fallback_interval = fallback_interval
+        self.settle_time = settle_time
+        self.resync_interval = resync_interval
+
+        self.mode = None
+        self._running = False
+        self._dirty = threading.Event()
+        self._reader = None
+        self._evaluator = None
+
+    def start(self):
+        self._running = True
+        self._reader = threading.Thread(target=self._read_events, daemon=True)
+        self._evaluator = threading.Thread(target=self._evaluate, daemon=True)
+        self._evaluator.start()
+        self._reader.start()
+        logger.info(f"[state_watcher.py][Status] Watching network state with {type(self.backend).__name__}")
+
+    def stop(self):
+        self._running = False
+        self.backend.close()
+        self._dirty.set()
+
+    def is_alive(self):
+        return self._evaluator is not None and self._evaluator.is_alive()
+
+    def _read_events(self):
+        while self._running:
+            try:
+                for _ in self.backend.events():
+                    if not self._running:
+                        break
+                    self._dirty.set()
+            except OSError as e:
+                logger.warning(f"[state_watcher.py][Error] Event backend failed: {e}")
+
+            if not self._running:
+                break
+            if isinstance(self.backend, PollingBackend):
+                # Polling only ends on close(), nothing left to fall back to
+                break
+
+            logger.warning(f"[state_watcher.py][Status] {type(self.backend).__name__} ended, falling back to polling every {self.fallback_interval} sec")
+            self.backend = PollingBackend(self.fallback_interval)
+            self._dirty.set()
+
+    def _evaluate(self):
+        self._check()
+        while self._running:
+            # Periodic resync is a safety net in case an event slips through
+            self._dirty.wait(timeout=self.resync_interval)
+            if not self._running:
+                break
+            # Let a burst of events (connecting -> config -> ip-config -> ...) settle
+            if self.settle_time:
+                time.sleep(self.settle_time)
+            self._dirty.clear()
+            self._check()
+
+    def _check(self):
+        try:
+            with metrics.MONITOR_TICK_SECONDS.time():
+                mode = self.probe()
+        except Exception as e:
+            logger.error(f"[state_watcher.py][Error] State probe failed: {e}")
+            return
+
+        if mode == self.mode:
+            return
+
+        previous, self.mode = self.mode, mode
+        try:
+            self.on_change(mode, previous)
+        except Exception as e:
+            logger.error(f"[state_watcher.py][Error] State change handler failed: {e}")
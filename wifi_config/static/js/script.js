@@ -11,6 +11,11 @@ const networkList = document.getElementById('network-list');
 
 // Store selected network's security type
 let selectedSecurity = '';
+// Last SSID this page asked to connect to, its outcome comes as connection_result
+let requestedSsid = null;
+// Still waiting for that outcome: without a second interface the hotspot goes
+// down during the attempt and the result can be lost with the old session
+let resultPending = false;
 
 togglePasswordBtn.addEventListener('click', () => {
     if (passwordInput.type === 'password') {
@@ -38,6 +43,8 @@ function connectToWifi() {
     if (ssid) {
         // Password is optional (for open networks)
         socket.emit('connect_wifi', { ssid, password });
+        requestedSsid = ssid;
+        resultPending = true;
         statusDiv.textContent = 'Connecting...';
     } else {
         alert('Please enter a network name.');
@@ -53,58 +60,175 @@ passwordInput.addEventListener('keyup', (event) => {
     }
 });
 
-socket.on('connection_result', (data) => {
-    if (data.success) {
+// Stage-by-stage updates while the Pi is connecting
+const connectionStages = {
+    hotspot_down: 'Leaving setup hotspot...',
+    profile_ready: 'Network profile ready...',
+    associating: 'Associating with network...',
+    got_ip: 'Got IP address...'
+};
+
+// Connects are queued on the Pi, one at a time
+socket.on('connection_queued', (data) => {
+    statusDiv.textContent = data.position > 1 ? `Queued (position ${data.position})...` : 'Connecting...';
+});
+
+socket.on('connection_progress', (data) => {
+    statusDiv.textContent = connectionStages[data.stage] || 'Connecting...';
+});
+
+socket.on('connection_result', showResult);
+
+function showResult(data) {
+    resultPending = false;
+    if (data.cancelled) {
+        statusDiv.textContent = data.error;
+    } else if (data.success) {
         statusDiv.textContent = `Connected successfully. IP: ${data.ip}`;
+        if (data.ap_closing_in) {
+            statusDiv.textContent += ` The setup hotspot closes in ${data.ap_closing_in} seconds.`;
+        }
     } else {
         statusDiv.textContent = `Connection failed: ${data.error}`;
         alert('Connection failed. Please try again.');
     }
+}
+
+// Pushed on every connectivity change (and once on connect); shown when
+// someone else's request caused it
+const stateMessages = {
+    connecting: (data) => `Connecting to ${data.ssid}...`,
+    connected: (data) => `Connected to ${data.ssid || 'Wi-Fi'}. IP: ${data.ip || 'unknown'}`,
+    failed: (data) => `Connection failed: ${data.error}`
+};
+let stateVersion = -1;
+
+socket.on('state_changed', (data) => {
+    if (data.version <= stateVersion) {
+        return;  // A newer state already arrived
+    }
+    stateVersion = data.version;
+    connectBtn.disabled = data.state === 'connecting';
+    const message = stateMessages[data.state];
+    if (data.ssid === requestedSsid) {
+        // Our own request: connection_result tells the outcome, unless it got lost
+        if (resultPending && data.state === 'failed') {
+            showResult({ success: false, error: data.error });
+        } else if (resultPending && data.state === 'connected') {
+            showResult({ success: true, ip: data.ip });
+        }
+    } else if (message) {
+        statusDiv.textContent = message(data);
+    }
 });
 
+// Scan results are versioned on the server: we keep our copy (scanSeq +
+// networkItems) and apply the deltas it sends, instead of rebuilding the list
+let scanSeq = 0;
+const networkItems = new Map();  // ssid -> <li>
+
 // Scan button click handler
 scanBtn.addEventListener('click', () => {
     scanBtn.textContent = 'Scanning...';
     scanBtn.disabled = true;
     statusDiv.textContent = '';
-    socket.emit('scan_wifi');
+    socket.emit('scan_wifi', { seq: scanSeq });
 });
 
-// Handle scan results from server
-socket.on('scan_results', (data) => {
-    scanBtn.textContent = 'Scan Networks';
-    scanBtn.disabled = false;
-    
-    if (data.success) {
-        networkList.innerHTML = '';
-        
-        if (data.networks.length === 0) {
-            statusDiv.textContent = 'No networks found';
+function updateScanButton(data) {
+    // Cached results come first, a fresh scan may still be on its way
+    if (data.refreshing) {
+        scanBtn.textContent = 'Refreshing...';
+    } else {
+        scanBtn.textContent = 'Scan Networks';
+        scanBtn.disabled = false;
+    }
+}
+
+function upsertNetwork(network) {
+    let li = networkItems.get(network.ssid);
+    if (!li) {
+        li = document.createElement('li');
+        li.innerHTML = '<span class="ssid"></span><span class="security"></span>';
+        li.querySelector('.ssid').textContent = network.ssid;
+        li.addEventListener('click', () => {
+            networkNameInput.value = network.ssid;
+            selectedSecurity = li.dataset.security;
             scanResults.classList.add('hidden');
-            return;
-        }
-        
-        data.networks.forEach(network => {
-            const li = document.createElement('li');
-            li.innerHTML = `<span class="ssid">${network.ssid}</span><span class="security">${network.security}</span>`;
-            li.dataset.ssid = network.ssid;
-            li.dataset.security = network.security;
-            li.addEventListener('click', () => {
-                networkNameInput.value = network.ssid;
-                selectedSecurity = network.security;
-                scanResults.classList.add('hidden');
-                passwordInput.focus();
-            });
-            networkList.appendChild(li);
+            passwordInput.focus();
         });
-        
-        scanResults.classList.remove('hidden');
-    } else {
+        networkItems.set(network.ssid, li);
+    }
+    // Strongest first; signal is the best of all access points using this name
+    li.dataset.ssid = network.ssid;
+    li.dataset.security = network.security;
+    li.dataset.signal = network.signal;
+    li.querySelector('.security').textContent = `${network.security} · ${network.signal}%`;
+    li.title = `${network.bands.join(', ')} · ${network.bssids} access point(s)`;
+}
+
+function removeNetwork(ssid) {
+    const li = networkItems.get(ssid);
+    if (li) {
+        li.remove();
+        networkItems.delete(ssid);
+    }
+}
+
+function renderNetworkList(age) {
+    // appendChild moves existing nodes, so only the order changes, no flicker
+    const items = [...networkItems.values()].sort((a, b) =>
+        b.dataset.signal - a.dataset.signal || a.dataset.ssid.localeCompare(b.dataset.ssid));
+    items.forEach(li => networkList.appendChild(li));
+
+    if (items.length === 0) {
+        statusDiv.textContent = 'No networks found';
+        scanResults.classList.add('hidden');
+        return;
+    }
+    statusDiv.textContent = age > 0 ? `Showing results from ${Math.round(age)}s ago` : '';
+    scanResults.classList.remove('hidden');
+}
+
+// Full snapshot: first load, or when we fell too far behind
+socket.on('scan_results', (data) => {
+    updateScanButton(data);
+
+    if (!data.success) {
         statusDiv.textContent = `Scan failed: ${data.error}`;
         scanResults.classList.add('hidden');
+        return;
+    }
+    networkItems.forEach(li => li.remove());
+    networkItems.clear();
+    data.networks.forEach(upsertNetwork);
+    scanSeq = data.seq;
+    renderNetworkList(data.age);
+});
+
+// Incremental update from version data.base to data.seq
+socket.on('scan_delta', (data) => {
+    updateScanButton(data);
+
+    if (data.base !== scanSeq) {
+        // Missed one, ask to be caught up from where we are
+        socket.emit('scan_resync', { seq: scanSeq });
+        return;
+    }
+    data.removed.forEach(removeNetwork);
+    data.added.forEach(upsertNetwork);
+    data.changed.forEach(upsertNetwork);
+    scanSeq = data.seq;
+
+    if (data.seq > data.base || data.age !== null) {
+        renderNetworkList(data.age);
     }
 });
 
 socket.on('connect', () => {
     console.log('Connected to server');
+});
+
+socket.on('disconnect', () => {
+    stateVersion = -1;  // The server may restart and count from 0 again
 });
\ No newline at end of file
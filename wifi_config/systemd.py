@@ -0,0 +1,58 @@
+"""
+sd_notify(3) without libsystemd: readiness, status and watchdog pings to
+systemd over $NOTIFY_SOCKET. Everything is a no-op when not started by
+systemd (or with Type=simple), so the app runs the same from a terminal.
+"""
+import os
+import socket
+import threading
+from logger import logger
+
+
+def notify(*states):
+    """e.g. notify("READY=1", "STATUS=Portal listening"). True if systemd got it"""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]  # Abstract namespace socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall("\n".join(states).encode())
+        return True
+    except OSError as e:
+        logger.warning(f"[systemd.py][Error] sd_notify failed: {e}")
+        return False
+
+
+def watchdog_interval():
+    """Seconds between pings systemd expects (WatchdogSec=), None if disabled"""
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6
+
+
+def start_watchdog(healthy=None):
+    """
+    Ping WATCHDOG=1 at half the interval systemd asked for, as long as
+    healthy() says so. If it stops saying so systemd restarts the service.
+    """
+    interval = watchdog_interval()
+    if not interval:
+        return None
+
+    def ping():
+        stop = threading.Event()
+        while not stop.wait(interval / 2):
+            if healthy is None or healthy():
+                notify("WATCHDOG=1")
+            else:
+                logger.error("[systemd.py][Status] Health check failed, letting the watchdog expire")
+
+    thread = threading.Thread(target=ping, daemon=True)
+    thread.start()
+    logger.info(f"[systemd.py][Status] Watchdog pings every {interval / 2:.1f} sec")
+    return thread
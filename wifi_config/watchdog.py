@@ -0,0 +1,394 @@
+"""
+Connectivity watchdog: notices when the station network stops working,
+reconnects with jittered exponential backoff and, after an outage budget,
+falls back to the hotspot until the network is back in range.
+"""
+import random
+import socket
+import struct
+import threading
+from time import monotonic, sleep
+from logger import logger
+from wifi_config import metrics
+from wifi_config.network_manager import NetworkManager, AUTH_FAILURE
+from wifi_config.connectivity import connectivity, DISCONNECTED, AP, CONNECTING, CONNECTED, FAILED
+
+RTF_GATEWAY = 0x2
+ATF_COM = 0x2  # Neighbour entry resolved
+DISCARD_PORT = 9
+
+
+# ------------------------------------------- #
+# ***************** Probes ****************** #
+# ------------------------------------------- #
+# A probe is a callable returning (reachable, detail). It runs on the
+# watchdog thread every few seconds, so it must stay cheap: no processes.
+
+class GatewayProbe:
+    """
+    The interface's default gateway answers ARP. Reads /proc/net/route and
+    /proc/net/arp; one UDP datagram to the gateway's discard port makes the
+    kernel re-validate the neighbour entry, which turns incomplete within a
+    few seconds once the gateway stops answering. Nothing leaves the LAN.
+    """
+
+    def __init__(self, interface, timeout=2):
+        self.interface = interface
+        self.timeout = timeout
+
+    def gateway(self):
+        """Default gateway of the interface (lowest metric), or None"""
+        best = None
+        try:
+            with open("/proc/net/route") as f:
+                next(f, None)
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 8 or fields[0] != self.interface:
+                        continue
+                    if fields[1] != "00000000" or fields[7] != "00000000" or not int(fields[3], 16) & RTF_GATEWAY:
+                        continue
+                    metric = int(fields[6])
+                    if best is None or metric < best[0]:
+                        best = (metric, socket.inet_ntoa(struct.pack("<L", int(fields[2], 16))))
+        except OSError:
+            return None
+        return best[1] if best else None
+
+    def resolved(self, address):
+        """True/False for a complete/incomplete neighbour entry, None if there's none"""
+        try:
+            with open("/proc/net/arp") as f:
+                next(f, None)
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 6 and fields[0] == address and fields[5] == self.interface:
+                        return bool(int(fields[2], 16) & ATF_COM) and fields[3] != "00:00:00:00:00:00"
+        except OSError:
+            pass
+        return None
+
+    def __call__(self):
+        gateway = self.gateway()
+        if gateway is None:
+            return False, f"no default route on {self.interface}"
+
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.setblocking(False)
+                sock.sendto(b"\0", (gateway, DISCARD_PORT))
+        except OSError as e:
+            return False, f"gateway {gateway}: {e}"
+
+        # A fresh entry takes a few ms to resolve, an existing one answers at once
+        deadline = monotonic() + self.timeout
+        while True:
+            resolved = self.resolved(gateway)
+            if resolved:
+                return True, f"gateway {gateway}"
+            if monotonic() >= deadline:
+                return False, f"gateway {gateway} does not answer ARP"
+            sleep(0.05)
+
+
+class TcpProbe:
+    """A TCP handshake with host:port, e.g. a local DNS server on port 53"""
+
+    def __init__(self, host, port, timeout=2):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def __call__(self):
+        try:
+            socket.create_connection((self.host, self.port), timeout=self.timeout).close()
+        except OSError as e:
+            return False, f"{self.host}:{self.port}: {e}"
+        return True, f"{self.host}:{self.port}"
+
+
+def make_probe(spec, interface, timeout=2):
+    """ "gateway" or "[tcp:]host:port" (from config.ini [watchdog] probe)"""
+    if spec == "gateway":
+        return GatewayProbe(interface, timeout)
+    host, _, port = spec.removeprefix("tcp:").rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid watchdog probe {spec!r}, expected gateway or host:port")
+    return TcpProbe(host.strip("[]"), int(port), timeout)
+
+
+# ------------------------------------------- #
+# ***************** Watchdog **************** #
+# ------------------------------------------- #
+
+class ConnectivityWatchdog:
+    """
+    Keeps a device online without anyone pressing the button.
+
+    - while connected, probe() runs every `interval` sec; `failures` misses
+      in a row, or the link dropping, start an outage
+    - during an outage it rescans and re-activates the last network (or the
+      strongest saved one in range), waiting a jittered, doubling delay
+      between backoff_min and backoff_max so a fleet doesn't retry in step
+    - after `ap_after` sec offline (0 = never) it brings the hotspot up and
+      rescans every `rescan_interval` sec, going back to the station network
+      as soon as a saved one is in range again
+    - failed returns back off like reconnects, a profile whose password was
+      rejected isn't tried again until new credentials are entered, and it
+      doesn't leave AP mode while portal_busy() says someone is on the page
+    - it stays out of the way while the portal is in use (long press,
+      connecting, failed): an outage ends there without being counted. If
+      a failed connect couldn't bring the hotspot back it retries that,
+      leaving the state (and the portal) to the user
+
+    Time to recover lands in wifi_watchdog_recovery_seconds, labelled with
+    what fixed it: the network itself (e.g. NetworkManager autoconnect),
+    a reconnect or the return from AP mode. run_job(kind, func) runs the
+    radio operations, app.py queues them behind the portal's.
+    """
+
+    def __init__(self, probe, interval=30, failures=3, backoff_min=5, backoff_max=300,
+                 ap_after=600, rescan_interval=60, run_job=None, portal_busy=None):
+        self.probe = probe
+        self.interval = interval
+        self.failures = failures
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.ap_after = ap_after
+        self.rescan_interval = rescan_interval
+        self.run_job = run_job or (lambda kind, func: func())
+        self.portal_busy = portal_busy or (lambda: False)
+
+        self.home = None  # Profile we were last online with
+        self.fallback = False  # The hotspot is up because of us
+        self.outage_start = None
+        self.misses = 0
+        self.attempts = 0
+        self.next_attempt = 0
+        self.recovered_by = "network"
+        self.rejected = set()  # uuids of profiles whose password was refused
+
+        self._refresh_home = True
+        self._running = False
+        self._wake = threading.Event()
+        self._thread = None
+        metrics.OUTAGE_SECONDS.set(0)
+        connectivity.add_listener(self._on_state)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info(f"[watchdog.py][Status] Watching connectivity with {type(self.probe).__name__} every {self.interval:g} sec")
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _on_state(self, event):
+        if event['state'] in (AP, CONNECTING):
+            self.fallback = False  # Someone else's portal; our own set(AP) marks it again
+        elif event['state'] == CONNECTED:
+            self._refresh_home = True
+        if event['state'] in (CONNECTING, CONNECTED):
+            self.rejected.clear()  # New credentials, or proof the saved ones work
+        self._wake.set()
+
+    def _delay(self):
+        if self.outage_start is None:
+            return self.interval
+        return max(1, min(self.interval, self.next_attempt - monotonic()))
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self._delay())
+            self._wake.clear()
+            if not self._running:
+                break
+            try:
+                self._check()
+            except Exception as e:
+                logger.error(f"[watchdog.py][Error] Connectivity check failed: {e}")
+
+    def _check(self):
+        state = connectivity.state
+        if state is None:
+            return  # Nothing observed yet
+        if state in (CONNECTING, FAILED) or (state == AP and not self.fallback):
+            self._end_outage(None)  # The portal is in use, what happens next is the user's call
+            if state == FAILED and not NetworkManager.concurrent() and not NetworkManager.is_ap_active():
+                self._restore_portal()  # The failed connect couldn't bring the hotspot back
+            return
+
+        if state == CONNECTED:
+            if self._refresh_home:
+                self._refresh_home = False
+                self.home = NetworkManager.snapshot().ssid or self.home
+            reachable, detail = self.probe()
+            metrics.WATCHDOG_PROBES.inc(result="ok" if reachable else "failed")
+            if reachable:
+                self.misses = 0
+                self._end_outage(self.recovered_by)
+                return
+            self.misses += 1
+            if self.misses < self.failures:
+                logger.warning(f"[watchdog.py][Status] Probe failed ({self.misses}/{self.failures}): {detail}")
+                return
+            if self.outage_start is None:
+                self._begin_outage(f"upstream unreachable, {detail}")
+        elif self.outage_start is None:
+            self._begin_outage("link down" if state == DISCONNECTED else f"state {state}")
+
+        now = monotonic()
+        metrics.OUTAGE_SECONDS.set(round(now - self.outage_start, 1))
+        if now < self.next_attempt:
+            return
+        if self.fallback:
+            self._return_from_ap()
+        elif self.ap_after and now - self.outage_start >= self.ap_after:
+            self._fall_back_to_ap()
+        else:
+            self._reconnect()
+
+    # ------------------------------------------- #
+    # ***************** Outages ***************** #
+    # ------------------------------------------- #
+
+    def _begin_outage(self, reason):
+        self.outage_start = monotonic()
+        self.attempts = 0
+        self.recovered_by = "network"
+        self._schedule()  # Give NetworkManager's own autoconnect a head start
+        logger.warning(f"[watchdog.py][Status] Outage: {reason}")
+
+    def _end_outage(self, recovered_by):
+        if self.outage_start is None:
+            return
+        elapsed = monotonic() - self.outage_start
+        if recovered_by:
+            metrics.RECOVERY_SECONDS.observe(elapsed, recovered_by=recovered_by)
+            logger.info(f"[watchdog.py][Result] Back online after {elapsed:.1f} sec ({recovered_by})")
+        else:
+            logger.info(f"[watchdog.py][Status] Portal in use, dropping the outage after {elapsed:.1f} sec")
+        self.outage_start = None
+        self.fallback = False
+        self.misses = 0
+        metrics.OUTAGE_SECONDS.set(0)
+
+    def _schedule(self):
+        """Next attempt after min(backoff_max, backoff_min * 2^n), jittered down to half of it"""
+        delay = min(self.backoff_max, self.backoff_min * 2 ** self.attempts)
+        self.attempts += 1
+        self.next_attempt = monotonic() + random.uniform(delay / 2, delay)
+
+    def _find_network(self):
+        """Saved profile to go back to if it's in range: the last one, else the strongest known"""
+        networks = self.run_job('scan', NetworkManager.scan_wifi)
+        index = NetworkManager.profiles()
+        in_range = [network['ssid'] for network in networks]
+
+        home = next((profile for profile in index.by_uuid.values() if profile.name == self.home), None)
+        if home is not None and home.ssid in in_range and home.uuid not in self.rejected:
+            return home
+        for ssid in in_range:
+            for profile in index.wifi(ssid):
+                if profile.name != NetworkManager.HOTSPOT_NAME and profile.uuid not in self.rejected:
+                    return profile
+        return None
+
+    def _note_failure(self, profile, message):
+        if AUTH_FAILURE in message:
+            self.rejected.add(profile.uuid)
+            logger.warning(f"[watchdog.py][Status] {profile.ssid} refused the saved password, "
+                           f"not trying it again until new credentials are entered")
+
+    def _activate(self, profile, from_ap):
+        if from_ap and not self.fallback:
+            return False, "the portal is in use"  # Someone connected while we were queued
+        return NetworkManager.activate_profile(profile)
+
+    # ------------------------------------------- #
+    # ***************** Actions ***************** #
+    # ------------------------------------------- #
+
+    def _reconnect(self):
+        profile = self._find_network()
+        if profile is None:
+            metrics.WATCHDOG_ACTIONS.inc(action="reconnect", result="not_in_range")
+            self._schedule()
+            logger.info(f"[watchdog.py][Status] No saved network in range, next try in {self.next_attempt - monotonic():.0f} sec")
+            return
+
+        logger.info(f"[watchdog.py][Action] Reconnecting to {profile.ssid} (attempt {self.attempts})...")
+        success, message = self.run_job('reconnect', lambda: self._activate(profile, from_ap=False))
+        metrics.WATCHDOG_ACTIONS.inc(action="reconnect", result="ok" if success else "failed")
+        self._schedule()
+        if success:
+            self.recovered_by = "reconnect"
+            self.misses = 0
+            self._wake.set()  # Probe right away rather than after the backoff
+        else:
+            logger.warning(f"[watchdog.py][Result] {message}, next try in {self.next_attempt - monotonic():.0f} sec")
+            self._note_failure(profile, message)
+
+    def _fall_back_to_ap(self):
+        logger.warning(f"[watchdog.py][Action] Offline for {monotonic() - self.outage_start:.0f} sec, bringing up the hotspot...")
+        result = self.run_job('setup_ap', NetworkManager.setup_ap)
+        metrics.WATCHDOG_ACTIONS.inc(action="ap_fallback", result="ok" if result else "failed")
+        if not result:
+            logger.error(f"[watchdog.py][Result] Hotspot could not be brought up: {result.reason}")
+            self._schedule()
+            return
+        self._enter_ap()
+
+    def _restore_portal(self):
+        """Hotspot back up for a portal the user started: no fallback, the state stays theirs"""
+        if monotonic() < self.next_attempt:
+            return
+        logger.warning("[watchdog.py][Action] No hotspot after the failed connect, bringing it back...")
+        result = self.run_job('setup_ap', NetworkManager.setup_ap)
+        metrics.WATCHDOG_ACTIONS.inc(action="portal_restore", result="ok" if result else "failed")
+        if result:
+            self.attempts = 0
+            return
+        self._schedule()
+        logger.error(f"[watchdog.py][Result] Hotspot could not be brought up: {result.reason}, "
+                     f"next try in {self.next_attempt - monotonic():.0f} sec")
+
+    def _enter_ap(self):
+        connectivity.set(AP, reason="watchdog")
+        self.fallback = True
+        # Rescan in rescan_interval at the earliest, later if a failed return is backing off
+        self.next_attempt = max(self.next_attempt, monotonic() + self.rescan_interval)
+
+    def _return_from_ap(self):
+        self.next_attempt = monotonic() + self.rescan_interval
+        if self.portal_busy():
+            metrics.WATCHDOG_ACTIONS.inc(action="ap_return", result="portal_in_use")
+            logger.info("[watchdog.py][Status] Someone is on the portal, staying in AP mode")
+            return
+        profile = self._find_network()
+        if profile is None:
+            metrics.WATCHDOG_ACTIONS.inc(action="ap_return", result="not_in_range")
+            return
+
+        logger.info(f"[watchdog.py][Action] {profile.ssid} is back in range, leaving AP mode...")
+        success, message = self.run_job('reconnect', lambda: self._activate(profile, from_ap=True))
+        metrics.WATCHDOG_ACTIONS.inc(action="ap_return", result="ok" if success else "failed")
+        if success:
+            self.recovered_by = "ap_return"
+            if NetworkManager.concurrent():
+                self.run_job('stop_ap', NetworkManager.stop_ap)
+            return
+
+        self._note_failure(profile, message)
+        self._schedule()
+        self.next_attempt = max(self.next_attempt, monotonic() + self.rescan_interval)
+        logger.warning(f"[watchdog.py][Result] {message}, next try in {self.next_attempt - monotonic():.0f} sec")
+        if self.fallback and not NetworkManager.concurrent():
+            # The hotspot went down for the attempt, keep the portal reachable
+            self.fallback = False
+            self._fall_back_to_ap()
@@ -1,45 +1,45 @@
-from flask import Flask, render_template, request
-from flask_socketio import SocketIO
+from flask import Flask, Response, jsonify, render_template, request
+from flask_socketio import SocketIO, emit, join_room
+from werkzeug.serving import make_server
 from wifi_config.network_manager import NetworkManager
+from wifi_config.scan_cache import ScanCache, ScanVersions
+from wifi_config.assets import AssetPipeline
+from wifi_config.dns_server import CaptiveDNS
+from wifi_config.jobs import JobQueue, JobRejected, CANCELLED
+from wifi_config.connectivity import connectivity, CONNECTING, CONNECTED, FAILED
+from wifi_config.link_quality import sampler
+from wifi_config import metrics
 from logger import logger
-from time import sleep
-from led import LED
-import configparser
+from config import config
+import math
 import os
 import sys
+import threading
 
 
-
-status_led: LED = None  # Type hint
-
 # ------------------------------------------- #
 # ************* Load Configuration ********** #
 # ------------------------------------------- #
 
-# Load PORT and AP_SSID from config.ini
-config = configparser.ConfigParser()
-config_path = os.path.join(os.path.dirname(__file__), '..', 'config.ini')
-
-if os.path.exists(config_path):
-    config.read(config_path)
-    PORT = config.getint('server', 'port', fallback=4000)
-    AP_SSID = config.get('access_point', 'ap_ssid', fallback='SERIAL_MONITOR_PI4')
-    logger.info(f"[web_server.py][Config] Loaded from config.ini: PORT={PORT}, AP_SSID={AP_SSID}")
-else:
-    PORT = 4000
-    AP_SSID = 'SERIAL_MONITOR_PI4'
-    logger.warning("[web_server.py][Config] config.ini not found, using defaults")
+PORT = config.port
+AP_SSID = config.ap_ssid
+SCAN_REFRESH_INTERVAL = config.scan_refresh_interval
+SCAN_MIN_AGE = config.scan_min_age
+MAX_PENDING_JOBS = config.max_pending_jobs
+JOB_MIN_INTERVAL = config.job_min_interval
+DNS_ENABLED = config.dns_enabled
+DNS_PORT = config.dns_port
+AP_LINGER = config.ap_linger
 
 
 # ------------------------------------------- #
 # ************* Global Variables ************ #
 # ------------------------------------------- #
 
-server_running = False
+server = None  # werkzeug server, only while the portal is served
 server_thread = None
-is_ap_mode = False
-last_connection_success = False
-is_connecting = False  # Flag to indicate connection attempt in progress
+_server_lock = threading.Lock()
+_stop_timer = None
 
 
 # ------------------------------------------- #
@@ -48,6 +48,16 @@ is_connecting = False  # Flag to indicate connection attempt in progress
 
 app = Flask(__name__)
 socketio = SocketIO(app)
+assets = AssetPipeline(os.path.join(app.root_path, 'static')).build()
+app.jinja_env.globals['asset_url'] = assets.url
+captive_dns = CaptiveDNS(NetworkManager.ap_ip, port=DNS_PORT)
+# Everything touching the radio goes through this one queue, scans included
+network_jobs = JobQueue(max_pending=MAX_PENDING_JOBS, min_interval=JOB_MIN_INTERVAL)
+scan_cache = ScanCache(scan=lambda: network_jobs.call('scan', NetworkManager.scan_wifi),
+                       refresh_interval=SCAN_REFRESH_INTERVAL)
+scan_versions = ScanVersions()
+SCAN_ROOM = 'scan_subscribers'  # Sessions that asked for scans get the deltas
+portal_clients = set()  # Socket.IO sessions with the page open
 
 
 # ------------------------------------------- #
@@ -55,117 +65,347 @@ socketio = SocketIO(app)
 # ------------------------------------------- #
 
 @socketio.on('connect')
+@metrics.timed(metrics.HANDLER_SECONDS, event='connect')
 def test_connect():
+    portal_clients.add(request.sid)
     logger.info("[web_server.py][Status] Client connected")
+    emit('state_changed', connectivity.snapshot())  # Later changes are pushed as they happen
 
 @socketio.on('disconnect')
+@metrics.timed(metrics.HANDLER_SECONDS, event='disconnect')
 def test_disconnect():
+    portal_clients.discard(request.sid)
     logger.info("[web_server.py][Status] Client disconnected")
 
 
+def has_clients():
+    return bool(portal_clients)
+
+
 # ------------------------------------------- #
 # **************** Router Func ************** #
 # ------------------------------------------- #
 
 @app.route('/')
 def index():
-    global is_ap_mode, last_connection_success
-    if is_ap_mode and not last_connection_success:
+    if connectivity.in_portal():
         return render_template('index.html', project_name=AP_SSID)
     else:
         return render_template('general.html', project_name=AP_SSID)
 
 
+# ------------------------------------------- #
+# ******** Connectivity Probe Routers ******* #
+# ------------------------------------------- #
+# Phones probe these right after joining a network. In AP mode they get a
+# redirect to the portal (so the "sign in" sheet pops up), otherwise the
+# answer each OS expects for "internet works". No templates involved.
+
+NO_STORE = {'Cache-Control': 'no-store'}
+
+PROBE_SUCCESS = {
+    'generate_204': (b'', 204, NO_STORE),  # Android / ChromeOS
+    'gen_204': (b'', 204, NO_STORE),
+    'hotspot-detect.html': (b'<HTML><HEAD><TITLE>Success</TITLE></HEAD><BODY>Success</BODY></HTML>', 200,
+                            dict(NO_STORE, **{'Content-Type': 'text/html'})),  # Apple
+    'library/test/success.html': (b'<HTML><HEAD><TITLE>Success</TITLE></HEAD><BODY>Success</BODY></HTML>', 200,
+                                  dict(NO_STORE, **{'Content-Type': 'text/html'})),
+    'connecttest.txt': (b'Microsoft Connect Test', 200, dict(NO_STORE, **{'Content-Type': 'text/plain'})),  # Windows
+    'ncsi.txt': (b'Microsoft NCSI', 200, dict(NO_STORE, **{'Content-Type': 'text/plain'})),
+    'canonical.html': (b'<meta http-equiv="refresh" content="0;url=https://support.mozilla.org/kb/captive-portal"/>',
+                       200, dict(NO_STORE, **{'Content-Type': 'text/html'})),  # Firefox
+    'success.txt': (b'success\n', 200, dict(NO_STORE, **{'Content-Type': 'text/plain'})),
+}
+
+
+def probe_handler(path):
+    success = PROBE_SUCCESS[path]
+    def handler():
+        if connectivity.in_portal():
+            return b'', 302, dict(NO_STORE, Location=f'http://{NetworkManager.ap_ip}:{PORT}/')
+        return success
+    return handler
+
+for probe_path in PROBE_SUCCESS:
+    app.add_url_rule(f'/{probe_path}', f'probe_{probe_path}', probe_handler(probe_path))
+
+
 # ------------------------------------------- #
 # ********** File Serving Routers *********** #
 # ------------------------------------------- #
 
 @app.route('/static/js/socket.io.js')
 def serve_socketio_js():
-    return app.send_static_file('js/socket.io.js')
+    return assets.serve('js/socket.io.js')
 
 @app.route('/static/images/<path:filename>')
 def serve_image(filename):
-    return app.send_static_file(f'images/{filename}')
+    return assets.serve(f'images/{filename}')
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    # Content-hashed names from asset_url(), cached by the browser for good
+    return assets.serve_hashed(filename)
+
+
+@app.route('/metrics')
+def serve_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/link_quality')
+def serve_link_quality():
+    # ?seconds=3600&points=120 - downsampled here, so the phone only gets a few KB
+    seconds = request.args.get('seconds', 3600, type=float)
+    if not math.isfinite(seconds):
+        return jsonify({'error': 'seconds must be a finite number'}), 400
+    seconds = min(max(seconds, 60), 7 * 24 * 3600)
+    points = min(max(request.args.get('points', 120, type=int), 1), 1000)
+    return jsonify(sampler.history(seconds, points))
+
+
+def push_scan_results(networks, error):
+    """ScanCache listener: push what changed since the last scan to subscribed clients"""
+    if error is not None:
+        socketio.emit('scan_results', {'success': False, 'error': error}, to=SCAN_ROOM)
+        return
+    delta = scan_versions.update(networks)
+    socketio.emit('scan_delta', dict(delta, age=0, refreshing=False), to=SCAN_ROOM)
+    logger.info(f"[web_server.py][Result] Scan v{delta['seq']}: +{len(delta['added'])} "
+                f"-{len(delta['removed'])} ~{len(delta['changed'])} networks sent to clients")
+
+scan_cache.add_listener(push_scan_results)
+
+
+def send_scan_state(seq, refreshing):
+    """Bring the requesting client from its version `seq` up to date"""
+    _, age = scan_cache.get()
+    age = round(age, 1) if age is not None else None
+    delta = scan_versions.since(seq)
+    if delta is not None:
+        emit('scan_delta', dict(delta, age=age, refreshing=refreshing))
+        return
+    seq, networks = scan_versions.snapshot()
+    emit('scan_results', {'success': True, 'seq': seq, 'networks': networks, 'age': age, 'refreshing': refreshing})
+    logger.info(f"[web_server.py][Result] Sent full scan v{seq} ({len(networks)} networks) to client")
+
+
+def client_seq(data):
+    """The scan version a client says it has, 0 (send everything) if missing or garbled"""
+    try:
+        return int(data.get('seq', 0)) if isinstance(data, dict) else 0
+    except (TypeError, ValueError, OverflowError):
+        return 0
 
 
 @socketio.on('scan_wifi')
-def handle_scan_wifi():
+@metrics.timed(metrics.HANDLER_SECONDS, event='scan_wifi')
+def handle_scan_wifi(data=None):
     logger.info("[web_server.py][Action] WiFi scan requested")
-    try:
-        networks = NetworkManager.scan_wifi()
-        socketio.emit('scan_results', {'success': True, 'networks': networks})
-        logger.info(f"[web_server.py][Result] Sent {len(networks)} networks to client")
-    except Exception as e:
-        logger.error(f"[web_server.py][Error] Scan failed: {e}")
-        socketio.emit('scan_results', {'success': False, 'error': str(e)})
+    join_room(SCAN_ROOM)
+    # Kick off (or join) a rescan; its delta is pushed by push_scan_results
+    refreshing = scan_cache.refresh(max_age=SCAN_MIN_AGE)
+
+    # Answer right away with whatever we already have
+    send_scan_state(client_seq(data), refreshing)
+
+
+@socketio.on('scan_resync')
+@metrics.timed(metrics.HANDLER_SECONDS, event='scan_resync')
+def handle_scan_resync(data=None):
+    """A client missed a delta (its base didn't match), catch it up"""
+    join_room(SCAN_ROOM)
+    send_scan_state(client_seq(data), scan_cache.is_scanning())
+
+
+def broadcast_job_status(job):
+    """JobQueue listener: everyone sees the queue move, results go to the owner only"""
+    if job.kind == 'scan':
+        return  # Scans reach clients as scan deltas, no need to announce each one
+    socketio.emit('job_status', dict(job.to_dict(), position=network_jobs.position(job)))
+    if job.state == CANCELLED and job.kind == 'connect' and job.owner:
+        socketio.emit('connection_result', {'success': False, 'cancelled': True, 'job_id': job.id,
+                                            'error': 'Replaced by a newer request'}, to=job.owner)
+
+network_jobs.add_listener(broadcast_job_status)
 
 
 @socketio.on('connect_wifi')
+@metrics.timed(metrics.HANDLER_SECONDS, event='connect_wifi')
 def handle_connect_wifi(data):
-    global is_ap_mode, last_connection_success
     ssid = data['ssid']
     password = data.get('password', '')  # Default to empty string for open networks
-    
-    # Set LED to breathing while attempting connection
-    status_led.set_state(LED.SLOW_BREATH)
-    
+    sid = request.sid
+
+    # Queue it and return right away; a newer request from anyone replaces a pending one
+    try:
+        job = network_jobs.submit('connect', lambda: run_connect(ssid, password, sid), owner=sid, replace=True)
+    except JobRejected as e:
+        logger.warning(f"[web_server.py][Status] Connection request for {ssid} rejected: {e}")
+        emit('connection_result', {'success': False, 'error': str(e)})
+        return {'job_id': None}
+
+    logger.debug(f"[web_server.py][Status] Queued connection to SSID: {ssid} as job {job.id}")
+    emit('connection_queued', {'job_id': job.id, 'position': network_jobs.position(job)})
+    return {'job_id': job.id}
+
+
+@socketio.on('cancel_job')
+@metrics.timed(metrics.HANDLER_SECONDS, event='cancel_job')
+def handle_cancel_job(data=None):
+    job_id = data.get('job_id') if isinstance(data, dict) else None
+    cancelled = network_jobs.cancel(job_id, owner=request.sid)
+    logger.info(f"[web_server.py][Action] Cancel of job {job_id} requested: {'done' if cancelled else 'not pending'}")
+    return {'cancelled': cancelled}
+
+
+def run_connect(ssid, password, sid):
+    """Runs on the network job worker; progress and result go to the requesting client"""
+    connectivity.set(CONNECTING, ssid=ssid)
+
     logger.debug(f"[web_server.py][Status] Attempting to connect to SSID: {ssid}")
 
-    success, message = NetworkManager.connect_to_wifi(ssid, password)
-    
-    logger.debug(f"[web_server.py][Status] Connection success: {success}")
-    logger.debug(f"[web_server.py][Status] Connection message: {message}")
-    
-    if success:
-        ip = NetworkManager.get_current_ip()
-        logger.info(f'[web_server.py][Result] The current IP is: {ip}')
-        socketio.emit('connection_result', {'success': True, 'ip': ip})
-        is_ap_mode = False
-        last_connection_success = True
-        switch_to_normal_mode()
-        status_led.set_state(LED.SOLID)
-        sleep(2)
-        status_led.set_state(LED.OFF)
+    def on_progress(stage, detail):
+        socketio.emit('connection_progress', {'stage': stage, 'detail': detail}, to=sid)
+
+    try:
+        success, message = NetworkManager.connect_to_wifi(ssid, password, on_progress=on_progress)
+
+        logger.debug(f"[web_server.py][Status] Connection success: {success}")
+        logger.debug(f"[web_server.py][Status] Connection message: {message}")
+
+        if success:
+            ip = NetworkManager.snapshot().ip
+            logger.info(f'[web_server.py][Result] The current IP is: {ip}')
+            result = {'success': True, 'ip': ip}
+            if NetworkManager.concurrent():
+                # The hotspot stayed up for the attempt, drop it once the phone has the result
+                result['ap_closing_in'] = AP_LINGER
+                threading.Timer(AP_LINGER, drop_hotspot).start()
+            socketio.emit('connection_result', result, to=sid)
+            connectivity.set(CONNECTED, ssid=ssid, ip=ip)
+            return True
+    except Exception as e:
+        # Never leave the state machine (and the LED) stuck in CONNECTING
+        logger.error(f"[web_server.py][Error] Connection attempt to {ssid} raised: {e}")
+        success, message = False, f"Connection attempt failed: {e}"
+
+    logger.error(f'[web_server.py][Result] Connection failed: {message}')
+    if not NetworkManager.concurrent():
+        # Still CONNECTING meanwhile, so the watchdog doesn't bring it up a second time
+        restore_hotspot()
+    socketio.emit('connection_result', {'success': False, 'error': message}, to=sid)
+    connectivity.set(FAILED, ssid=ssid, error=message)
+    return False
+
+
+def restore_hotspot():
+    """The hotspot went down for the attempt: bring it back so the phone can see the error and retry"""
+    try:
+        result = NetworkManager.setup_ap()
+    except Exception as e:
+        logger.error(f"[web_server.py][Error] Hotspot could not be restored: {e}")
+        return
+    if result:
+        logger.info(f"[web_server.py][Result] Hotspot back up after the failed attempt in {result.elapsed:.1f} sec")
+    else:
+        logger.error(f"[web_server.py][Error] Hotspot could not be restored: {result.reason}")
+
+def drop_hotspot():
+    try:
+        network_jobs.submit('stop_ap', NetworkManager.stop_ap)
+    except JobRejected as e:
+        logger.warning(f"[web_server.py][Error] Could not queue turning the hotspot down: {e}")
+
+
+# ------------------------------------------- #
+# ************* Server lifecycle ************ #
+# ------------------------------------------- #
+# The server runs only while it's needed (see app.py). Socket.IO is served by
+# the same werkzeug server, its middleware wraps app.wsgi_app.
+
+def start_server():
+    """Bind PORT and serve from a daemon thread. True once it's listening"""
+    global server, server_thread
+    with _server_lock:
+        _cancel_stop()
+        if server is not None:
+            return True
+        try:
+            server = make_server('0.0.0.0', PORT, app, threaded=True)
+        except (OSError, SystemExit):  # werkzeug exits when it can't bind
+            logger.error(f"[web_server.py][Error] Web server could not listen on port {PORT}")
+            return False
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+    logger.info(f"[web_server.py][Status] Web server listening on port {PORT}")
+    return True
+
+def stop_server(delay=0):
+    """
+    Shut the server down, after `delay` seconds if given (a later
+    start_server() cancels that). Clients are disconnected, the port is
+    free once this returns.
+    """
+    global server, server_thread, _stop_timer
+    with _server_lock:
+        _cancel_stop()
+        if server is None:
+            return
+        if delay:
+            _stop_timer = threading.Timer(delay, stop_server)
+            _stop_timer.daemon = True
+            _stop_timer.start()
+            logger.info(f"[web_server.py][Status] Web server stops in {delay:.0f} sec")
+            return
+        stopping, thread = server, server_thread
+        server = server_thread = None
+
+    logger.info("[web_server.py][Status] Stopping web server...")
+    # Disconnect every open page (this runs our disconnect handler too), so the
+    # client closes its polling/websocket transport instead of waiting on it
+    for sid in list(portal_clients):
+        socketio.server.disconnect(sid)
+    stopping.shutdown()  # Waits for serve_forever to return
+    stopping.server_close()
+    thread.join(timeout=1)
+    logger.info("[web_server.py][Result] Web server stopped.")
+
+def _cancel_stop():
+    global _stop_timer
+    if _stop_timer is not None:
+        _stop_timer.cancel()
+        _stop_timer = None
+
+def is_serving():
+    return server is not None
+
+def server_healthy():
+    """For the watchdog: False only if the server should be running but its thread died"""
+    thread = server_thread
+    return server is None or (thread is not None and thread.is_alive())
+
+
+# ------------------------------------------- #
+# ************ Connectivity state *********** #
+# ------------------------------------------- #
+
+def update_portal(event):
+    """Connectivity listener: captive DNS and background scans only while the portal is up"""
+    if connectivity.in_portal():
+        scan_cache.start_background()
+        if DNS_ENABLED:
+            captive_dns.ip = NetworkManager.ap_ip
+            captive_dns.start()
     else:
-        logger.error(f'[web_server.py][Result] Connection failed: {message}')
-        socketio.emit('connection_result', {'success': False, 'error': message})
-        last_connection_success = False
-        status_led.set_state(LED.FAST_BLINK)
-
-def run_server():
-    global server_running
-    server_running = True
-    socketio.run(app, host='0.0.0.0', port=PORT, debug=False, log_output=False, allow_unsafe_werkzeug=True)
-
-def stop_server():
-    global server_running
-    if server_running:
-        server_running = False
-        logger.info("[web_server.py][Status] Stopping web server...")
-        # Just exit - socketio.stop() doesn't work in thread context
-        logger.info("[web_server.py][Result] Web server stopped.")
-
-
-def reset_wifi_state():
-    global is_ap_mode, last_connection_success
-    is_ap_mode = True
-    last_connection_success = False
-    logger.info("[web_server.py][Status] WiFi state reset. Ready for new configuration.")
-
-
-def switch_to_ap_mode():
-    is_ap_mode = True
-    logger.info("[web_server.py][Status] Switched to AP mode")
-
-def switch_to_normal_mode():
-    global is_ap_mode, last_connection_success
-    is_ap_mode = False
-    last_connection_success = True
-    logger.info("[web_server.py][Status] Switched to normal mode")
-    
-def init_app(led: LED):
-    """Initialize the web server with the LED instance"""
-    global status_led
-    status_led = led
-    logger.info("[web_server.py][Status] LED instance initialized in web server")
+        scan_cache.stop_background()
+        captive_dns.stop()
+
+def push_state(event):
+    """Connectivity listener: every browser hears about the change right away"""
+    socketio.emit('state_changed', event)
+
+connectivity.add_listener(update_portal)
+connectivity.add_listener(push_state)
+update_portal(connectivity.snapshot())  # This module is loaded on demand, catch up
+